@@ -0,0 +1,261 @@
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import itertools
+import threading
+from time import monotonic
+
+
+# One step of a timeline: call function(*args, **kwargs) at seconds after the start.
+TimelineAction = namedtuple("TimelineAction", ["at", "label", "function", "args", "kwargs"])
+
+# What happened to one action. lateness is how long after its target the action
+# started, duration how long it ran; error is None when it succeeded.
+ActionResult = namedtuple("ActionResult", ["timeline", "label", "target", "started", "lateness",
+	"duration", "result", "error"])
+
+
+class Timeline():
+	"""
+	A list of actions at fixed offsets, in seconds, from the start of the timeline.
+
+	Usage:
+		timeline = Timeline("cold start")
+		timeline.chamber(0, chamber, "get_set_setpoint", 1, -40)
+		timeline.outlet(1800, switch, "off", 3)
+		timeline.outlet(1860, switch, "on", 3)
+		timeline.chamber(3600, chamber, "get_set_setpoint", 1, 25)
+	"""
+	def __init__(self, name):
+		self.name = name
+		self.actions = []
+
+	def __len__(self):
+		return len(self.actions)
+
+	def __repr__(self):
+		return "<Timeline {} ({} actions)>".format(self.name, len(self))
+
+	def add(self, at, function, *args, **kwargs):
+		"""
+		Call function(*args, **kwargs) at seconds after the start. label= names the
+		action in the results. Returns the timeline so calls can be chained.
+		"""
+		label = kwargs.pop("label", None) or getattr(function, "__name__", repr(function))
+		self.actions.append(TimelineAction(float(at), label, function, args, kwargs))
+		return self
+
+	def chamber(self, at, chamber, method, *args, **kwargs):
+		""" Call a ThermotronChamber method by name, e.g. ("get_set_setpoint", 1, 85) """
+		kwargs.setdefault("label", "{} {}{}".format(chamber, method, args))
+		return self.add(at, getattr(chamber, method), *args, **kwargs)
+
+	def outlet(self, at, switch, action, *args, **kwargs):
+		""" Call a webPowerSwitch method by name, e.g. ("off", 3) or ("allon",) """
+		kwargs.setdefault("label", "{} {}{}".format(switch.name(), action, args))
+		return self.add(at, getattr(switch, action), *args, **kwargs)
+
+
+class TimelineRun():
+	"""
+	One running timeline. Actions of a run execute one at a time in timeline order, so
+	a chamber or switch never sees two of its commands at once. Due actions wait in the
+	run's own queue and are drained by a single pool worker, so a run never holds more
+	than one worker.
+	"""
+	def __init__(self, timeline, start, stop_on_error, sequencer=None):
+		self.timeline = timeline
+		self.start = start
+		self.stop_on_error = stop_on_error
+		self.results = []
+		self.cancelled = False
+		self._sequencer = sequencer
+		self._remaining = len(timeline.actions)
+		self._ready = deque()
+		self._draining = False
+		self._lock = threading.Lock()
+		self._done = threading.Event()
+		if not self._remaining:
+			self._done.set()
+
+	def __repr__(self):
+		return "<TimelineRun {} {}/{} done>".format(self.timeline.name, len(self.results),
+			len(self.timeline.actions))
+
+	@property
+	def done(self):
+		return self._done.is_set()
+
+	def wait(self, timeout=None):
+		""" Blocks until every action ran or was cancelled. Returns the results. """
+		self._done.wait(timeout)
+		return self.results
+
+	def cancel(self):
+		"""
+		Skip every action that hasn't started yet. wait() returns as soon as the action
+		running now, if any, has finished.
+		"""
+		self.cancelled = True
+		dropped = self._sequencer._remove(self) if self._sequencer is not None else 0
+		with self._lock:
+			dropped += len(self._ready)
+			self._ready.clear()
+			self._skip(dropped)
+
+	@property
+	def errors(self):
+		return [r for r in self.results if r.error is not None]
+
+	def lateness(self):
+		""" (mean, max) lateness in seconds of the actions that ran """
+		late = [r.lateness for r in self.results if r.started is not None]
+		if not late:
+			return None, None
+		return sum(late) / len(late), max(late)
+
+	def _due(self, action):
+		"""
+		Queue an action whose deadline has passed. Returns True when the caller must
+		start a worker on _drain.
+		"""
+		with self._lock:
+			if self.cancelled:
+				self._skip(1)
+				return False
+			self._ready.append(action)
+			if self._draining:
+				return False
+			self._draining = True
+			return True
+
+	def _drain(self):
+		while True:
+			with self._lock:
+				if not self._ready:
+					self._draining = False
+					return
+				action = self._ready.popleft()
+			self._execute(action)
+
+	def _execute(self, action):
+		target = self.start + action.at
+		started = monotonic()
+		try:
+			result, error = action.function(*action.args, **action.kwargs), None
+		except Exception as e:
+			result, error = None, e
+			if self.stop_on_error:
+				self.cancel()
+		with self._lock:
+			self.results.append(ActionResult(self.timeline.name, action.label, target, started,
+				started - target, monotonic() - started, result, error))
+			self._skip(1)
+
+	def _skip(self, count):
+		self._remaining -= count
+		if self._remaining == 0:
+			self._done.set()
+
+
+class Sequencer():
+	"""
+	Runs timelines of chamber commands and outlet actions against monotonic deadlines.
+
+	Every pending action of every timeline sits in one heap ordered by deadline. A
+	single scheduler thread sleeps until the earliest deadline and queues due actions
+	on their run; each run with queued actions gets one worker from a pool of
+	max_workers threads, so many timelines run concurrently and a slow command on one
+	device doesn't delay the others. Deadlines are fixed when a timeline
+	starts, so time spent in earlier actions doesn't accumulate as drift; how late each
+	action started is recorded in its ActionResult.
+
+	Usage:
+		with Sequencer() as sequencer:
+			runs = [sequencer.start(timeline) for timeline in timelines]
+			for run in runs:
+				for result in run.wait():
+					print(result.label, result.lateness, result.error)
+	"""
+	def __init__(self, max_workers=8):
+		self._heap = []
+		self._counter = itertools.count()
+		self._condition = threading.Condition()
+		self._closed = False
+		self._pool = ThreadPoolExecutor(max_workers=max_workers)
+		self._thread = threading.Thread(target=self._schedule)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+	def start(self, timeline, delay=0.0, stop_on_error=False):
+		"""
+		Starts timeline delay seconds from now and returns its TimelineRun. With
+		stop_on_error, the rest of the timeline is skipped after an action raises.
+		"""
+		run = TimelineRun(timeline, monotonic() + delay, stop_on_error, self)
+		with self._condition:
+			if self._closed:
+				raise RuntimeError("Sequencer is closed")
+			# Sorting keeps actions with the same offset in timeline order.
+			for action in sorted(timeline.actions, key=lambda action: action.at):
+				heapq.heappush(self._heap, (run.start + action.at, next(self._counter), run, action))
+			self._condition.notify()
+		return run
+
+	@property
+	def pending(self):
+		""" Number of actions waiting for their deadline """
+		with self._condition:
+			return len(self._heap)
+
+	def _schedule(self):
+		while True:
+			with self._condition:
+				while not self._closed:
+					if self._heap:
+						wait = self._heap[0][0] - monotonic()
+						if wait <= 0:
+							break
+						self._condition.wait(wait)
+					else:
+						self._condition.wait()
+				if self._closed:
+					return
+				due = []
+				now = monotonic()
+				while self._heap and self._heap[0][0] <= now:
+					due.append(heapq.heappop(self._heap))
+			for deadline, _, run, action in due:
+				if run._due(action):
+					self._pool.submit(run._drain)
+
+	def _remove(self, run):
+		""" Drop the pending actions of run. Returns how many there were. """
+		with self._condition:
+			kept = [entry for entry in self._heap if entry[2] is not run]
+			removed = len(self._heap) - len(kept)
+			if removed:
+				heapq.heapify(kept)
+				self._heap = kept
+				self._condition.notify()
+			return removed
+
+	def close(self, wait=True):
+		"""
+		Stops scheduling. Actions that haven't reached their deadline are dropped and
+		their runs marked cancelled; with wait, running actions are allowed to finish.
+		"""
+		with self._condition:
+			self._closed = True
+			runs = set(entry[2] for entry in self._heap)
+			self._condition.notify()
+		for run in runs:
+			run.cancel()
+		self._thread.join()
+		self._pool.shutdown(wait=wait)
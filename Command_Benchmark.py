@@ -0,0 +1,165 @@
+"""
+Throughput and latency benchmark for ThermotronChamber and webPowerSwitch.
+
+Both clients are driven against the local emulators. For each command type the
+benchmark reports commands per second, p50/p95/p99 latency and the cost of setting
+up a new connection, and writes everything to a JSON file so runs can be compared:
+
+    python Command_Benchmark.py --iterations 2000 --output bench.json
+"""
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import math
+import platform
+import sys
+from time import perf_counter, strftime
+
+from Thermotron_Control import ThermotronChamber
+from Thermotron_Emulator import ThermotronEmulator
+from Web_Power_Switch_Control import webPowerSwitch
+from Web_Power_Switch_Emulator import webPowerSwitchEmulator
+
+
+def percentile(sorted_values, fraction):
+	""" Nearest-rank percentile of an already sorted list """
+	if not sorted_values:
+		return None
+	# Rounded first so float error in fraction * n can't push the rank up by one.
+	rank = int(math.ceil(round(fraction * len(sorted_values), 9)))
+	index = min(len(sorted_values) - 1, max(0, rank - 1))
+	return sorted_values[index]
+
+
+def measure(function, iterations, commands_per_call=1):
+	"""
+	Call function iterations times and return throughput and latency statistics.
+	Latencies are per call, in seconds.
+	"""
+	latencies = []
+	start = perf_counter()
+	for i in range(iterations):
+		t = perf_counter()
+		function(i)
+		latencies.append(perf_counter() - t)
+	elapsed = perf_counter() - start
+	latencies.sort()
+	return {
+		"iterations": iterations,
+		"commands": iterations * commands_per_call,
+		"elapsed_s": elapsed,
+		"commands_per_s": iterations * commands_per_call / elapsed if elapsed else None,
+		"mean_s": sum(latencies) / len(latencies),
+		"p50_s": percentile(latencies, 0.50),
+		"p95_s": percentile(latencies, 0.95),
+		"p99_s": percentile(latencies, 0.99),
+		"max_s": latencies[-1],
+		}
+
+
+def chamber_benchmarks(iterations, latency):
+	emulator = ThermotronEmulator(port=0, latency=latency)
+	port = emulator.start_in_thread()
+	with redirect_stdout(io.StringIO()):
+		chamber = ThermotronChamber("127.0.0.1", portNumber=port)
+	chamber.get_set_prog("1", iterations)
+	commands = {
+		"PVAR": lambda chamber, i: chamber.get_process_variable(1),
+		"PVAR batch (40 channels)": lambda chamber, i: chamber.get_process_variables(),
+		"SETP": lambda chamber, i: chamber.get_set_setpoint(1, 25),
+		"OPTN": lambda chamber, i: chamber.get_set_options(),
+		"INTV": lambda chamber, i: chamber.get_set_programming_interval(i % iterations + 1,
+			fv1=25, fv2=0, fv3=0, fv4=0, hr_min_sec="00:10:00"),
+		}
+	results = {}
+	for name, function in commands.items():
+		commands_per_call = 40 if name.startswith("PVAR batch") else 1
+		with redirect_stdout(io.StringIO()):
+			results[name] = measure(lambda i: function(chamber, i), iterations, commands_per_call)
+
+	# The same commands, each on a new connection.
+	for name, function in commands.items():
+		def connect_and_run(i):
+			fresh = ThermotronChamber("127.0.0.1", portNumber=port)
+			function(fresh, i)
+			fresh.close()
+		commands_per_call = results[name]["commands"] // iterations
+		with redirect_stdout(io.StringIO()):
+			setup = measure(connect_and_run, max(iterations // 20, 10), commands_per_call)
+		setup["setup_cost_s"] = setup["mean_s"] - results[name]["mean_s"]
+		results["connect + {}".format(name)] = setup
+	with redirect_stdout(io.StringIO()):
+		chamber.close()
+		del chamber
+	emulator.stop()
+	return results
+
+
+def switch_benchmarks(iterations, latency):
+	emulator = webPowerSwitchEmulator(port=0, latency=latency)
+	port = emulator.start_in_thread()
+	hostname = "127.0.0.1:{}".format(port)
+	switch = webPowerSwitch(hostname, "admin", "1234", cache_ttl=0)
+	commands = {
+		"outlet on": lambda switch, i: switch.on(i % 8 + 1),
+		"outlet off": lambda switch, i: switch.off(i % 8 + 1),
+		"allon": lambda switch, i: switch.allon(),
+		}
+	results = {}
+	for name, function in commands.items():
+		results[name] = measure(lambda i: function(switch, i), iterations)
+
+	# The same commands, each on a new connection.
+	for name, function in commands.items():
+		def connect_and_switch(i):
+			fresh = webPowerSwitch(hostname, "admin", "1234", cache_ttl=0)
+			function(fresh, i)
+			fresh.close()
+		setup = measure(connect_and_switch, max(iterations // 20, 10))
+		setup["setup_cost_s"] = setup["mean_s"] - results[name]["mean_s"]
+		results["connect + {}".format(name)] = setup
+	switch.close()
+	results["server"] = {"requests": emulator.requests, "connections": emulator.connections,
+		"auth_challenges": emulator.challenges}
+	emulator.stop()
+	return results
+
+
+def print_table(title, results):
+	print(title)
+	print("  {:<36} {:>12} {:>10} {:>10} {:>10}".format("command", "cmds/s", "p50 ms", "p95 ms", "p99 ms"))
+	for name, r in results.items():
+		if "p50_s" not in r:
+			continue
+		print("  {:<36} {:>12.0f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+			name, r["commands_per_s"], r["p50_s"] * 1e3, r["p95_s"] * 1e3, r["p99_s"] * 1e3))
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark chamber and power switch command throughput")
+	parser.add_argument("--iterations", type=int, default=1000)
+	parser.add_argument("--latency", type=float, default=0.0, help="emulated device latency in seconds")
+	parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+	parser.add_argument("--label", default="", help="free text stored with the results")
+	args = parser.parse_args()
+
+	report = {
+		"label": args.label,
+		"time": strftime("%Y-%m-%dT%H:%M:%S"),
+		"python": sys.version.split()[0],
+		"platform": platform.platform(),
+		"iterations": args.iterations,
+		"device_latency_s": args.latency,
+		"chamber": chamber_benchmarks(args.iterations, args.latency),
+		"power_switch": switch_benchmarks(args.iterations, args.latency),
+		}
+	print_table("ThermotronChamber", report["chamber"])
+	print_table("webPowerSwitch", report["power_switch"])
+	with open(args.output, "w") as f:
+		json.dump(report, f, indent=2, sort_keys=True)
+	print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+	main()
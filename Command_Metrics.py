@@ -0,0 +1,140 @@
+from socket import timeout
+import threading
+
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _commandStats():
+	__slots__ = ("count", "errors", "timeouts", "bytes_sent", "bytes_received", "latency_sum", "buckets")
+
+	def __init__(self, n_buckets):
+		self.count = 0
+		self.errors = 0
+		self.timeouts = 0
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.latency_sum = 0.0
+		# One count per bucket plus one for +Inf; not cumulative.
+		self.buckets = [0] * (n_buckets + 1)
+
+
+class CommandMetrics():
+	"""
+	Per-command counters and latency histograms for ThermotronChamber and webPowerSwitch.
+
+	Pass one instance as metrics= to any number of chambers or switches; every command
+	is recorded under the device name and the command mnemonic. Hooks registered with
+	add_hook are called after every command with
+	(device, command, latency, bytes_sent, bytes_received, error).
+	Clients created without metrics skip all of this.
+
+	Usage:
+		metrics = CommandMetrics("thermotron")
+		chamber = ThermotronChamber("chamber1", metrics=metrics)
+		...
+		print(metrics.to_prometheus())
+	"""
+	def __init__(self, prefix="device", buckets=DEFAULT_BUCKETS):
+		self.prefix = prefix
+		self.bucket_bounds = tuple(sorted(buckets))
+		self.hooks = []
+		self._stats = {}
+		self._lock = threading.Lock()
+
+	def add_hook(self, hook):
+		self.hooks.append(hook)
+
+	def remove_hook(self, hook):
+		self.hooks.remove(hook)
+
+	def record(self, device, command, latency, bytes_sent=0, bytes_received=0, error=None):
+		"""
+		Record one finished command. error is the exception it failed with, if any; it
+		counts as a timeout if it is a socket timeout or was raised from one.
+		"""
+		index = 0
+		for bound in self.bucket_bounds:
+			if latency <= bound:
+				break
+			index += 1
+		key = (str(device), command)
+		with self._lock:
+			stats = self._stats.get(key)
+			if stats is None:
+				stats = self._stats[key] = _commandStats(len(self.bucket_bounds))
+			stats.count += 1
+			stats.bytes_sent += bytes_sent
+			stats.bytes_received += bytes_received
+			stats.latency_sum += latency
+			stats.buckets[index] += 1
+			if error is not None:
+				stats.errors += 1
+				if isinstance(error, timeout) or isinstance(getattr(error, "__cause__", None), timeout):
+					stats.timeouts += 1
+		for hook in self.hooks:
+			hook(device, command, latency, bytes_sent, bytes_received, error)
+
+	def reset(self):
+		with self._lock:
+			self._stats = {}
+
+	def snapshot(self):
+		"""
+		{(device, command): {count, errors, timeouts, bytes_sent, bytes_received,
+		latency_sum, buckets}} where buckets is a list of (upper bound, cumulative count).
+		"""
+		with self._lock:
+			items = list(self._stats.items())
+			result = {}
+			for key, stats in items:
+				cumulative = 0
+				buckets = []
+				for bound, count in zip(self.bucket_bounds + (float("inf"),), stats.buckets):
+					cumulative += count
+					buckets.append((bound, cumulative))
+				result[key] = {
+					"count": stats.count,
+					"errors": stats.errors,
+					"timeouts": stats.timeouts,
+					"bytes_sent": stats.bytes_sent,
+					"bytes_received": stats.bytes_received,
+					"latency_sum": stats.latency_sum,
+					"buckets": buckets,
+					}
+		return result
+
+	def to_prometheus(self):
+		""" Snapshot in the Prometheus text exposition format """
+		snapshot = sorted(self.snapshot().items())
+		lines = []
+		counters = (
+			("commands_total", "count", "Commands sent."),
+			("command_errors_total", "errors", "Commands that failed, including timeouts."),
+			("command_timeouts_total", "timeouts", "Commands that timed out."),
+			("bytes_sent_total", "bytes_sent", "Bytes sent to the device."),
+			("bytes_received_total", "bytes_received", "Bytes received from the device."),
+			)
+		for name, field, help_text in counters:
+			metric = "{}_{}".format(self.prefix, name)
+			lines.append("# HELP {} {}".format(metric, help_text))
+			lines.append("# TYPE {} counter".format(metric))
+			for (device, command), stats in snapshot:
+				lines.append('{}{{device="{}",command="{}"}} {}'.format(
+					metric, _escape(device), _escape(command), stats[field]))
+		metric = "{}_command_latency_seconds".format(self.prefix)
+		lines.append("# HELP {} Command round trip time.".format(metric))
+		lines.append("# TYPE {} histogram".format(metric))
+		for (device, command), stats in snapshot:
+			labels = 'device="{}",command="{}"'.format(_escape(device), _escape(command))
+			for bound, count in stats["buckets"]:
+				le = "+Inf" if bound == float("inf") else repr(bound)
+				lines.append('{}_bucket{{{},le="{}"}} {}'.format(metric, labels, le, count))
+			lines.append("{}_sum{{{}}} {!r}".format(metric, labels, stats["latency_sum"]))
+			lines.append("{}_count{{{}}} {}".format(metric, labels, stats["count"]))
+		return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+	return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,536 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from time import monotonic
+
+from Thermotron_Control import (TERMINATOR, PROCESS_VARIABLE_CHANNELS, SNAPSHOT_COMMANDS,
+	ChamberStatus, StabilityTracker, ThermotronOptions, format_interval)
+
+
+class AsyncThermotronChamber():
+	"""
+	asyncio client for a 8800 controller on a Thermotron chamber.
+
+	Commands are written as soon as they are issued and several can be in
+	flight on the same connection. The 8800 answers strictly in order, so each
+	reply is matched to the oldest outstanding request.
+
+	A reply that doesn't arrive within timeout would shift every later reply onto the
+	wrong request, so a timeout drops the connection: the timed out command raises
+	asyncio.TimeoutError, every other outstanding one ConnectionError, and the next
+	command reconnects. Replies handed out between the lost one and its timeout
+	can't be told apart from good ones, which is why batch() fails as a whole
+	when any of its commands does.
+
+	Usage:
+		chamber = AsyncThermotronChamber("chamber1")
+		await chamber.connect()
+		temps = await asyncio.gather(*[chamber.get_process_variable(ch) for ch in range(1,5)])
+		await chamber.close()
+	"""
+	def __init__(self, chamber_control_name, description=None, portNumber="8888",
+		terminator=TERMINATOR, timeout=1, max_in_flight=16):
+		self.chamber_control_name = chamber_control_name
+		self.portNumber = portNumber
+		self.description = description
+		self.terminator = terminator
+		self.timeout = timeout
+		self.max_in_flight = max_in_flight
+		self._reader = None
+		self._writer = None
+		self._reader_task = None
+		self._pending = deque()
+		self._slots = None
+		self._resync = False
+		self._connecting = None
+
+	def __unicode__(self):
+		if self.description:
+			return '{0}:{1}'.format(self.chamber_control_name,
+				self.description)
+		return self.chamber_control_name
+
+	def __str__(self):
+		return self.__unicode__()
+
+	def __repr__(self):
+		return "<async_thermotron_ctrl {}>".format(self.__unicode__())
+
+	async def __aenter__(self):
+		await self.connect()
+		return self
+
+	async def __aexit__(self, exc_type, exc, tb):
+		await self.close()
+
+	async def connect(self):
+		"""
+		Opens the connection to the chamber and starts the reply reader.
+		"""
+		self._reader, self._writer = await asyncio.wait_for(
+			asyncio.open_connection(self.chamber_control_name, int(self.portNumber)),
+			self.timeout)
+		self._slots = asyncio.Semaphore(self.max_in_flight)
+		self._reader_task = asyncio.ensure_future(self._read_replies())
+		self._resync = False
+
+	@property
+	def connected(self):
+		# The reader stops when the chamber closes the connection.
+		return (self._writer is not None and self._reader_task is not None
+			and not self._reader_task.done())
+
+	async def close(self):
+		"""
+		Closes the connection. Any outstanding requests fail with ConnectionError.
+		"""
+		self._resync = False
+		if self._reader_task is not None:
+			self._reader_task.cancel()
+			try:
+				await self._reader_task
+			except asyncio.CancelledError:
+				pass
+			self._reader_task = None
+		if self._writer is not None:
+			self._writer.close()
+			try:
+				await self._writer.wait_closed()
+			except OSError:
+				pass
+			self._writer = None
+		self._fail_pending(ConnectionError("Connection to {} closed".format(self.chamber_control_name)))
+
+	async def _read_replies(self):
+		""" Resolve outstanding requests in order as replies arrive """
+		try:
+			while True:
+				line = await self._reader.readuntil(self.terminator)
+				if not self._pending:
+					# Unsolicited data, nothing is waiting for it.
+					continue
+				future = self._pending.popleft()
+				if not future.done():
+					future.set_result(line.decode("ascii").strip())
+		except asyncio.IncompleteReadError:
+			self._fail_pending(ConnectionError("{} closed the connection".format(self.chamber_control_name)))
+		except OSError as e:
+			self._fail_pending(e)
+
+	def _drop(self):
+		"""
+		Abandons a connection whose replies can no longer be matched to requests.
+		"""
+		if self._reader_task is not None:
+			self._reader_task.cancel()
+			self._reader_task = None
+		if self._writer is not None:
+			self._writer.close()
+			self._writer = None
+		self._fail_pending(ConnectionError("Connection to {} dropped after a reply timed out".format(
+			self.chamber_control_name)))
+		self._resync = True
+
+	async def _reconnect(self):
+		# Commands issued together after a drop share one connection attempt.
+		if self._connecting is None:
+			self._connecting = asyncio.ensure_future(self.connect())
+			self._connecting.add_done_callback(lambda done: setattr(self, "_connecting", None))
+		await asyncio.shield(self._connecting)
+
+	def _fail_pending(self, exc):
+		while self._pending:
+			future = self._pending.popleft()
+			if not future.done():
+				future.set_exception(exc)
+
+	async def command(self, command_string):
+		"""
+		Sends a single command and waits for its reply. Many calls can be awaited
+		concurrently; up to max_in_flight of them share the connection at once.
+		"""
+		if not self.connected:
+			if not self._resync:
+				raise ConnectionError("Not connected to {}".format(self.chamber_control_name))
+			await self._reconnect()
+		if not command_string.endswith("\r"):
+			command_string += "\r"
+		async with self._slots:
+			if not self.connected:
+				# Dropped while this command waited for a slot.
+				raise ConnectionError("Connection to {} dropped".format(self.chamber_control_name))
+			future = asyncio.get_event_loop().create_future()
+			# Queue the future and write in the same step so the order of the
+			# pending queue always matches the order on the wire.
+			self._pending.append(future)
+			self._writer.write(command_string.encode("ascii"))
+			await self._writer.drain()
+			try:
+				return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+			except asyncio.TimeoutError:
+				# The reply may never come. If it was still owed, nothing after it
+				# can be trusted on this connection.
+				if future.cancel():
+					self._drop()
+				raise
+			except asyncio.CancelledError:
+				# The reply is still coming, so the slot in the pending queue must
+				# stay for later replies to line up; it is dropped when it arrives.
+				future.cancel()
+				raise
+
+	async def batch(self, command_strings):
+		"""
+		Sends all of the commands back to back and returns the replies in order.
+		"""
+		return await asyncio.gather(*[self.command(c) for c in command_strings])
+
+	async def _query_channels(self, mnemonic, channels, valid_channels):
+		"""
+		Pipelines a "<mnemonic><channel>?" query for every channel and returns a dict of
+		channel -> reply. Channels outside valid_channels map to None and are not sent.
+		"""
+		channels = list(channels)
+		to_send = [channel for channel in channels if channel in valid_channels]
+		replies = await self.batch(["{}{}?".format(mnemonic, channel) for channel in to_send])
+		result = dict.fromkeys(channels)
+		result.update(zip(to_send, replies))
+		return result
+
+	async def get_alarm_status(self, port):
+		"""
+		The 8800 returns the current alarm status for the selected channel
+		(0 = Low deviation alarm, 1 = High deviation alarm)
+		"""
+		if int(port) not in range(1,9):
+			print("Port number out of range.")
+			return 0
+		return await self.command("ALRM{}?".format(port))
+
+	async def get_set_aux(self, aux_group, status_int=None):
+		"""
+		Reads or changes the on and off states of auxiliary group 1 (aux 1-8) or 2 (aux 9-16).
+		"""
+		if isinstance(status_int,float) or isinstance(status_int,int):
+			return await self.command("AUXE{0},{1}".format(aux_group,status_int))
+		return await self.command("AUXE{0}".format(aux_group))
+
+	async def get_channel_config_information(self, pvchannel):
+		"""
+		The 8800 sends a single coded integer describing the channel type.
+		"""
+		if pvchannel not in range(1,9):
+			return None
+		return await self.command("CCNF{}?".format(pvchannel))
+
+	async def get_channel_on_and_configured_status(self):
+		"""
+		The 8800 sends a two-byte coded integer describing the channel on and configuration status.
+		"""
+		return await self.command("CHST?")
+
+	async def get_channel_name(self, channel):
+		"""
+		Reads the assigned name of any process variable or monitor channel.
+		"""
+		if channel not in range(1,29):
+			return None
+		return await self.command("CNAM{}?".format(channel))
+
+	async def get_set_deviation(self, channel, deviation=None):
+		"""
+		Reads or loads the deviation setting for a channel (1-4).
+		"""
+		if int(channel) not in range(1,5):
+			return 0
+		if isinstance(deviation,float) or isinstance(deviation,int):
+			return await self.command("DEVN{0},{1}".format(channel,deviation))
+		return await self.command("DEVN{0}?".format(channel))
+
+	async def set_hold(self):
+		"""
+		Places a running program or test in hold mode
+		"""
+		return await self.command("HOLD")
+
+	async def get_iden(self):
+		"""
+		Send device identification
+		"""
+		return await self.command("IDEN?")
+
+	async def get_set_light(self, status=-1, Toggle=False):
+		"""
+		Reads or sets the chamber light. If toggle is true, queries the 8800 and
+		toggles the light regardless of what status is.
+		"""
+		if Toggle:
+			status = 1-int(await self.command("LGHT?"))
+		if int(status) in [0, 1]:
+			return await self.command("LGHT{}".format(int(status)))
+		return await self.command("LGHT?")
+
+	async def get_set_manual_ramp(self, channel, ramp=None):
+		"""
+		Reads or sets the manual ramp for a channel (1-4) in units per minute.
+		"""
+		if channel not in range(1,5):
+			return 0
+		if isinstance(ramp,int) or isinstance(ramp, float):
+			return await self.command("MRMP{},{}".format(channel,ramp))
+		return await self.command("MRMP{}?".format(channel))
+
+	async def get_set_options(self, option_int=-1):
+		"""
+		Reads or temporarily changes the options register of the 8800.
+		See ThermotronChamber.get_set_options for the bit definitions.
+		"""
+		if int(option_int) in range(0,1024):
+			return await self.command("OPTN{}".format(str(option_int).zfill(3)))
+		return await self.command("OPTN?")
+
+	@asynccontextmanager
+	async def options(self):
+		"""
+		Change several options with a single OPTN write:
+
+			async with chamber.options() as options:
+				options.ptc = False
+				options.humidity = True
+
+		Nothing is written if the block raises or leaves the register unchanged.
+		"""
+		reply = await self.command("OPTN?")
+		try:
+			before = ThermotronOptions(reply)
+		except ValueError:
+			raise ValueError("Could not read the options register of {}".format(self.chamber_control_name))
+		options = ThermotronOptions(before.value)
+		yield options
+		if options.value != before.value:
+			await self.get_set_options(options.value)
+
+	async def get_set_parameter_group(self, parameter_group=None):
+		"""
+		Reads or selects the parameter group (1 to 4) the 8800 uses to control the channels.
+		"""
+		if parameter_group in range(1,5):
+			return await self.command("PRMG,{}".format(parameter_group))
+		return await self.command("PRMG?")
+
+	async def get_process_variable(self, pvchannel=None):
+		"""
+		Queries the 8800 for the current value of the selected channel (1-48).
+		See ThermotronChamber.get_process_variable for the channel map.
+		"""
+		if pvchannel not in range(1,49):
+			return None
+		return await self.command("PVAR{}?".format(pvchannel))
+
+	async def get_process_variables(self, pvchannels=None):
+		"""
+		Reads many PVAR channels at once and returns a dict of channel -> value.
+		Defaults to every defined channel.
+		"""
+		if pvchannels is None:
+			pvchannels = PROCESS_VARIABLE_CHANNELS
+		return await self._query_channels("PVAR", pvchannels, range(1,49))
+
+	async def get_setpoints(self, channels=range(1,5)):
+		"""
+		Reads the set points of many channels at once.
+		"""
+		return await self._query_channels("SETP", channels, range(1,5))
+
+	async def get_deviations(self, channels=range(1,5)):
+		"""
+		Reads the deviation of many channels at once.
+		"""
+		return await self._query_channels("DEVN", channels, range(1,5))
+
+	async def get_throttles(self, pvchannels=range(1,9)):
+		"""
+		Reads the throttle of many channels at once.
+		"""
+		return await self._query_channels("THTL", pvchannels, range(1,9))
+
+	async def set_manual_run(self):
+		"""
+		Places a stopped 8800 in run manual mode.
+		"""
+		return await self.command("RUNM")
+
+	async def get_stop_status(self):
+		"""
+		Reads the code for the cause of the most recent transition to the stop state.
+		See ThermotronChamber.get_stop_status for the code list.
+		"""
+		return await self.command("SCOD?")
+
+	async def get_set_setpoint(self, channel, setpoint=None):
+		"""
+		Reads or loads the set point for a channel (1-4).
+		"""
+		if channel not in range(1,5):
+			return 0
+		if isinstance(setpoint,float) or isinstance(setpoint,int):
+			return await self.command("SETP{},{}".format(channel,setpoint))
+		return await self.command("SETP{}?".format(channel))
+
+	async def set_stop(self):
+		"""
+		Stop controller
+		"""
+		return await self.command("STOP")
+
+	async def get_throttle(self, pvchannel):
+		"""
+		Reads the current channel throttle as a percentage.
+		"""
+		if pvchannel not in range(1,9):
+			return 0
+		return await self.command("THTL{}?".format(pvchannel))
+
+	async def get_version(self):
+		"""
+		Queries the 8800 for the version number of the display software.
+		"""
+		return await self.command("VRSN?")
+
+	async def print_version(self):
+		"""
+		Queries the 8800 for the version number of the display software and prints it.
+		"""
+		print(await self.command("VRSN?"))
+
+	async def get_set_final_value(self, channel, value=None):
+		"""
+		Reads or changes the current interval's final value for channel n (1-4).
+		"""
+		if channel not in range(1,5):
+			return 0
+		if isinstance(value,float) or isinstance(value,int):
+			return await self.command("FVAL{},{}".format(channel,value))
+		return await self.command("FVAL{}?".format(channel))
+
+	async def get_loops_left(self, loops=None):
+		"""
+		Reads or changes the number of loops left for the current loop.
+		"""
+		if isinstance(loops,int):
+			return await self.command("LLFT{}".format(loops))
+		return await self.command("LLFT?")
+
+	async def get_time_left(self, time=None):
+		"""
+		Reads or changes the time left in the current interval ("hh:mm:ss").
+		"""
+		if isinstance(time, str):
+			return await self.command("TLFT{}".format(time))
+		return await self.command("TLFT?")
+
+	async def set_resume(self):
+		"""
+		Returns a program or test from hold mode to its run mode.
+		"""
+		return await self.command("RESM")
+
+	async def get_set_programming_interval(self, interval, fv1="", fv2="", fv3="", fv4="",
+		dv1="", dv2="", dv3="", dv4="", hr_min_sec="", pgrp="", lp="", ni="", auxg1="", auxg2="",
+		display_status_byte="", options="", channels=""):
+		"""
+		Reads (INTVn?) or sends (INTVn,...) the program initialization string (interval 0) or
+		one of the program intervals. See ThermotronChamber.get_set_programming_interval.
+		"""
+		if int(interval) >= 0 and not (fv1 or fv2 or fv3 or fv4):
+			config_str = "{}?".format(interval)
+		else:
+			config_str = format_interval(interval, fv1, fv2, fv3, fv4, dv1, dv2, dv3, dv4, hr_min_sec,
+				pgrp, lp, ni, auxg1, auxg2, display_status_byte, options, channels)
+		return await self.command("INTV{}".format(config_str))
+
+	async def get_set_prog(self, prog_name="", intervals=None):
+		"""
+		Selects the program to read (PROGname?) or creates one with a number of intervals
+		(PROGname,n). See ThermotronChamber.get_set_prog.
+		"""
+		if prog_name and isinstance(intervals, int):
+			command_string = "PROG{},{}".format(prog_name, intervals)
+		elif prog_name:
+			command_string = "PROG{}?".format(prog_name)
+		elif intervals:
+			command_string = "PROG{}?".format(intervals)
+		else:
+			command_string = "PROGn?"
+		return await self.command(command_string)
+
+	async def ptc_on(self):
+		"""
+		Turns on PTC control, turning off humidity and purge
+		"""
+		async with self.options() as options:
+			if not options.ptc:
+				options.humidity = False
+				options.purge = False
+				options.ptc = True
+
+	async def ptc_off(self):
+		"""
+		Turns off PTC control
+		"""
+		async with self.options() as options:
+			options.ptc = False
+
+	async def humidity_on(self):
+		"""
+		Turns on humidity, turning off PTC and purge
+		"""
+		async with self.options() as options:
+			if not options.humidity:
+				options.ptc = False
+				options.purge = False
+				options.humidity = True
+
+	async def humidity_off(self):
+		"""
+		Turns off humidity
+		"""
+		async with self.options() as options:
+			options.humidity = False
+
+	async def snapshot(self):
+		"""
+		Reads the chamber's status in one pipelined batch and returns a ChamberStatus.
+		See ThermotronChamber.snapshot.
+		"""
+		start = monotonic()
+		replies = await self.batch(SNAPSHOT_COMMANDS)
+		end = monotonic()
+		return ChamberStatus(str(self), replies, end, end - start)
+
+	async def wait_until_stable(self, channel, tolerance, dwell, target=None, timeout=None,
+		min_interval=0.25, max_interval=30.0, on_sample=None):
+		"""
+		Waits until process variable channel (1-4) has stayed within tolerance of target
+		for dwell seconds and returns the last reading. target defaults to the current set
+		point. See ThermotronChamber.wait_until_stable; nothing blocks between readings, so
+		any number of channels and chambers can be waited on from one event loop.
+		Raises asyncio.TimeoutError if timeout seconds pass first.
+		"""
+		if timeout is not None:
+			return await asyncio.wait_for(self.wait_until_stable(channel, tolerance, dwell,
+				target, None, min_interval, max_interval, on_sample), timeout)
+		if target is None:
+			target, ramp = await self.batch(["SETP{}?".format(channel), "MRMP{}?".format(channel)])
+		else:
+			ramp = await self.get_set_manual_ramp(channel)
+		tracker = StabilityTracker(target, tolerance, dwell, float(ramp),
+			min_interval, max_interval)
+		while True:
+			value = await self.get_process_variable(channel)
+			if on_sample is not None:
+				on_sample(channel, value)
+			stable, delay = tracker.update(value)
+			if stable:
+				return value
+			await asyncio.sleep(delay)
@@ -1,15 +1,525 @@
-from time import sleep
-import telnetlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+import socket
 from socket import gaierror, timeout
+from time import monotonic, perf_counter, sleep
+try:
+	import telnetlib
+except ImportError:
+	# Removed from the standard library in python 3.13.
+	telnetlib = None
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# Every reply from the 8800 ends with a carriage return / line feed pair.
+TERMINATOR = b"\r\n"
+
+# PVAR channels that are defined on the 8800 (9-12 and 29-32 are undefined).
+PROCESS_VARIABLE_CHANNELS = list(range(1,9)) + list(range(13,29)) + list(range(33,49))
+
+# Bits of the OPTN options register (see ThermotronChamber.get_set_options).
+OPTION_BITS = (
+	("ptc", 1),
+	("humidity", 2),
+	("low_humidity", 4),
+	("gsoak", 8),
+	("purge", 16),
+	("cascade_refrigeration", 32),
+	("power_save", 64),
+	("single_stage_refrigeration", 128),
+	("rapid_cycle_1", 256),
+	("rapid_cycle_2", 512),
+	)
+
+
+def format_interval(interval, fv1="", fv2="", fv3="", fv4="", dv1="", dv2="", dv3="", dv4="",
+	hr_min_sec="", pgrp="", lp="", ni="", auxg1="", auxg2="", display_status_byte="", options="",
+	channels=""):
+	"""
+	Builds the comma separated field string of an INTV operation command (without the
+	leading "INTV"). Interval 0 initializes the program and only takes the four values and
+	the channels; other intervals take the full field list.
+	Aux groups longer than 3 characters are read as binary with aux 1 (or 9) on the left.
+	"""
+	# it's easier to write aux on & off in binary from left to right
+	if auxg1:
+		if len(str(auxg1)) > 3:
+			auxg1 = int(str(auxg1)[::-1],2)
+	if auxg2:
+		if len(str(auxg2)) > 3:
+			auxg2 = int(str(auxg2)[::-1],2)
+
+	if int(interval) > 0:
+		options_list = [interval,fv1,fv2,fv3,fv4,dv1,dv2,dv3,dv4,hr_min_sec,pgrp,lp,ni,
+		auxg1,auxg2,display_status_byte,options]
+	else:
+		options_list = [interval,fv1,fv2,fv3,fv4,channels]
+	return ",".join([str(x) for x in options_list])
+
+
+# How the 8800 reports the outcome of a command. An operation command (no "?") is
+# answered with SUCCESS_REPLY when it was carried out and with an error code
+# otherwise; ERROR_REPLY is sent instead of an answer to any command that can't be
+# carried out, and is also what the emulator and gateway send. See is_error_reply.
+SUCCESS_REPLY = "0"
+ERROR_REPLY = "ERR"
+
+
+def is_query(command_string):
+	"""
+	True if command_string reads a value rather than changing one. Queries end in
+	"?", except AUXE, which is a query when it has no ",<value>".
+	"""
+	command = command_string.strip()
+	if command[:4] == "AUXE":
+		return "," not in command
+	return command.endswith("?")
+
+
+def is_error_reply(command_string, reply):
+	"""
+	True if reply says that command_string failed: ERROR_REPLY to any command, or
+	anything but SUCCESS_REPLY to an operation command.
+	"""
+	if reply == ERROR_REPLY:
+		return True
+	return not is_query(command_string) and reply != SUCCESS_REPLY
+
+
+class ThermotronError(IOError):
+	"""
+	Raised in typed mode when the 8800 answers a command with an error or with a
+	reply that can't be decoded.
+	"""
+	def __init__(self, command, reply, message=None):
+		self.command = command
+		self.reply = reply
+		IOError.__init__(self, message or "{} failed: {!r}".format(command, reply))
+
+
+# A decoded INTV reply. Unset fields are None; channels only applies to interval 0
+# and the other fields after fv4 only to intervals 1 and up (see format_interval).
+Interval = namedtuple("Interval", ["interval", "fv1", "fv2", "fv3", "fv4", "dv1", "dv2", "dv3",
+	"dv4", "time", "pgrp", "lp", "ni", "auxg1", "auxg2", "display_status_byte", "options",
+	"channels"])
+
+
+def _optional(convert):
+	def parse(field):
+		field = field.strip()
+		return convert(field) if field else None
+	return parse
+
+
+def parse_time_left(reply):
+	""" "hh:mm:ss" as a datetime.timedelta """
+	hours, minutes, seconds = reply.strip().split(":")
+	return timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+def parse_interval(reply):
+	""" An INTV query reply as an Interval """
+	fields = reply.strip().split(",")
+	number, rest = int(fields[0]), fields[1:]
+	if number == 0:
+		values = [_optional(float)(field) for field in rest[:4]]
+		values += [None] * (4 - len(values))
+		channels = _optional(int)(rest[4]) if len(rest) > 4 else None
+		return Interval(number, *values + [None] * 12 + [channels])
+	converters = [float] * 8 + [parse_time_left] + [int] * 7
+	values = [_optional(convert)(field) for convert, field in zip(converters, rest)]
+	values += [None] * (len(converters) - len(values))
+	return Interval(number, *values + [None])
+
+
+# How typed mode decodes the replies to queries, by mnemonic. Anything else stays a string.
+REPLY_PARSERS = {
+	"PVAR": float, "SETP": float, "DEVN": float, "THTL": float, "MRMP": float, "FVAL": float,
+	"SCOD": int, "OPTN": int, "CHST": int, "ALRM": int, "PRMG": int, "LLFT": int,
+	"LGHT": int, "CCNF": int, "AUXE": int,
+	"TLFT": parse_time_left,
+	"INTV": parse_interval,
+	}
+
+
+def parse_reply(command_string, reply):
+	"""
+	Decodes the reply to a query with REPLY_PARSERS. Raises ThermotronError for an
+	error reply (see is_error_reply) or one that doesn't decode. An operation command
+	that was carried out returns None.
+	"""
+	command = command_string.strip()
+	if is_error_reply(command, reply):
+		raise ThermotronError(command, reply)
+	if not is_query(command):
+		return None
+	parser = REPLY_PARSERS.get(command[:4])
+	if parser is None:
+		return reply
+	try:
+		return parser(reply)
+	except (ValueError, IndexError):
+		raise ThermotronError(command, reply, "Can't decode the reply to {}: {!r}".format(command, reply))
+
+
+def replies_to_array(replies, dtype=float, errors="raise"):
+	"""
+	Converts a batch of numeric replies (e.g. thousands of PVAR readings) to a numpy
+	array in one step. With errors="nan", error or undecodable replies become NaN
+	instead of raising ThermotronError. Requires numpy.
+	"""
+	if np is None:
+		raise ImportError("replies_to_array needs numpy")
+	try:
+		return np.array(replies, dtype=dtype)
+	except ValueError:
+		pass
+	# Something in there isn't a number; find it the slow way.
+	values = np.empty(len(replies), dtype=dtype)
+	for index, reply in enumerate(replies):
+		try:
+			values[index] = reply
+		except ValueError:
+			if errors != "nan":
+				raise ThermotronError("reply {}".format(index), reply,
+					"Reply {} is not a number: {!r}".format(index, reply))
+			values[index] = np.nan
+	return values
+
+
+class ThermotronOptions():
+	"""
+	Value of the 8800 options register with a property for each option bit,
+	e.g. options.ptc or options.humidity = False.
+	"""
+	def __init__(self, value=0):
+		self.value = int(value)
+
+	def __int__(self):
+		return self.value
+
+	def __eq__(self, other):
+		return self.value == int(other)
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __repr__(self):
+		enabled = [name for name, bit in OPTION_BITS if self.value & bit]
+		return "<ThermotronOptions {} ({})>".format(self.value, "|".join(enabled) or "none")
+
+
+def _option_property(bit):
+	def get(self):
+		return bool(self.value & bit)
+	def set(self, enabled):
+		if enabled:
+			self.value |= bit
+		else:
+			self.value &= ~bit
+	return property(get, set)
+
+for _name, _bit in OPTION_BITS:
+	setattr(ThermotronOptions, _name, _option_property(_bit))
+
+
+# Causes of the last transition to stop, as reported by SCOD.
+STOP_CODES = {
+	0: "Cold boot power up",
+	1: "Running",
+	2: "Stop key pressed",
+	3: "End of test",
+	4: "External input",
+	5: "Computer interface",
+	6: "Open input",
+	7: "Process alarm",
+	8: "System Monitor trip",
+	9: "Power fail recovery",
+	10: "Therm-Alarm trip",
+	}
+
+# Bits of an ALRM reply.
+LOW_DEVIATION_ALARM = 1
+HIGH_DEVIATION_ALARM = 2
+
+# Queries whose replies identify the controller; a change in either means cached
+# metadata may be wrong.
+IDENTITY_COMMANDS = ["IDEN?", "VRSN?"]
+
+# Static queries returned by ThermotronChamber.get_metadata.
+METADATA_COMMANDS = (IDENTITY_COMMANDS
+	+ ["CNAM{}?".format(channel) for channel in range(1,29)]
+	+ ["CCNF{}?".format(channel) for channel in range(1,9)])
+
+# Queries behind ChamberStatus, sent as one batch.
+SNAPSHOT_COMMANDS = ["CHST?", "SCOD?"] + ["ALRM{}?".format(port) for port in range(1,9)] + ["OPTN?", "PRMG?"]
+
+
+class ChamberStatus():
+	"""
+	Decoded health of a chamber at one moment, from the replies to SNAPSHOT_COMMANDS.
+
+	channels_on / channels_configured are bitmasks of channels 1-8 (bit 0 = channel 1)
+	from CHST, stop_code is the SCOD code (see STOP_CODES) and alarms holds the ALRM
+	reply of ports 1-8. latency is the round trip time of the batch in seconds.
+	An error or undecodable reply raises ThermotronError naming its command.
+	"""
+	__slots__ = ("chamber", "time", "latency", "channels_on", "channels_configured",
+		"stop_code", "alarms", "options", "parameter_group")
+
+	def __init__(self, chamber, replies, time=None, latency=None):
+		values = [parse_reply(command, reply) for command, reply in zip(SNAPSHOT_COMMANDS, replies)]
+		chst, scod = values[0], values[1]
+		self.chamber = chamber
+		self.time = time
+		self.latency = latency
+		self.channels_on = chst & 0xFF
+		self.channels_configured = (chst >> 8) & 0xFF
+		self.stop_code = scod
+		self.alarms = tuple(values[2:10])
+		self.options = ThermotronOptions(values[10])
+		self.parameter_group = values[11]
+
+	def __repr__(self):
+		return "<ChamberStatus {} {}, channels on {}, alarms {}>".format(self.chamber,
+			self.stop_reason, list(self.on_channels), list(self.alarm_ports) or "none")
+
+	@property
+	def running(self):
+		return self.stop_code == 1
+
+	@property
+	def stop_reason(self):
+		return STOP_CODES.get(self.stop_code, "Unknown stop code {}".format(self.stop_code))
+
+	@property
+	def on_channels(self):
+		return tuple(channel for channel in range(1,9) if self.channels_on & (1 << (channel - 1)))
+
+	@property
+	def configured_channels(self):
+		return tuple(channel for channel in range(1,9) if self.channels_configured & (1 << (channel - 1)))
+
+	@property
+	def low_deviation_alarms(self):
+		""" Ports (1-8) in low deviation alarm """
+		return tuple(port for port, alarm in enumerate(self.alarms, 1) if alarm & LOW_DEVIATION_ALARM)
+
+	@property
+	def high_deviation_alarms(self):
+		""" Ports (1-8) in high deviation alarm """
+		return tuple(port for port, alarm in enumerate(self.alarms, 1) if alarm & HIGH_DEVIATION_ALARM)
+
+	@property
+	def alarm_ports(self):
+		""" Ports (1-8) with any alarm """
+		return tuple(port for port, alarm in enumerate(self.alarms, 1) if alarm)
+
+	@property
+	def alarm(self):
+		return any(self.alarms)
+
+class StabilityTracker():
+	"""
+	Decides when a channel has settled and how long to wait before the next reading.
+
+	A channel is stable once every reading for dwell seconds was within tolerance of
+	target. Far from the target the next reading is scheduled for about half the
+	predicted arrival time, from ramp (units per minute, e.g. the MRMP setting) or, when
+	that is 0 or unknown, from the rate seen between readings. Near or inside the band
+	readings come every min_interval to dwell/5 seconds. No I/O is done here; the
+	chamber clients feed it readings.
+	"""
+	def __init__(self, target, tolerance, dwell, ramp=None, min_interval=0.25, max_interval=30.0):
+		self.target = float(target)
+		self.tolerance = abs(float(tolerance))
+		self.dwell = dwell
+		self.ramp = ramp
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.value = None
+		self.in_band_since = None
+		self.samples = 0
+		self._last = None
+
+	def update(self, value, now=None):
+		"""
+		Record a reading. Returns (stable, seconds until the next reading).
+		"""
+		if now is None:
+			now = monotonic()
+		value = float(value)
+		observed = None
+		if self._last is not None and now > self._last[0]:
+			observed = abs(value - self._last[1]) / (now - self._last[0]) * 60.0
+		self._last = (now, value)
+		self.value = value
+		self.samples += 1
+		distance = abs(value - self.target) - self.tolerance
+		if distance <= 0:
+			if self.in_band_since is None:
+				self.in_band_since = now
+			remaining = self.dwell - (now - self.in_band_since)
+			if remaining <= 0:
+				return True, 0.0
+			delay = min(remaining, max(self.dwell / 5.0, self.min_interval))
+		else:
+			self.in_band_since = None
+			rate = self.ramp if self.ramp else observed
+			if rate:
+				delay = distance / rate * 60.0 / 2.0
+			else:
+				delay = self.min_interval * 4
+		return False, max(self.min_interval, min(delay, self.max_interval))
+
+
+class ThermotronSocket():
+	"""
+	Plain TCP transport for the 8800, a lighter replacement for telnetlib.Telnet with the
+	same write/read_until/read_very_eager/read_some/close methods.
+	Replies are received straight into a preallocated buffer with recv_into and the
+	terminator is searched for in place, so each reply is copied out exactly once.
+	"""
+	def __init__(self, host, port, timeout=1, nodelay=True, keepalive=False, buffer_size=4096):
+		self.sock = socket.create_connection((host, int(port)), timeout)
+		self._timeout = timeout
+		if nodelay:
+			self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		if keepalive:
+			self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+		self._buffer = bytearray(buffer_size)
+		self._view = memoryview(self._buffer)
+		# Unread data is self._buffer[self._start:self._end].
+		self._start = 0
+		self._end = 0
+
+	def write(self, data):
+		self.sock.sendall(data)
+
+	def _take(self, end):
+		""" Return and consume the buffered bytes up to end """
+		data = bytes(self._view[self._start:end])
+		self._start = end
+		if self._start == self._end:
+			self._start = self._end = 0
+		return data
+
+	def _make_room(self):
+		if self._end < len(self._buffer):
+			return
+		if self._start:
+			# Move the unread bytes to the front.
+			length = self._end - self._start
+			self._view[:length] = self._view[self._start:self._end]
+			self._start, self._end = 0, length
+		else:
+			# A reply longer than the buffer; grow it.
+			self._view.release()
+			self._buffer.extend(bytearray(len(self._buffer)))
+			self._view = memoryview(self._buffer)
+
+	def _fill(self, timeout_s):
+		""" Receive more data. Returns False if nothing arrived before the timeout. """
+		self._make_room()
+		if timeout_s != self._timeout:
+			self.sock.settimeout(timeout_s)
+			self._timeout = timeout_s
+		try:
+			received = self.sock.recv_into(self._view[self._end:])
+		except (timeout, BlockingIOError):
+			return False
+		if not received:
+			raise EOFError("connection closed")
+		self._end += received
+		return True
+
+	def read_until(self, terminator, timeout_s=None):
+		"""
+		Read until terminator is found or timeout_s passes. On timeout whatever has
+		arrived is returned, like telnetlib.
+		"""
+		deadline = None if timeout_s is None else monotonic() + timeout_s
+		searched = self._start
+		while True:
+			index = self._buffer.find(terminator, searched, self._end)
+			if index >= 0:
+				return self._take(index + len(terminator))
+			searched = max(self._start, self._end - len(terminator) + 1)
+			before = self._start
+			remaining = None if deadline is None else deadline - monotonic()
+			if (remaining is not None and remaining <= 0) or not self._fill(remaining):
+				return self._take(self._end)
+			# Keep the search position valid if _fill moved the data.
+			searched -= before - self._start
+
+	def read_very_eager(self):
+		""" Return everything that can be read without blocking """
+		while self._fill(0):
+			pass
+		return self._take(self._end)
+
+	def read_some(self):
+		""" Return at least one byte, blocking if nothing is buffered """
+		if self._start == self._end:
+			self._fill(None)
+		return self._take(self._end)
+
+	def close(self):
+		self.sock.close()
+
+
 class ThermotronChamber():
 	"""
 	Class to connect to a 8800 controller on a Thermotron chamber
+	Pass a Command_Metrics.CommandMetrics as metrics to record every command, and a
+	Thermotron_Metadata.MetadataCache as metadata_cache to answer the static queries
+	(CNAM, CCNF, IDEN, VRSN) from memory or disk instead of the chamber.
+	With typed=True getters decode their replies (see REPLY_PARSERS) and raise
+	ThermotronError for error replies, instead of returning the raw string; operation
+	commands return None once the 8800 has carried them out.
+	The connection uses ThermotronSocket (TCP_NODELAY set unless nodelay is False);
+	use_telnetlib=True selects telnetlib.Telnet instead where it is still available.
+
+	With lazy_connect the chamber is not contacted until the first command. A chamber
+	that can't be reached doesn't stop the program: health becomes "offline", commands
+	raise ConnectionError, and connecting is retried on use with exponential backoff
+	(reconnect_backoff doubling up to reconnect_backoff_max seconds). A dropped
+	connection is reopened and the command retried once.
 	"""
-	def __init__(self, chamber_control_name, description = None, portNumber="8888", simulate=False):
+	def __init__(self, chamber_control_name, description = None, portNumber="8888", simulate=False,
+		terminator=TERMINATOR, command_timeout=1, metrics=None, options_ttl=60,
+		connect_timeout=1, nodelay=True, use_telnetlib=False, lazy_connect=False,
+		reconnect_backoff=0.5, reconnect_backoff_max=30, metadata_cache=None, typed=False):
 		self.chamber_control_name = chamber_control_name
 		self.portNumber = portNumber
 		self.description = description
 		self.simulate = simulate
+		self.terminator = terminator
+		self.command_timeout = command_timeout
+		self.metrics = metrics
+		self.metadata_cache = metadata_cache
+		self.typed = typed
+		self.connect_timeout = connect_timeout
+		self.nodelay = nodelay
+		if use_telnetlib and telnetlib is None:
+			raise ValueError("use_telnetlib=True, but telnetlib is not available in this python")
+		self.use_telnetlib = use_telnetlib
+		self.reconnect_backoff = reconnect_backoff
+		self.reconnect_backoff_max = reconnect_backoff_max
+		self.tn = None
+		self.health = "disconnected"
+		self.last_error = None
+		self._failures = 0
+		self._next_attempt = 0
+		# Last known options register, so read-modify-write option changes don't
+		# have to read it back every time.
+		self.options_ttl = options_ttl
+		self._options_cache = None
+		self._options_time = None
 		# Try and connect to the thermal chamber:
 		if self.simulate:
 			print("Simulating chamber for {}...".format(chamber_control_name))
@@ -18,23 +528,73 @@ class ThermotronChamber():
 			self.simul_ramp = 3
 			self.simul_temp_ramp = 0
 		else:
-			print("Trying to connect to {}...".format(chamber_control_name))
-			try:
-				self.tn = telnetlib.Telnet(host = chamber_control_name,
-	                port = portNumber,
-	                timeout = 1)
-				print("Successfully opened a terminal to {}".format(chamber_control_name))
-			except gaierror as e:
-				# print("\n".join(dir(e)))
-				print(e.strerror)
-				print("Could not locate that chamber name. Check network connection and/or thermal chamber name")
-				exit(1)
-			except timeout as e:
-				print("Failed to open a terminal to {}, connection timed out".format(chamber_control_name))
-				exit(1)
-			except ConnectionRefusedError as e:
-				print(e.strerror)
-				exit(1)
+			if not lazy_connect:
+				try:
+					self.connect()
+				except ConnectionError:
+					pass
+
+	def connect(self):
+		"""
+		Opens the connection to the chamber. On failure the reason is printed, health
+		becomes "offline" and ConnectionError is raised.
+		"""
+		print("Trying to connect to {}...".format(self.chamber_control_name))
+		try:
+			if self.use_telnetlib:
+				tn = telnetlib.Telnet(host = self.chamber_control_name,
+	                port = self.portNumber,
+	                timeout = self.connect_timeout)
+			else:
+				tn = ThermotronSocket(self.chamber_control_name, self.portNumber,
+					timeout = self.connect_timeout,
+					nodelay = self.nodelay)
+		except gaierror as e:
+			print(e.strerror)
+			print("Could not locate that chamber name. Check network connection and/or thermal chamber name")
+			self._connect_failed(e)
+		except timeout as e:
+			print("Failed to open a terminal to {}, connection timed out".format(self.chamber_control_name))
+			self._connect_failed(e)
+		except OSError as e:
+			print(e.strerror)
+			self._connect_failed(e)
+		print("Successfully opened a terminal to {}".format(self.chamber_control_name))
+		self.tn = tn
+		self.health = "connected"
+		self.last_error = None
+		self._failures = 0
+
+	def _connect_failed(self, error):
+		self.health = "offline"
+		self.last_error = error
+		self._next_attempt = monotonic() + min(
+			self.reconnect_backoff * 2 ** self._failures, self.reconnect_backoff_max)
+		self._failures += 1
+		raise ConnectionError("Could not connect to {}: {}".format(self.chamber_control_name, error))
+
+	def _drop_connection(self, error):
+		try:
+			self.tn.close()
+		except OSError:
+			pass
+		self.tn = None
+		self.health = "disconnected"
+		self.last_error = error
+
+	def _ensure_connected(self):
+		if self.tn is not None:
+			return
+		wait = self._next_attempt - monotonic()
+		if self.health == "offline" and wait > 0:
+			raise ConnectionError("{} is offline, next connection attempt in {:.1f}s: {}".format(
+				self.chamber_control_name, wait, self.last_error))
+		self.connect()
+
+	def close(self):
+		""" Close the connection; the next command reconnects """
+		if self.tn is not None:
+			self._drop_connection(None)
 
 	def __unicode__(self):
 		if self.description:
@@ -52,10 +612,153 @@ class ThermotronChamber():
 		# In case we haven't initiated a console to the chamber yet.
 		except AttributeError as e:
 			pass
+		except OSError as e:
+			pass
 
 	def __repr__(self):
 		return "<thermotron_ctrl {}>".format(self.__unicode__())
 
+	def _transact(self, command_string, timeout_s=None):
+		"""
+		Sends one command and returns its complete reply.
+		Reads until the 8800's line terminator or until the per-command deadline passes,
+		in which case socket.timeout is raised.
+		"""
+		reply = self.batch([command_string], timeout_s)[0]
+		if self.typed:
+			return parse_reply(command_string, reply)
+		return reply
+
+	def batch(self, command_strings, timeout_s=None):
+		"""
+		Sends all of the commands in a single write and returns their replies in order.
+		Each reply is read up to the terminator with the per-command deadline.
+		If a reply doesn't arrive in time, socket.timeout is raised and the connection
+		is closed, since a late (or lost) reply would otherwise be taken as the answer
+		to a later command; the next command reconnects.
+		"""
+		if timeout_s is None:
+			timeout_s = self.command_timeout
+		command_strings = [c if c.endswith("\r") else c + "\r" for c in command_strings]
+		if not command_strings:
+			return []
+		self._ensure_connected()
+		try:
+			return self._exchange(command_strings, timeout_s)
+		except timeout as e:
+			self._drop_connection(e)
+			raise
+		except (EOFError, OSError) as e:
+			# The connection dropped: reopen it and try once more.
+			self._drop_connection(e)
+		self._ensure_connected()
+		try:
+			return self._exchange(command_strings, timeout_s)
+		except (EOFError, OSError) as e:
+			self._drop_connection(e)
+			raise
+
+	def _exchange(self, command_strings, timeout_s):
+		metrics = self.metrics
+		if metrics is not None:
+			start = perf_counter()
+		replies = []
+		try:
+			self.tn.write("".join(command_strings).encode("ascii"))
+			for command_string in command_strings:
+				raw = self.tn.read_until(self.terminator, timeout_s)
+				if not raw.endswith(self.terminator):
+					raise timeout("No complete reply to {} from {} within {}s".format(
+						command_string.strip(), self.chamber_control_name, timeout_s))
+				reply = raw.decode("ascii").strip()
+				if metrics is not None:
+					# Replies the chamber rejected count as errors, whether or not typed
+					# mode goes on to raise for them.
+					error = None
+					if is_error_reply(command_string, reply):
+						error = ThermotronError(command_string.strip(), reply)
+					metrics.record(self.chamber_control_name, command_string[:4],
+						perf_counter() - start, len(command_string), len(raw), error)
+				replies.append(reply)
+		except (EOFError, OSError) as e:
+			if metrics is not None:
+				command_string = command_strings[len(replies)]
+				metrics.record(self.chamber_control_name, command_string[:4],
+					perf_counter() - start, len(command_string), 0, e)
+			raise
+		return replies
+
+	def _static_query(self, command_strings):
+		"""
+		Replies to queries that don't change while the controller does (CNAM, CCNF, IDEN,
+		VRSN), from metadata_cache where possible. Misses, and the IDEN/VRSN check when
+		the cache wants one, go to the chamber as a single batch.
+		"""
+		command_strings = [c.rstrip("\r") for c in command_strings]
+		replies = self._cached_replies(command_strings)
+		if self.typed:
+			return [parse_reply(c, reply) for c, reply in zip(command_strings, replies)]
+		return replies
+
+	def _cached_replies(self, command_strings):
+		cache = self.metadata_cache
+		if cache is None:
+			return self.batch(command_strings)
+		key = "{}:{}".format(self.chamber_control_name, self.portNumber)
+		checked = False
+		fresh = {}
+		while True:
+			hits, check = cache.lookup(key, command_strings)
+			hits.update(fresh)
+			send = [c for c in command_strings if c not in hits]
+			if check and not checked:
+				send = IDENTITY_COMMANDS + [c for c in send if c not in IDENTITY_COMMANDS]
+				checked = True
+			if not send:
+				return [hits[c] for c in command_strings]
+			fresh.update(zip(send, self.batch(send)))
+			# If the identity changed, the hits were dropped; go round for them again.
+			cache.store(key, dict((c, fresh[c]) for c in send if not is_error_reply(c, fresh[c])))
+
+	def get_metadata(self):
+		"""
+		Identification, version, names of channels 1-28 and configuration of channels 1-8
+		as {"iden", "version", "channel_names", "channel_config"}. All of it comes from
+		metadata_cache when cached, otherwise from one batch.
+		"""
+		if self.simulate:
+			return {"iden": 0, "version": 0, "channel_names": dict.fromkeys(range(1,29), 0),
+				"channel_config": dict.fromkeys(range(1,9), 0)}
+		replies = dict(zip(METADATA_COMMANDS, self._static_query(METADATA_COMMANDS)))
+		return {
+			"iden": replies["IDEN?"],
+			"version": replies["VRSN?"],
+			"channel_names": dict((channel, replies["CNAM{}?".format(channel)]) for channel in range(1,29)),
+			"channel_config": dict((channel, replies["CCNF{}?".format(channel)]) for channel in range(1,9)),
+			}
+
+	def _query_channels(self, mnemonic, channels, valid_channels):
+		"""
+		Batches a "<mnemonic><channel>?" query for every channel and returns a dict of
+		channel -> reply. Channels outside valid_channels map to None and are not sent.
+		"""
+		channels = list(channels)
+		to_send = [channel for channel in channels if channel in valid_channels]
+		command_strings = ["{}{}?".format(mnemonic, channel) for channel in to_send]
+		replies = self.batch(command_strings)
+		if self.typed:
+			replies = [parse_reply(c, reply) for c, reply in zip(command_strings, replies)]
+		result = dict.fromkeys(channels)
+		result.update(zip(to_send, replies))
+		return result
+
+	def query_array(self, command_strings, dtype=float, errors="raise"):
+		"""
+		Sends a batch of numeric queries and returns the replies as a numpy array,
+		converted in one step (see replies_to_array).
+		"""
+		return replies_to_array(self.batch(command_strings), dtype, errors)
+
 	def get_alarm_status(self, port):
 		"""
 		The 8800 returns the current alarm status for the selected channel
@@ -69,10 +772,7 @@ class ThermotronChamber():
 			print("Port number out of range.")
 			return 0
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 
 	def get_set_aux(self, aux_group, status_int=None):
@@ -89,10 +789,7 @@ class ThermotronChamber():
 		else:
 			command_string = "AUXE{0}\r".format(aux_group)
 		
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_channel_config_information(self, pvchannel):
 		"""
@@ -111,10 +808,7 @@ class ThermotronChamber():
 		else:
 			return None
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._static_query([command_string])[0]
 
 	def get_channel_on_and_configured_status(self):
 		"""
@@ -128,10 +822,7 @@ class ThermotronChamber():
 		if self.simulate:
 			return 0
 		command_string = "CHST?\r"
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_channel_name(self, channel):
 		"""
@@ -144,10 +835,7 @@ class ThermotronChamber():
 		else:
 			return None
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()		
+		return self._static_query([command_string])[0]		
 
 	def get_set_deviation(self, channel, deviation=None):
 		"""
@@ -163,11 +851,10 @@ class ThermotronChamber():
 			command_string = "DEVN{0},{1}\r".format(channel,deviation)
 		elif int(channel) in range(1,5):
 			command_string = "DEVN{0}?\r".format(channel)
+		else:
+			return 0
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def set_hold(self):
 		"""
@@ -176,8 +863,7 @@ class ThermotronChamber():
 		if self.simulate:
 			return 0
 		command_string = "HOLD\r"
-		self.tn.write(command_string.encode("ascii"))
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_iden(self):
 		"""
@@ -186,8 +872,7 @@ class ThermotronChamber():
 		if self.simulate:
 			return 0
 		command_string = "IDEN?\r"
-		self.tn.write(command_string.encode("ascii"))
-		return self.tn.read_some().decode("ascii").strip()
+		return self._static_query([command_string])[0]
 
 	def get_set_light(self, status=-1, Toggle = False):
 		"""
@@ -199,19 +884,14 @@ class ThermotronChamber():
 		if self.simulate:
 			return 0
 		if Toggle:
-			command_string = "LGHT?\r".format(int(status))
-			self.tn.write(command_string.encode("ascii"))
-			status = 1-int(self.tn.read_some().decode("ascii").strip())
+			status = 1-int(self._transact("LGHT?\r"))
 
 		if int(status) in [0, 1]:
 			command_string = "LGHT{}\r".format(int(status))
 		else:
 			command_string = "LGHT?\r".format(int(status))
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 	
 	def get_set_manual_ramp(self, channel, ramp=None):
 		"""
@@ -230,12 +910,11 @@ class ThermotronChamber():
 			command_string = "MRMP{},{}\r".format(channel,ramp)
 		elif channel in range(1,5):
 			command_string = "MRMP{}?\r".format(channel)
+		else:
+			return 0
 
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_set_options(self, option_int=-1):
 		"""
@@ -267,10 +946,60 @@ class ThermotronChamber():
 		else:
 			command_string = "OPTN?\r"
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		# Forget the cached register first, in case the command fails part way.
+		self.invalidate_options()
+		reply = self.batch([command_string])[0]
+		if command_string == "OPTN?\r":
+			self._cache_options(reply)
+		elif not is_error_reply(command_string, reply):
+			# After an error code the register is unknown.
+			self._cache_options(option_int)
+		if self.typed:
+			return parse_reply(command_string, reply)
+		return reply
+
+	def _cache_options(self, value):
+		try:
+			self._options_cache = int(value)
+		except ValueError:
+			return
+		self._options_time = monotonic()
+
+	def invalidate_options(self):
+		""" Forget the cached options register so the next read goes to the chamber """
+		self._options_cache = None
+		self._options_time = None
+
+	def get_options_register(self, refresh=False):
+		"""
+		Returns the options register as a ThermotronOptions, from the cache when it is
+		younger than options_ttl seconds.
+		"""
+		if self.simulate:
+			return ThermotronOptions(0)
+		if (refresh or self._options_cache is None
+			or monotonic() - self._options_time >= self.options_ttl):
+			self.get_set_options()
+		if self._options_cache is None:
+			raise ValueError("Could not read the options register of {}".format(self.chamber_control_name))
+		return ThermotronOptions(self._options_cache)
+
+	@contextmanager
+	def options(self):
+		"""
+		Change several options with a single OPTN write:
+
+			with chamber.options() as options:
+				options.ptc = False
+				options.humidity = True
+
+		Nothing is written if the block raises or leaves the register unchanged.
+		"""
+		before = self.get_options_register()
+		options = ThermotronOptions(before.value)
+		yield options
+		if options.value != before.value and not self.simulate:
+			self.get_set_options(options.value)
 
 	def get_set_parameter_group(self, parameter_group=None):
 		"""
@@ -287,10 +1016,7 @@ class ThermotronChamber():
 		else:
 			command_string = "PRMG?\r"
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_process_variable(self, pvchannel=None):
 		"""
@@ -312,10 +1038,42 @@ class ThermotronChamber():
 		else:
 			return
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
+
+	def get_process_variables(self, pvchannels=None):
+		"""
+		Reads many PVAR channels in one network round trip and returns a dict of
+		channel -> value. Defaults to every defined channel (see get_process_variable).
+		"""
+		if pvchannels is None:
+			pvchannels = PROCESS_VARIABLE_CHANNELS
+		if self.simulate:
+			return dict((channel, self.simul_temperature) for channel in pvchannels)
+		return self._query_channels("PVAR", pvchannels, range(1,49))
+
+	def get_setpoints(self, channels=range(1,5)):
+		"""
+		Reads the set points of many channels in one network round trip.
+		"""
+		if self.simulate:
+			return dict((channel, self.simul_temperature) for channel in channels)
+		return self._query_channels("SETP", channels, range(1,5))
+
+	def get_deviations(self, channels=range(1,5)):
+		"""
+		Reads the deviation of many channels in one network round trip.
+		"""
+		if self.simulate:
+			return dict((channel, 0) for channel in channels)
+		return self._query_channels("DEVN", channels, range(1,5))
+
+	def get_throttles(self, pvchannels=range(1,9)):
+		"""
+		Reads the throttle of many channels in one network round trip.
+		"""
+		if self.simulate:
+			return dict((channel, 0) for channel in pvchannels)
+		return self._query_channels("THTL", pvchannels, range(1,9))
 
 
 	def set_manual_run(self):
@@ -328,10 +1086,7 @@ class ThermotronChamber():
 			return 0
 
 		command_string = "RUNM\r"
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_stop_status(self):
 		"""
@@ -354,10 +1109,7 @@ class ThermotronChamber():
 			return 1
 
 		command_string = "SCOD?\r"
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_set_setpoint(self, channel, setpoint=None):
 		"""
@@ -382,10 +1134,7 @@ class ThermotronChamber():
 		else:
 			return 0
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def set_stop(self):
 		"""
@@ -395,10 +1144,7 @@ class ThermotronChamber():
 			return 0
 
 		command_string = "STOP\r"
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_throttle(self, pvchannel):
 		"""
@@ -413,10 +1159,7 @@ class ThermotronChamber():
 		else:
 			return 0
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def print_version(self):
 		"""
@@ -425,9 +1168,7 @@ class ThermotronChamber():
 		if self.simulate:
 			return 0
 
-		command_string = "VRSN?\r"
-		self.tn.write(command_string.encode("ascii"))
-		print(self.tn.read_some().decode("ascii").strip())
+		print(self._transact("VRSN?\r"))
 
 	def get_version(self):
 		"""
@@ -437,8 +1178,7 @@ class ThermotronChamber():
 			return 0
 
 		command_string = "VRSN?\r"
-		self.tn.write(command_string.encode("ascii"))
-		return self.tn.read_some().decode("ascii").strip()
+		return self._static_query([command_string])[0]
 
 	def get_set_final_value(self, channel, value=None):
 		"""
@@ -456,10 +1196,7 @@ class ThermotronChamber():
 		else:
 			return 0
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_loops_left(self, loops=None):
 		"""
@@ -476,10 +1213,7 @@ class ThermotronChamber():
 		else:
 			command_string = "LLFT?\r"
 			
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 
 	def get_time_left(self, time=None):
@@ -496,10 +1230,7 @@ class ThermotronChamber():
 		else:
 			command_string = "TLFT?\r"
 			
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()		
+		return self._transact(command_string)		
 
 
 	def set_resume(self):
@@ -510,10 +1241,7 @@ class ThermotronChamber():
 			return 0
 
 		command_string = "RESM\r"
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_set_programming_interval(self,
 		interval,
@@ -546,33 +1274,14 @@ class ThermotronChamber():
 		if self.simulate:
 			return 0
 
-		# it's easier to write aux on & off in binary from left to right
-		if auxg1: 
-			if len(auxg1) > 3:
-				auxg1 = int(auxg1[::-1],2)
-		if auxg2: 
-			if len(auxg2) > 3:
-				auxg2 = int(auxg2[::-1],2)
-
-
 		if int(interval) >= 0 and not (fv1 or fv2 or fv3 or fv4):
-			options_list=["{}?".format(interval)]
-		elif int(interval) >= 0:
-			if int(interval) > 0:
-				options_list = [interval,fv1,fv2,fv3,fv4,dv1,dv2,dv3,dv4,hr_min_sec,pgrp,lp,ni,
-				auxg1,auxg2,display_status_byte,options]
-			else:
-				options_list = [interval,fv1,fv2,fv3,fv4,channels]
-
-		config_str = ",".join([str(x) for x in options_list])
+			config_str = "{}?".format(interval)
+		else:
+			config_str = format_interval(interval, fv1, fv2, fv3, fv4, dv1, dv2, dv3, dv4, hr_min_sec,
+				pgrp, lp, ni, auxg1, auxg2, display_status_byte, options, channels)
 		command_string = "INTV{}".format(config_str)
 
-		print(command_string)
-
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def get_set_prog(self, prog_name="", intervals=None):
 		"""
@@ -597,47 +1306,105 @@ class ThermotronChamber():
 		else:
 			command_string = "PROGn?\r"
 
-		self.tn.write(command_string.encode("ascii"))
-		# Wait a tiny bit so that there is time for the value to set.
-		sleep(0.001)
-		return self.tn.read_some().decode("ascii").strip()
+		return self._transact(command_string)
 
 	def ptc_on(self):
 	    """
-	    Queries the chamber and turns on PTC control
+	    Turns on PTC control, using the cached options register if it is fresh
 	    """
-	    #PTC control is option 1
-	    options = int(self.get_set_options())
-	    if (options | 1) != options:
-	        #make sure humidity and altitude are off
-	        options = options & ~18
-	        self.get_set_options(options | 1)
+	    with self.options() as options:
+	        if not options.ptc:
+	            #make sure humidity and altitude are off
+	            options.humidity = False
+	            options.purge = False
+	            options.ptc = True
 
 	def ptc_off(self):
 	    """
-	    Queries the chamber and turns off PTC control
+	    Turns off PTC control, using the cached options register if it is fresh
 	    """
-	    #PTC control is option 1
-	    options = int(self.get_set_options())
-	    if (options & ~1) != options:
-	        self.get_set_options(options & ~1)
+	    with self.options() as options:
+	        options.ptc = False
 
 	def humidity_on(self):
 	    """
-	    Queries the chamber and turns on humidity
+	    Turns on humidity, using the cached options register if it is fresh
 	    """
-	    #Humidity is option 2
-	    options = int(self.get_set_options())
-	    if (options | 2) != options:
-	        #make sure PTC and altitude are off
-	        options = options & ~17
-	        self.get_set_options(options | 2)
+	    with self.options() as options:
+	        if not options.humidity:
+	            #make sure PTC and altitude are off
+	            options.ptc = False
+	            options.purge = False
+	            options.humidity = True
 
 	def humidity_off(self):
 	    """
-	    Queries the chamber and turns off humidity
+	    Turns off humidity, using the cached options register if it is fresh
 	    """
-	    #Humidity is option 2
-	    options = int(self.get_set_options())
-	    if (options & ~2) != options:
-	        self.get_set_options(options & ~2)
\ No newline at end of file
+	    with self.options() as options:
+	        options.humidity = False
+
+	def snapshot(self, timeout_s=None):
+		"""
+		Reads channel status, stop code, the alarms of ports 1-8, options and parameter
+		group in one round trip and returns them decoded as a ChamberStatus.
+		The options register read also refreshes the options cache.
+		"""
+		if self.simulate:
+			options = self._options_cache if self._options_cache is not None else 0
+			return ChamberStatus(str(self), [0, 1] + [0] * 8 + [options, 1], monotonic(), 0.0)
+		start = monotonic()
+		replies = self.batch(SNAPSHOT_COMMANDS, timeout_s)
+		end = monotonic()
+		self._cache_options(replies[10])
+		return ChamberStatus(str(self), replies, end, end - start)
+
+	def wait_until_stable(self, channel, tolerance, dwell, target=None, timeout_s=None,
+		min_interval=0.25, max_interval=30.0, on_sample=None):
+		"""
+		Blocks until process variable channel (1-4) has stayed within tolerance of target
+		for dwell seconds and returns the last reading. target defaults to the current
+		set point. Readings are spaced by StabilityTracker using the channel's manual
+		ramp rate; on_sample(channel, value) is called for each one. Raises timeout if
+		timeout_s passes first.
+
+		To wait on many chambers at once use Thermotron_Settling.SettlingMonitor.
+		"""
+		if target is None:
+			target = self.get_set_setpoint(channel)
+		ramp = 0 if self.simulate else self.get_set_manual_ramp(channel)
+		tracker = StabilityTracker(target, tolerance, dwell, float(ramp),
+			min_interval, max_interval)
+		deadline = None if timeout_s is None else monotonic() + timeout_s
+		while True:
+			value = self.get_process_variable(channel)
+			if on_sample is not None:
+				on_sample(channel, value)
+			stable, delay = tracker.update(value)
+			if stable:
+				return value
+			if deadline is not None:
+				remaining = deadline - monotonic()
+				if remaining <= 0:
+					raise timeout("{} channel {} did not settle within {}s".format(
+						self.chamber_control_name, channel, timeout_s))
+				delay = min(delay, remaining)
+			sleep(delay)
+
+
+def connect_all(chambers, max_workers=32):
+	"""
+	Connects many chambers in parallel, so start-up costs about one connect timeout no
+	matter how many chambers are offline. Returns {chamber name: health}.
+	"""
+	def connect(chamber):
+		if chamber.simulate or chamber.tn is not None:
+			return
+		try:
+			chamber.connect()
+		except ConnectionError:
+			pass
+	chambers = list(chambers)
+	with ThreadPoolExecutor(max_workers=max_workers) as pool:
+		list(pool.map(connect, chambers))
+	return dict((str(chamber), "simulated" if chamber.simulate else chamber.health) for chamber in chambers)
@@ -0,0 +1,391 @@
+"""
+Stand-in for a Thermotron 8800 controller, served over TCP.
+
+Speaks the same command set as ThermotronChamber, so the real client code can be
+pointed at it for testing and benchmarking:
+
+	python Thermotron_Emulator.py --port 8888 --latency 0.002 --jitter 0.001
+
+or from a script:
+
+	emulator = ThermotronEmulator(port=0)
+	port = emulator.start_in_thread()
+	chamber = ThermotronChamber("127.0.0.1", portNumber=port)
+"""
+import argparse
+import asyncio
+import random
+import threading
+from time import monotonic
+
+from Thermotron_Control import ERROR_REPLY, SUCCESS_REPLY
+
+FAULTS = ("drop", "garble", "split", "stall", "disconnect")
+
+
+class ThermalChannel():
+	"""
+	One controlled channel. While the chamber runs, the process variable moves toward
+	the set point at the manual ramp rate (units per minute).
+	"""
+	def __init__(self, value, max_rate=10.0):
+		self.pv = value
+		self.setpoint = value
+		self.ramp = 0.0
+		self.deviation = 2.0
+		self.final_value = value
+		self.max_rate = max_rate
+
+	def advance(self, minutes):
+		rate = self.ramp if self.ramp > 0 else self.max_rate
+		step = rate * minutes
+		error = self.setpoint - self.pv
+		if abs(error) <= step:
+			self.pv = self.setpoint
+		else:
+			self.pv += step if error > 0 else -step
+
+	@property
+	def throttle(self):
+		""" Crude proportional output, -100% to 100% """
+		return max(-100.0, min(100.0, (self.setpoint - self.pv) * 10.0))
+
+
+class ThermotronEmulator():
+	"""
+	Simulated 8800 with a simple thermal ramp model, configurable reply latency and
+	jitter, and injectable faults.
+
+	Faults are drawn at random per reply from fault_rates ({fault: probability}), or
+	forced with inject(fault, count). Faults:
+		drop        no reply is sent
+		garble      the reply is replaced with junk
+		split       the reply is sent in two separate writes
+		stall       the reply is delayed by stall_time seconds
+		disconnect  the connection is closed instead of replying
+	"""
+	def __init__(self, host="127.0.0.1", port=8888, latency=0.0, jitter=0.0, ambient=25.0,
+		fault_rates=None, stall_time=2.0, seed=None):
+		self.host = host
+		self.port = port
+		self.latency = latency
+		self.jitter = jitter
+		self.ambient = ambient
+		self.fault_rates = dict(fault_rates or {})
+		self.stall_time = stall_time
+		self.random = random.Random(seed)
+		self._forced_faults = []
+		self.commands_served = 0
+		self.connections = 0
+		self.channels = dict((channel, ThermalChannel(ambient)) for channel in range(1,5))
+		self.running = False
+		self.hold = False
+		self.stop_code = 0
+		self.options = 0
+		self.parameter_group = 1
+		self.light = 0
+		self.aux = {1: 0, 2: 0}
+		self.loops_left = 0
+		self.time_left = "00:00:00"
+		self.iden = "Thermotron 8800 emulator"
+		self.version = "1.0"
+		self.channel_names = dict((channel, "CHANNEL {}".format(channel)) for channel in range(1,29))
+		self.channel_names[1] = "TEMP"
+		self.channel_names[2] = "HUMIDITY"
+		self.channel_types = {1: 2, 2: 1, 3: 5, 4: 0, 5: 0, 6: 0, 7: 0, 8: 0}
+		self.programs = {}
+		self._loading_program = None
+		self.alarms = dict.fromkeys(range(1,9), 0)
+		self._last_update = monotonic()
+		self._server = None
+		self._loop = None
+		self._thread = None
+		self._handlers = {}
+
+	def inject(self, fault, count=1):
+		""" Force the next count replies to have the given fault """
+		if fault not in FAULTS:
+			raise ValueError("Unknown fault {}".format(fault))
+		self._forced_faults.extend([fault] * count)
+
+	def _update(self):
+		now = monotonic()
+		minutes = (now - self._last_update) / 60.0
+		self._last_update = now
+		if self.running and not self.hold:
+			for channel in self.channels.values():
+				channel.advance(minutes)
+
+	def _next_fault(self):
+		if self._forced_faults:
+			return self._forced_faults.pop(0)
+		for fault, rate in self.fault_rates.items():
+			if rate and self.random.random() < rate:
+				return fault
+		return None
+
+	def respond(self, command):
+		"""
+		Carry out one command (without its terminator) and return the reply text.
+		"""
+		self._update()
+		self.commands_served += 1
+		command = command.strip()
+		mnemonic, argument = command[:4].upper(), command[4:]
+		query = argument.endswith("?")
+		if query:
+			argument = argument[:-1]
+		args = argument.split(",") if argument else []
+		handler = getattr(self, "_cmd_" + mnemonic, None)
+		if handler is None:
+			return ERROR_REPLY
+		try:
+			reply = handler(query, args)
+		except (ValueError, IndexError, KeyError):
+			return ERROR_REPLY
+		return SUCCESS_REPLY if reply is None else str(reply)
+
+	def _channel(self, args, valid=range(1,5)):
+		channel = int(args[0])
+		if channel not in valid:
+			raise ValueError(channel)
+		return channel
+
+	def _cmd_PVAR(self, query, args):
+		channel = self._channel(args, range(1,49))
+		if channel in self.channels:
+			return "{:.1f}".format(self.channels[channel].pv)
+		return "{:.1f}".format(self.ambient)
+
+	def _cmd_SETP(self, query, args):
+		channel = self.channels[self._channel(args)]
+		if query:
+			return "{:.1f}".format(channel.setpoint)
+		channel.setpoint = float(args[1])
+
+	def _cmd_DEVN(self, query, args):
+		channel = self.channels[self._channel(args)]
+		if query:
+			return "{:.1f}".format(channel.deviation)
+		channel.deviation = float(args[1])
+
+	def _cmd_MRMP(self, query, args):
+		channel = self.channels[self._channel(args)]
+		if query:
+			return "{:.1f}".format(channel.ramp)
+		channel.ramp = float(args[1])
+
+	def _cmd_FVAL(self, query, args):
+		channel = self.channels[self._channel(args)]
+		if query:
+			return "{:.1f}".format(channel.final_value)
+		channel.final_value = float(args[1])
+
+	def _cmd_THTL(self, query, args):
+		channel = self._channel(args, range(1,9))
+		if channel in self.channels:
+			return "{:.1f}".format(self.channels[channel].throttle)
+		return "0.0"
+
+	def _cmd_ALRM(self, query, args):
+		return self.alarms[self._channel(args, range(1,9))]
+
+	def _cmd_CCNF(self, query, args):
+		return self.channel_types[self._channel(args, range(1,9))]
+
+	def _cmd_CNAM(self, query, args):
+		return self.channel_names[self._channel(args, range(1,29))]
+
+	def _cmd_CHST(self, query, args):
+		configured = sum(1 << (channel - 1) for channel, kind in self.channel_types.items() if kind)
+		on = configured if self.running else 0
+		return on | (configured << 8)
+
+	def _cmd_SCOD(self, query, args):
+		return 1 if self.running else self.stop_code
+
+	def _cmd_OPTN(self, query, args):
+		if query:
+			return self.options
+		options = int(args[0])
+		if options not in range(0,1024):
+			raise ValueError(options)
+		self.options = options
+
+	def _cmd_PRMG(self, query, args):
+		if query:
+			return self.parameter_group
+		group = int(args[-1])
+		if group not in range(1,5):
+			raise ValueError(group)
+		self.parameter_group = group
+
+	def _cmd_LGHT(self, query, args):
+		if query:
+			return self.light
+		self.light = int(args[0])
+
+	def _cmd_AUXE(self, query, args):
+		group = int(args[0])
+		if len(args) > 1:
+			self.aux[group] = int(float(args[1]))
+			return None
+		return self.aux[group]
+
+	def _cmd_LLFT(self, query, args):
+		if query:
+			return self.loops_left
+		self.loops_left = int(args[0])
+
+	def _cmd_TLFT(self, query, args):
+		if query:
+			return self.time_left
+		self.time_left = args[0]
+
+	def _cmd_IDEN(self, query, args):
+		return self.iden
+
+	def _cmd_VRSN(self, query, args):
+		return self.version
+
+	def _cmd_RUNM(self, query, args):
+		self.running, self.hold = True, False
+
+	def _cmd_HOLD(self, query, args):
+		if not self.running:
+			raise ValueError("not running")
+		self.hold = True
+
+	def _cmd_RESM(self, query, args):
+		self.hold = False
+
+	def _cmd_STOP(self, query, args):
+		self.running, self.hold = False, False
+		self.stop_code = 5
+
+	def _cmd_PROG(self, query, args):
+		if query:
+			program = self.programs[args[0]]
+			self._loading_program = args[0]
+			return "{},{}".format(args[0], len(program) - 1)
+		name, intervals = args[0], int(args[1])
+		self.programs[name] = [""] * (intervals + 1)
+		self._loading_program = name
+
+	def _cmd_INTV(self, query, args):
+		program = self.programs[self._loading_program]
+		interval = int(args[0])
+		if query:
+			return program[interval] or ERROR_REPLY
+		program[interval] = ",".join(args)
+
+	async def _handle(self, reader, writer):
+		self.connections += 1
+		task = asyncio.current_task()
+		self._handlers[task] = writer
+		try:
+			while True:
+				try:
+					line = await reader.readuntil(b"\r")
+				except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+					return
+				reply = self.respond(line.decode("ascii", "replace"))
+				fault = self._next_fault()
+				delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+				if fault == "stall":
+					delay += self.stall_time
+				if delay:
+					await asyncio.sleep(delay)
+				if fault == "drop":
+					continue
+				if fault == "disconnect":
+					return
+				if fault == "garble":
+					reply = "".join(self.random.choice("#@!~") for c in reply or "x")
+				data = (reply + "\r\n").encode("ascii")
+				if fault == "split":
+					writer.write(data[:len(data) // 2])
+					await writer.drain()
+					await asyncio.sleep(0.001)
+					data = data[len(data) // 2:]
+				writer.write(data)
+				await writer.drain()
+		finally:
+			del self._handlers[task]
+			writer.close()
+
+	async def start(self):
+		""" Start serving on the current event loop. Returns the bound port. """
+		self._loop = asyncio.get_event_loop()
+		self._server = await asyncio.start_server(self._handle, self.host, self.port)
+		self.port = self._server.sockets[0].getsockname()[1]
+		return self.port
+
+	async def serve_forever(self):
+		if self._server is None:
+			await self.start()
+		async with self._server:
+			await self._server.serve_forever()
+
+	def start_in_thread(self):
+		"""
+		Run the emulator on its own event loop in a daemon thread, for use with the
+		blocking ThermotronChamber client. Returns the bound port.
+		"""
+		started = threading.Event()
+		def run():
+			loop = asyncio.new_event_loop()
+			asyncio.set_event_loop(loop)
+			loop.run_until_complete(self.start())
+			started.set()
+			loop.run_forever()
+			loop.close()
+		self._thread = threading.Thread(target=run, daemon=True)
+		self._thread.start()
+		started.wait()
+		return self.port
+
+	async def _shutdown(self):
+		self._server.close()
+		# Closing the connections ends each handler at its next read.
+		for writer in list(self._handlers.values()):
+			writer.close()
+		if self._handlers:
+			await asyncio.wait(list(self._handlers), timeout=1)
+
+	def stop(self):
+		""" Stop a server started with start_in_thread """
+		if self._loop is not None and self._server is not None:
+			asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+			self._loop.call_soon_threadsafe(self._loop.stop)
+			self._thread.join()
+			self._server = None
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Thermotron 8800 controller emulator")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8888)
+	parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every reply")
+	parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per reply")
+	parser.add_argument("--fault", action="append", default=[], metavar="NAME=RATE",
+		help="random fault rate, e.g. drop=0.01 (faults: {})".format(", ".join(FAULTS)))
+	parser.add_argument("--seed", type=int)
+	args = parser.parse_args()
+	fault_rates = {}
+	for fault in args.fault:
+		name, rate = fault.split("=")
+		if name not in FAULTS:
+			parser.error("unknown fault {}".format(name))
+		fault_rates[name] = float(rate)
+	emulator = ThermotronEmulator(args.host, args.port, args.latency, args.jitter,
+		fault_rates=fault_rates, seed=args.seed)
+	print("Emulating a Thermotron 8800 on {}:{}".format(args.host, args.port))
+	try:
+		asyncio.run(emulator.serve_forever())
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,276 @@
+"""
+Shares 8800 controllers between many local clients.
+
+An 8800 serves one session at a time. The gateway holds that session and listens on
+a local port per chamber, speaking the same line protocol, so any number of
+ThermotronChamber or AsyncThermotronChamber clients can be pointed at it instead of
+the chamber:
+
+	python Thermotron_Gateway.py --route 9001=chamber1:8888 --route 9002=chamber2:8888
+
+	chamber = ThermotronChamber("127.0.0.1", portNumber=9001)
+
+Commands are passed on in the order they arrive. Identical queries (e.g. PVAR1?) that
+arrive while the same query is already on its way to the chamber are answered from
+that one transaction. A write is never merged, and queries arriving after a write
+always get a fresh answer. Sending GATEWAY? returns the chamber's statistics as JSON.
+"""
+import argparse
+import asyncio
+import json
+import threading
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+from Thermotron_Control import ERROR_REPLY, is_query
+
+# Answered by the gateway itself with ChamberSession.stats() as JSON.
+STATS_COMMAND = "GATEWAY?"
+
+
+class ChamberSession():
+	"""
+	The gateway's single upstream session to one chamber.
+	"""
+	def __init__(self, chamber_control_name, portNumber="8888", timeout=1, max_in_flight=16):
+		self.upstream = AsyncThermotronChamber(chamber_control_name, portNumber=portNumber,
+			timeout=timeout, max_in_flight=max_in_flight)
+		self.clients = 0
+		self.requests = 0
+		self.upstream_requests = 0
+		self.merged = 0
+		self.errors = 0
+		self.peak_queue_depth = 0
+		self._outstanding = 0
+		self._inflight = {}
+		self._connecting = None
+
+	def __str__(self):
+		return str(self.upstream)
+
+	@property
+	def merge_ratio(self):
+		""" Fraction of client requests answered by another request's transaction """
+		return self.merged / float(self.requests) if self.requests else 0.0
+
+	@property
+	def queue_depth(self):
+		"""
+		Commands waiting for the chamber: sent and not yet answered, or queued
+		behind max_in_flight others.
+		"""
+		return self._outstanding
+
+	def stats(self):
+		return {
+			"chamber": str(self),
+			"connected": self.upstream.connected,
+			"clients": self.clients,
+			"requests": self.requests,
+			"upstream_requests": self.upstream_requests,
+			"merged": self.merged,
+			"merge_ratio": self.merge_ratio,
+			"errors": self.errors,
+			"queue_depth": self.queue_depth,
+			"peak_queue_depth": self.peak_queue_depth,
+			}
+
+	async def request(self, command):
+		"""
+		Answer one client command. Returns the reply, or None for an empty line.
+		"""
+		command = command.strip()
+		if not command:
+			return None
+		if command == STATS_COMMAND:
+			return json.dumps(self.stats(), sort_keys=True)
+		self.requests += 1
+		if not is_query(command):
+			# Answers already on their way may predate this write, so later queries
+			# must not share them.
+			self._inflight.clear()
+			return await self._send(command)
+		future = self._inflight.get(command)
+		if future is not None:
+			self.merged += 1
+		else:
+			future = asyncio.ensure_future(self._send(command))
+			self._inflight[command] = future
+			future.add_done_callback(lambda done: self._inflight.get(command) is done
+				and self._inflight.pop(command))
+		# Shielded so one client going away doesn't cancel the others' answer.
+		return await asyncio.shield(future)
+
+	async def _connect(self):
+		if self._connecting is None:
+			self._connecting = asyncio.ensure_future(self.upstream.connect())
+		try:
+			await asyncio.shield(self._connecting)
+		finally:
+			self._connecting = None
+
+	async def _send(self, command):
+		self._outstanding += 1
+		self.peak_queue_depth = max(self.peak_queue_depth, self._outstanding)
+		try:
+			if not self.upstream.connected:
+				await self._connect()
+			self.upstream_requests += 1
+			return await self.upstream.command(command)
+		except (asyncio.TimeoutError, OSError):
+			self.errors += 1
+			# Replies still owed on this session can't be matched to requests any
+			# more; start over with a new session on the next command. The client
+			# gets ERROR_REPLY, as for a command the chamber couldn't carry out.
+			await self.upstream.close()
+			return ERROR_REPLY
+		finally:
+			self._outstanding -= 1
+
+	async def close(self):
+		await self.upstream.close()
+
+
+class ThermotronGateway():
+	"""
+	Serves routes {listen port: (chamber name, chamber port)} on host. Listen port 0
+	picks a free port; the bound ports are in ports after start().
+	"""
+	def __init__(self, routes, host="127.0.0.1", timeout=1, max_in_flight=16):
+		self.host = host
+		self.routes = dict(routes)
+		self.sessions = dict((listen_port, ChamberSession(name, portNumber, timeout, max_in_flight))
+			for listen_port, (name, portNumber) in self.routes.items())
+		self.ports = {}
+		self._servers = []
+		self._handlers = {}
+		self._loop = None
+		self._thread = None
+
+	def stats(self):
+		""" {chamber: ChamberSession.stats()} """
+		return dict((str(session), session.stats()) for session in self.sessions.values())
+
+	async def _handle(self, session, reader, writer):
+		task = asyncio.current_task()
+		self._handlers[task] = writer
+		session.clients += 1
+		replies = asyncio.Queue()
+		sender = asyncio.ensure_future(self._send_replies(writer, replies))
+		try:
+			while True:
+				try:
+					line = await reader.readuntil(b"\r")
+				except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError):
+					break
+				# Requests run concurrently; replies go back in the client's order.
+				await replies.put(asyncio.ensure_future(session.request(line.decode("ascii", "replace"))))
+		finally:
+			await replies.put(None)
+			await sender
+			session.clients -= 1
+			del self._handlers[task]
+			writer.close()
+
+	async def _send_replies(self, writer, replies):
+		while True:
+			request = await replies.get()
+			if request is None:
+				return
+			reply = await request
+			if reply is None:
+				continue
+			try:
+				writer.write((reply + "\r\n").encode("ascii"))
+				await writer.drain()
+			except OSError:
+				pass
+
+	async def start(self):
+		""" Start serving on the current event loop. Returns {chamber: bound port}. """
+		self._loop = asyncio.get_event_loop()
+		for listen_port, session in self.sessions.items():
+			server = await asyncio.start_server(
+				lambda reader, writer, session=session: self._handle(session, reader, writer),
+				self.host, listen_port)
+			self._servers.append(server)
+			self.ports[str(session)] = server.sockets[0].getsockname()[1]
+		return self.ports
+
+	async def serve_forever(self):
+		if not self._servers:
+			await self.start()
+		await asyncio.gather(*[server.serve_forever() for server in self._servers])
+
+	def start_in_thread(self):
+		"""
+		Run the gateway on its own event loop in a daemon thread. Returns {chamber: bound port}.
+		"""
+		started = threading.Event()
+		def run():
+			loop = asyncio.new_event_loop()
+			asyncio.set_event_loop(loop)
+			loop.run_until_complete(self.start())
+			started.set()
+			loop.run_forever()
+			loop.close()
+		self._thread = threading.Thread(target=run, daemon=True)
+		self._thread.start()
+		started.wait()
+		return self.ports
+
+	async def _shutdown(self):
+		for server in self._servers:
+			server.close()
+		# Closing the connections ends each handler at its next read.
+		for writer in list(self._handlers.values()):
+			writer.close()
+		if self._handlers:
+			await asyncio.wait(list(self._handlers), timeout=1)
+		for session in self.sessions.values():
+			await session.close()
+		self._servers = []
+
+	def stop(self):
+		""" Stop a gateway started with start_in_thread """
+		if self._loop is not None and self._servers:
+			asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+			self._loop.call_soon_threadsafe(self._loop.stop)
+			self._thread.join()
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Share 8800 controllers between many clients")
+	parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+	parser.add_argument("--route", action="append", required=True, metavar="PORT=CHAMBER[:PORT]",
+		help="listen on PORT for CHAMBER, e.g. 9001=chamber1:8888 (repeatable)")
+	parser.add_argument("--timeout", type=float, default=1.0, help="seconds to wait for a chamber reply")
+	parser.add_argument("--report-interval", type=float, default=0, help="print statistics every this many seconds")
+	args = parser.parse_args()
+	routes = {}
+	for route in args.route:
+		listen_port, _, chamber = route.partition("=")
+		name, _, port = chamber.partition(":")
+		routes[int(listen_port)] = (name, port or "8888")
+	gateway = ThermotronGateway(routes, args.host, args.timeout)
+
+	async def run():
+		ports = await gateway.start()
+		for chamber, port in sorted(ports.items()):
+			print("Serving {} on {}:{}".format(chamber, args.host, port))
+		if args.report_interval:
+			async def report():
+				while True:
+					await asyncio.sleep(args.report_interval)
+					for stats in gateway.stats().values():
+						print("{chamber}: {requests} requests, merge ratio {merge_ratio:.2f}, "
+							"queue depth {queue_depth} (peak {peak_queue_depth}), {errors} errors".format(**stats))
+			asyncio.ensure_future(report())
+		await gateway.serve_forever()
+	try:
+		asyncio.run(run())
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
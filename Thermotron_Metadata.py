@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+from time import time
+
+from Thermotron_Control import IDENTITY_COMMANDS
+
+
+class MetadataCache():
+	"""
+	Read-through cache of replies to static queries (CNAM, CCNF, IDEN, VRSN), in memory
+	and in a JSON file shared by every tool on the machine.
+
+	Entries are keyed by chamber address ("host:port"). An entry is trusted for max_age
+	seconds; after that the chamber's IDEN and VRSN are read again along with the next
+	cache miss (or on their own), and if either changed the entry is thrown away.
+	Replies are only ever stored after a chamber sent them, so an unreachable chamber
+	never leaves anything behind.
+
+	Pass one instance to any number of chambers:
+		cache = MetadataCache("~/.thermotron_metadata.json")
+		chamber = ThermotronChamber("chamber1", lazy_connect=True, metadata_cache=cache)
+		names = chamber.get_metadata()["channel_names"]  # no traffic once cached
+	"""
+	def __init__(self, path=None, max_age=86400):
+		self.path = None if path is None else os.path.expanduser(path)
+		self.max_age = max_age
+		self._entries = {}
+		self._dirty = set()
+		self._lock = threading.Lock()
+		self.load()
+
+	def load(self):
+		""" Read the cache file, if there is one. Unreadable files are ignored. """
+		if self.path is None:
+			return
+		try:
+			with open(self.path) as f:
+				entries = json.load(f).get("chambers", {})
+		except (IOError, OSError, ValueError):
+			return
+		with self._lock:
+			entries.update((key, self._entries[key]) for key in self._dirty)
+			self._entries = entries
+
+	def save(self):
+		"""
+		Write the entries changed here to the cache file, keeping entries other
+		processes wrote in the meantime.
+		"""
+		if self.path is None:
+			return
+		with self._lock:
+			if not self._dirty:
+				return
+			try:
+				with open(self.path) as f:
+					entries = json.load(f).get("chambers", {})
+			except (IOError, OSError, ValueError):
+				entries = {}
+			for key in self._dirty:
+				entries[key] = self._entries[key]
+			temporary = "{}.{}.tmp".format(self.path, os.getpid())
+			with open(temporary, "w") as f:
+				json.dump({"chambers": entries}, f, indent=1, sort_keys=True)
+			# Readers see either the old or the new file, never half of one.
+			os.replace(temporary, self.path)
+			self._dirty = set()
+
+	def lookup(self, key, commands):
+		"""
+		Returns ({command: reply} for the cached commands, True if the identity of the
+		chamber is due to be checked).
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return {}, True
+			values = entry["values"]
+			hits = dict((command, values[command]) for command in commands if command in values)
+			return hits, time() - entry["checked"] > self.max_age
+
+	def store(self, key, replies):
+		"""
+		Add replies ({command: reply}) from the chamber. If they include IDEN or VRSN and
+		either differs from the cached one, everything else cached for the chamber is
+		dropped. Returns True when that happened.
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			changed = False
+			if entry is None:
+				entry = self._entries[key] = {"checked": 0, "values": {}}
+			elif any(command in replies and command in entry["values"]
+				and entry["values"][command] != replies[command] for command in IDENTITY_COMMANDS):
+				entry["values"] = {}
+				changed = True
+			if all(command in replies for command in IDENTITY_COMMANDS):
+				entry["checked"] = time()
+			entry["values"].update(replies)
+			self._dirty.add(key)
+		self.save()
+		return changed
+
+	def invalidate(self, key=None):
+		""" Forget one chamber, or every chamber """
+		with self._lock:
+			keys = list(self._entries) if key is None else [key]
+			for key in keys:
+				if key in self._entries:
+					self._entries[key] = {"checked": 0, "values": {}}
+					self._dirty.add(key)
+		self.save()
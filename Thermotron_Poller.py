@@ -0,0 +1,113 @@
+import asyncio
+from collections import namedtuple
+from time import monotonic
+
+
+# One reading. tick is the cadence slot the reading belongs to and timestamp is
+# the monotonic time the reply arrived, so readings from the same tick are
+# aligned across chambers.
+Sample = namedtuple("Sample", ["tick", "timestamp", "chamber", "channel", "value"])
+
+
+class ThermotronPoller():
+	"""
+	Polls a set of PVAR channels from many chambers concurrently on a fixed cadence.
+
+	Every tick, each chamber gets one pipelined read of all channels. A chamber that
+	has not answered by the next tick is abandoned for that tick and counted as a
+	miss; ticks that start late because the loop was blocked are skipped, not queued.
+
+	Usage:
+		chambers = [AsyncThermotronChamber(name) for name in names]
+		poller = ThermotronPoller(chambers, channels=[1, 2], interval=1.0, on_sample=store)
+		await poller.run()
+	"""
+	def __init__(self, chambers, channels=(1,), interval=1.0, on_sample=None, on_miss=None, on_error=None):
+		self.chambers = list(chambers)
+		self.channels = list(channels)
+		self.interval = interval
+		self.on_sample = on_sample
+		self.on_miss = on_miss
+		self.on_error = on_error
+		self.ticks = 0
+		self.missed_ticks = 0
+		self.missed_reads = 0
+		self.errors = 0
+		self._running = False
+
+	async def _connect(self, chamber):
+		if not chamber.connected:
+			await chamber.connect()
+
+	async def _read(self, tick, chamber):
+		await self._connect(chamber)
+		values = await chamber.get_process_variables(self.channels)
+		timestamp = monotonic()
+		return [Sample(tick, timestamp, str(chamber), channel, value) for channel, value in values.items()]
+
+	async def poll_once(self, tick=0, deadline=None):
+		"""
+		Reads every chamber once and returns the list of samples.
+		Chambers still busy at the deadline (monotonic time) are cancelled, counted as misses
+		and disconnected, to be reconnected on the next tick.
+		"""
+		tasks = [asyncio.ensure_future(self._read(tick, chamber)) for chamber in self.chambers]
+		timeout = None if deadline is None else max(deadline - monotonic(), 0)
+		done, pending = await asyncio.wait(tasks, timeout=timeout)
+		for task in pending:
+			task.cancel()
+		self.missed_reads += len(pending)
+		samples = []
+		for chamber, task in zip(self.chambers, tasks):
+			if task not in done:
+				# The abandoned replies would still be owed on this connection and
+				# answer the next tick's reads; start the next tick on a new one.
+				await chamber.close()
+				continue
+			if task.exception() is not None:
+				self.errors += 1
+				if self.on_error:
+					self.on_error(chamber, task.exception())
+				# Drop the connection so the next tick starts from a clean one.
+				await chamber.close()
+				continue
+			samples.extend(task.result())
+		return samples
+
+	async def run(self, ticks=None):
+		"""
+		Polls until stop() is called, or for the given number of ticks.
+		"""
+		self._running = True
+		start = monotonic()
+		tick = 0
+		try:
+			while self._running and (ticks is None or self.ticks < ticks):
+				target = start + tick * self.interval
+				late = monotonic() - target
+				if late >= self.interval:
+					# We missed one or more whole slots; skip to the current one.
+					skipped = int(late // self.interval)
+					self.missed_ticks += skipped
+					if self.on_miss:
+						self.on_miss(tick, late)
+					tick += skipped
+					continue
+				if late < 0:
+					await asyncio.sleep(-late)
+				samples = await self.poll_once(tick, target + self.interval)
+				self.ticks += 1
+				if self.on_sample:
+					self.on_sample(samples)
+				tick += 1
+		finally:
+			self._running = False
+
+	def stop(self):
+		""" Stop after the current tick """
+		self._running = False
+
+	async def close(self):
+		""" Close every chamber connection """
+		for chamber in self.chambers:
+			await chamber.close()
@@ -0,0 +1,244 @@
+import csv
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from Thermotron_Control import format_interval
+from Thermotron_Program import ThermotronProgram
+
+
+# Default (low, high) limits per channel; None means the channel is not checked.
+DEFAULT_LIMITS = {1: (-73.0, 177.0), 2: (0.0, 100.0), 3: None, 4: None}
+
+# Fields a profile step may have. fv1 and time are required.
+STEP_FIELDS = ("fv1", "fv2", "fv3", "fv4", "dv1", "dv2", "dv3", "dv4", "time",
+	"pgrp", "lp", "ni", "auxg1", "auxg2", "display_status_byte", "options")
+
+
+class ProfileError(ValueError):
+	"""
+	Raised when a profile fails validation. problems lists every
+	(profile index, step index, message) found, not just the first.
+	"""
+	def __init__(self, problems):
+		self.problems = problems
+		lines = ["profile {} step {}: {}".format(*problem) for problem in problems[:20]]
+		if len(problems) > 20:
+			lines.append("... and {} more".format(len(problems) - 20))
+		ValueError.__init__(self, "\n".join(lines))
+
+
+def load_csv(path_or_file):
+	"""
+	Reads ramp/soak steps from a CSV file with a header row naming STEP_FIELDS columns,
+	e.g. "fv1,fv2,time,auxg1". Returns a list of dicts.
+	"""
+	if hasattr(path_or_file, "read"):
+		return [dict((k.strip(), v.strip()) for k, v in row.items() if k) for row in csv.DictReader(path_or_file)]
+	with open(path_or_file) as f:
+		return load_csv(f)
+
+
+def parse_time(text):
+	""" Seconds in a "hh:mm:ss" string, or None if it isn't one """
+	parts = str(text).strip().split(":")
+	if len(parts) != 3 or not all(part.isdigit() for part in parts):
+		return None
+	hours, minutes, seconds = [int(part) for part in parts]
+	if minutes > 59 or seconds > 59:
+		return None
+	return hours * 3600 + minutes * 60 + seconds
+
+
+def parse_aux(value):
+	"""
+	Aux group as an integer. Strings longer than 3 characters are binary with aux 1 (or 9)
+	on the left, as accepted by get_set_programming_interval. Returns None if unparseable.
+	"""
+	if value is None or value == "":
+		return 0
+	text = str(value).strip()
+	try:
+		if len(text) > 3:
+			return int(text[::-1], 2)
+		return int(text)
+	except ValueError:
+		return None
+
+
+def _number(value):
+	if value is None or value == "":
+		return float("nan")
+	try:
+		return float(value)
+	except ValueError:
+		return None
+
+
+def _format_number(value):
+	if value != value:
+		return ""
+	if value == int(value):
+		return str(int(value))
+	return repr(value)
+
+
+def _columns(profiles, starts):
+	"""
+	Flattens all steps of all profiles into columns. Returns the columns and the
+	problems found while converting text.
+	"""
+	problems = []
+	owner, row, final, previous, seconds, aux = [], [], [], [], [], []
+	for p, (steps, start) in enumerate(zip(profiles, starts)):
+		last = [_number(start.get("fv{}".format(c))) for c in range(1,5)]
+		for s, step in enumerate(steps):
+			values = []
+			for c in range(1,5):
+				value = _number(step.get("fv{}".format(c)))
+				if value is None:
+					problems.append((p, s, "fv{} is not a number: {!r}".format(c, step.get("fv{}".format(c)))))
+					value = float("nan")
+				values.append(value)
+			duration = parse_time(step.get("time", ""))
+			if duration is None:
+				problems.append((p, s, "time must be hh:mm:ss, got {!r}".format(step.get("time"))))
+				duration = 0
+			groups = [parse_aux(step.get("auxg1")), parse_aux(step.get("auxg2"))]
+			for g, group in enumerate(groups):
+				if group is None:
+					problems.append((p, s, "auxg{} is not an aux bitmask: {!r}".format(g + 1, step.get("auxg{}".format(g + 1)))))
+					groups[g] = 0
+			owner.append(p)
+			row.append(s)
+			final.append(values)
+			previous.append([float("nan") if v is None else v for v in last])
+			seconds.append(duration)
+			aux.append(groups)
+			last = values
+	return (owner, row, final, previous, seconds, aux), problems
+
+
+def _validate_numpy(columns, limits, max_ramp):
+	owner, row, final, previous, seconds, aux = columns
+	problems = []
+	if not owner:
+		return problems
+	final = np.array(final, dtype=float)
+	previous = np.array(previous, dtype=float)
+	minutes = np.array(seconds, dtype=float) / 60.0
+	aux = np.array(aux, dtype=np.int64)
+	bad = np.zeros(final.shape, dtype=bool)
+	for c in range(1,5):
+		limit = limits.get(c)
+		if limit is None:
+			continue
+		value = final[:, c - 1]
+		bad[:, c - 1] = ~np.isnan(value) & ((value < limit[0]) | (value > limit[1]))
+	for i, c in zip(*np.nonzero(bad)):
+		low, high = limits[c + 1]
+		problems.append((owner[i], row[i], "fv{} {} outside {}..{}".format(c + 1, final[i, c], low, high)))
+	if max_ramp:
+		with np.errstate(divide="ignore", invalid="ignore"):
+			rate = np.abs(final - previous) / minutes[:, None]
+		rate[np.isnan(rate)] = 0.0
+		for c in range(1,5):
+			if max_ramp.get(c) is None:
+				rate[:, c - 1] = 0.0
+			else:
+				rate[:, c - 1] /= max_ramp[c]
+		for i, c in zip(*np.nonzero(rate > 1.0)):
+			problems.append((owner[i], row[i], "fv{} ramp of {:.3g}/min exceeds {}/min".format(
+				c + 1, rate[i, c] * max_ramp[c + 1], max_ramp[c + 1])))
+	for i, g in zip(*np.nonzero((aux < 0) | (aux > 255))):
+		problems.append((owner[i], row[i], "auxg{} {} outside 0..255".format(g + 1, aux[i, g])))
+	return problems
+
+
+def _validate_python(columns, limits, max_ramp):
+	owner, row, final, previous, seconds, aux = columns
+	problems = []
+	for i in range(len(owner)):
+		for c in range(1,5):
+			value = final[i][c - 1]
+			limit = limits.get(c)
+			if limit is not None and value == value and not limit[0] <= value <= limit[1]:
+				problems.append((owner[i], row[i], "fv{} {} outside {}..{}".format(c, value, limit[0], limit[1])))
+		if max_ramp:
+			for c in range(1,5):
+				delta = abs(final[i][c - 1] - previous[i][c - 1])
+				if max_ramp.get(c) is None or delta != delta or delta == 0:
+					continue
+				rate = delta / (seconds[i] / 60.0) if seconds[i] else float("inf")
+				if rate > max_ramp[c]:
+					problems.append((owner[i], row[i], "fv{} ramp of {:.3g}/min exceeds {}/min".format(
+						c, rate, max_ramp[c])))
+		for g in range(2):
+			if not 0 <= aux[i][g] <= 255:
+				problems.append((owner[i], row[i], "auxg{} {} outside 0..255".format(g + 1, aux[i][g])))
+	return problems
+
+
+def compile_profiles(profiles, starts=None, names=None, limits=DEFAULT_LIMITS, max_ramp=None):
+	"""
+	Validates and compiles many ramp/soak profiles at once.
+
+	Each profile is a list of steps (dicts with STEP_FIELDS keys, as from load_csv); each
+	step becomes one interval that ramps to its final values over its time. starts gives
+	the INTV0 values for each profile (fv1..fv4, channels); by default the first step's
+	final values are used and every channel that has a final value is enabled.
+	limits maps channel -> (low, high) and max_ramp maps channel -> units per minute.
+
+	All steps of all profiles are checked in one pass (vectorized when numpy is
+	available). Raises ProfileError listing every problem, otherwise returns a
+	ThermotronProgram per profile.
+	"""
+	profiles = [list(steps) for steps in profiles]
+	if starts is None:
+		starts = [dict(steps[0]) if steps else {} for steps in profiles]
+	if names is None:
+		names = ["PROFILE{}".format(i + 1) for i in range(len(profiles))]
+	columns, problems = _columns(profiles, starts)
+	if np is not None:
+		problems.extend(_validate_numpy(columns, limits, max_ramp))
+	else:
+		problems.extend(_validate_python(columns, limits, max_ramp))
+	if problems:
+		raise ProfileError(sorted(problems))
+
+	owner, row, final, previous, seconds, aux = columns
+	programs = []
+	i = 0
+	for p, steps in enumerate(profiles):
+		start = starts[p]
+		start_values = [_number(start.get("fv{}".format(c))) for c in range(1,5)]
+		channels = start.get("channels")
+		if channels in (None, ""):
+			channels = sum(1 << (c - 1) for c in range(1,5)
+				if any(step.get("fv{}".format(c)) not in (None, "") for step in steps))
+		intervals = [format_interval(0, *[_format_number(v) for v in start_values], channels=channels)]
+		for s, step in enumerate(steps):
+			intervals.append(format_interval(s + 1,
+				*[_format_number(v) for v in final[i]],
+				dv1=step.get("dv1", ""), dv2=step.get("dv2", ""),
+				dv3=step.get("dv3", ""), dv4=step.get("dv4", ""),
+				hr_min_sec=str(step["time"]).strip(),
+				pgrp=step.get("pgrp", ""), lp=step.get("lp", ""), ni=step.get("ni", ""),
+				auxg1=aux[i][0], auxg2=aux[i][1],
+				display_status_byte=step.get("display_status_byte", ""),
+				options=step.get("options", "")))
+			i += 1
+		programs.append(ThermotronProgram(names[p], intervals))
+	return programs
+
+
+def compile_profile(steps, start=None, name="PROFILE", limits=DEFAULT_LIMITS, max_ramp=None):
+	"""
+	Validates and compiles one ramp/soak profile (a list of steps or a CSV path) into a
+	ThermotronProgram. See compile_profiles.
+	"""
+	if isinstance(steps, str):
+		steps = load_csv(steps)
+	return compile_profiles([steps], None if start is None else [start], [name], limits, max_ramp)[0]
@@ -0,0 +1,112 @@
+from Thermotron_Control import ThermotronError, is_error_reply
+
+
+class ThermotronProgram():
+	"""
+	A whole 8800 program: its name and the field string of every interval.
+	intervals[0] is the INTV0 initialization string and intervals[n] the string of
+	interval n, both without the leading "INTV" (see Thermotron_Control.format_interval).
+
+	Usage:
+		from Thermotron_Control import format_interval
+
+		program = ThermotronProgram("SOAK", [
+			format_interval(0, 25, 0, 0, 0, channels=1),
+			format_interval(1, 85, 0, 0, 0, hr_min_sec="01:00:00"),
+			])
+		sent = upload_program(chamber, program)
+	"""
+	def __init__(self, name, intervals):
+		self.name = str(name)
+		self.intervals = list(intervals)
+
+	def __len__(self):
+		""" Number of program intervals, not counting INTV0 """
+		return max(len(self.intervals) - 1, 0)
+
+	def __eq__(self, other):
+		return (self.name == other.name
+			and [normalize_interval(i) for i in self.intervals]
+			== [normalize_interval(i) for i in other.intervals])
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __repr__(self):
+		return "<ThermotronProgram {} ({} intervals)>".format(self.name, len(self))
+
+	def commands(self):
+		""" The INTV0..INTVn operation commands for the program """
+		return ["INTV{}".format(interval) for interval in self.intervals]
+
+
+def normalize_interval(interval_string):
+	"""
+	Field list of an interval string with numbers in a canonical form, so that
+	"1,85,0" and "1,85.0,0.00" compare equal.
+	"""
+	fields = []
+	for field in str(interval_string).strip().split(","):
+		field = field.strip()
+		try:
+			number = float(field)
+		except ValueError:
+			fields.append(field)
+			continue
+		fields.append(repr(number))
+	return fields
+
+
+def changed_intervals(target, current):
+	"""
+	Indices of the intervals of target that differ from current. Every interval is
+	returned when the programs have a different number of intervals.
+	"""
+	if current is None or len(current.intervals) != len(target.intervals):
+		return list(range(len(target.intervals)))
+	return [index for index, (new, old) in enumerate(zip(target.intervals, current.intervals))
+		if normalize_interval(new) != normalize_interval(old)]
+
+
+def download_program(chamber, name):
+	"""
+	Reads the program called name from the chamber in two round trips: PROG to learn
+	its length, then every INTV query in a single write.
+	"""
+	name, intervals = chamber.batch(["PROG{}?".format(name)])[0].rsplit(",", 1)
+	replies = chamber.batch(["INTV{}?".format(index) for index in range(int(intervals) + 1)])
+	return ThermotronProgram(name, replies)
+
+
+def upload_program(chamber, program, current=None, diff=True):
+	"""
+	Writes a program to the chamber as one pipelined batch and returns the indices of
+	the intervals that were sent. Raises ThermotronError naming the first command the
+	chamber rejected; intervals after it may or may not have been written.
+
+	With diff, the program already on the chamber is compared interval by interval
+	(downloaded first unless passed as current) and only the changed intervals are
+	sent. If the number of intervals changed, the program is recreated and every
+	interval is sent.
+	"""
+	if diff and current is None:
+		try:
+			current = download_program(chamber, program.name)
+		except ValueError:
+			# Not a program the chamber knows yet.
+			current = None
+	if not diff:
+		current = None
+	send = changed_intervals(program, current)
+	if not send:
+		return []
+	if current is not None and len(current.intervals) == len(program.intervals):
+		# Same shape: select the program for loading and patch the changed intervals.
+		commands = ["PROG{}?".format(program.name)]
+	else:
+		commands = ["PROG{},{}".format(program.name, len(program))]
+	commands.extend("INTV{}".format(program.intervals[index]) for index in send)
+	for command, reply in zip(commands, chamber.batch(commands)):
+		if is_error_reply(command, reply):
+			raise ThermotronError(command, reply)
+	return send
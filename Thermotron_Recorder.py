@@ -0,0 +1,191 @@
+from array import array
+import glob
+import os
+import struct
+import sys
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+# Segment file layout, all little-endian:
+#   64 byte header: magic, version, capacity (rows), count (rows written)
+#   timestamp float64[capacity]
+#   value     float64[capacity]
+#   chamber   uint16[capacity]  (index into the <base>.chambers name table)
+#   channel   uint16[capacity]
+# Columns are preallocated, so a segment can be memory mapped while it is being written.
+MAGIC = b"TCHREC01"
+VERSION = 1
+HEADER = struct.Struct("<8sII Q")
+HEADER_SIZE = 64
+COLUMNS = (("timestamp", "d", "<f8"), ("value", "d", "<f8"), ("chamber", "H", "<u2"), ("channel", "H", "<u2"))
+SEGMENT_SUFFIX = ".tcr"
+
+
+def _column_offsets(capacity):
+	offsets = {}
+	offset = HEADER_SIZE
+	for name, typecode, dtype in COLUMNS:
+		offsets[name] = offset
+		offset += array(typecode).itemsize * capacity
+	return offsets, offset
+
+
+class ThermotronRecorder():
+	"""
+	Append-only recorder for chamber telemetry.
+
+	Samples (timestamp, chamber, channel, value) are buffered and written to fixed-width
+	columnar segment files named <base>.<n>.tcr. A new segment is started once the
+	current one holds segment_rows samples. Values are stored as float64; replies that
+	aren't numbers are stored as NaN.
+
+	Usage:
+		recorder = ThermotronRecorder("soak/run1")
+		poller = ThermotronPoller(chambers, on_sample=recorder.record_samples)
+		...
+		recorder.close()
+		data = load_recording("soak/run1")
+	"""
+	def __init__(self, base_path, segment_rows=1000000, flush_rows=4096):
+		self.base_path = base_path
+		self.segment_rows = segment_rows
+		self.flush_rows = flush_rows
+		directory = os.path.dirname(base_path)
+		if directory and not os.path.isdir(directory):
+			os.makedirs(directory)
+		self.chambers = _read_chamber_names(base_path)
+		self._chamber_index = dict((name, i) for i, name in enumerate(self.chambers))
+		self._buffers = dict((name, array(typecode)) for name, typecode, dtype in COLUMNS)
+		self._segment = None
+		self._segment_number = len(segment_paths(base_path))
+		self._count = 0
+		self._open_segment()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+	def _open_segment(self):
+		path = "{}.{:06d}{}".format(self.base_path, self._segment_number, SEGMENT_SUFFIX)
+		self._offsets, size = _column_offsets(self.segment_rows)
+		self._segment = open(path, "w+b")
+		self._segment.truncate(size)
+		self._segment.write(HEADER.pack(MAGIC, VERSION, self.segment_rows, 0))
+		# Readers can open the segment as soon as it exists.
+		self._segment.flush()
+		self._segment_number += 1
+		self._count = 0
+
+	def _chamber_id(self, chamber):
+		chamber = str(chamber)
+		index = self._chamber_index.get(chamber)
+		if index is None:
+			index = len(self.chambers)
+			self.chambers.append(chamber)
+			self._chamber_index[chamber] = index
+			with open(self.base_path + ".chambers", "a") as f:
+				f.write(chamber + "\n")
+		return index
+
+	def record(self, timestamp, chamber, channel, value):
+		""" Append one sample """
+		try:
+			value = float(value)
+		except (TypeError, ValueError):
+			value = float("nan")
+		self._buffers["timestamp"].append(timestamp)
+		self._buffers["value"].append(value)
+		self._buffers["chamber"].append(self._chamber_id(chamber))
+		self._buffers["channel"].append(int(channel))
+		if len(self._buffers["timestamp"]) >= self.flush_rows:
+			self.flush()
+
+	def record_samples(self, samples):
+		""" Append poller Samples (anything with timestamp, chamber, channel and value) """
+		for sample in samples:
+			self.record(sample.timestamp, sample.chamber, sample.channel, sample.value)
+
+	def flush(self):
+		""" Write buffered samples to disk, rotating segments as they fill """
+		pending = len(self._buffers["timestamp"])
+		start = 0
+		while start < pending:
+			if self._count == self.segment_rows:
+				self._segment.close()
+				self._open_segment()
+			rows = min(pending - start, self.segment_rows - self._count)
+			for name, typecode, dtype in COLUMNS:
+				column = self._buffers[name][start:start + rows]
+				if sys.byteorder == "big":
+					column.byteswap()
+				self._segment.seek(self._offsets[name] + column.itemsize * self._count)
+				column.tofile(self._segment)
+			self._count += rows
+			start += rows
+			# Only publish the new row count once the column data is written.
+			self._segment.seek(0)
+			self._segment.write(HEADER.pack(MAGIC, VERSION, self.segment_rows, self._count))
+		for name, typecode, dtype in COLUMNS:
+			self._buffers[name] = array(typecode)
+		self._segment.flush()
+
+	def close(self):
+		if self._segment is not None:
+			self.flush()
+			self._segment.close()
+			self._segment = None
+
+
+def _read_chamber_names(base_path):
+	try:
+		with open(base_path + ".chambers") as f:
+			return [line.rstrip("\n") for line in f]
+	except IOError:
+		return []
+
+
+def segment_paths(base_path):
+	""" All segment files of a recording, oldest first """
+	return sorted(glob.glob(glob.escape(base_path) + ".[0-9]*" + SEGMENT_SUFFIX))
+
+
+def load_segment(path):
+	"""
+	Memory map one segment and return a dict of NumPy arrays, one per column,
+	trimmed to the rows written so far. Requires numpy.
+	"""
+	if np is None:
+		raise ImportError("load_segment requires numpy")
+	with open(path, "rb") as f:
+		magic, version, capacity, count = HEADER.unpack(f.read(HEADER.size))
+	if magic != MAGIC:
+		raise ValueError("{} is not a chamber recording segment".format(path))
+	offsets, size = _column_offsets(capacity)
+	columns = {}
+	for name, typecode, dtype in COLUMNS:
+		columns[name] = np.memmap(path, dtype=dtype, mode="r", offset=offsets[name], shape=(capacity,))[:count]
+	return columns
+
+
+def load_recording(base_path):
+	"""
+	Load every segment of a recording into one dict of NumPy arrays.
+	The "chambers" entry lists chamber names indexed by the chamber column.
+	"""
+	if np is None:
+		raise ImportError("load_recording requires numpy")
+	segments = [load_segment(path) for path in segment_paths(base_path)]
+	columns = {}
+	for name, typecode, dtype in COLUMNS:
+		if segments:
+			columns[name] = np.concatenate([segment[name] for segment in segments])
+		else:
+			columns[name] = np.empty(0, dtype=dtype)
+	columns["chambers"] = _read_chamber_names(base_path)
+	return columns
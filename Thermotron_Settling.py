@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+
+
+class SettlingMonitor():
+	"""
+	Waits for chambers to settle without a thread per wait.
+
+	All waits run as coroutines on one event loop in a background thread, with one
+	connection per chamber shared by every wait on it. wait() returns a
+	concurrent.futures.Future that resolves to the settled reading (see
+	AsyncThermotronChamber.wait_until_stable); callback, if given, is called with that
+	future once it is done.
+
+	Usage:
+		monitor = SettlingMonitor()
+		chamber.get_set_setpoint(1, 85)
+		future = monitor.wait("chamber1", 1, tolerance=0.5, dwell=60)
+		...
+		value = future.result()
+		monitor.close()
+	"""
+	def __init__(self, timeout=1, max_in_flight=16):
+		self.timeout = timeout
+		self.max_in_flight = max_in_flight
+		self._chambers = {}
+		self._connecting = {}
+		self._loop = asyncio.new_event_loop()
+		self._thread = threading.Thread(target=self._loop.run_forever)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.close()
+
+	async def _chamber(self, chamber_control_name, portNumber):
+		key = (chamber_control_name, str(portNumber))
+		chamber = self._chambers.get(key)
+		if chamber is not None and chamber.connected:
+			return chamber
+		# Waits started together on the same chamber share one connection attempt.
+		connecting = self._connecting.get(key)
+		if connecting is None:
+			chamber = AsyncThermotronChamber(chamber_control_name, portNumber=portNumber,
+				timeout=self.timeout, max_in_flight=self.max_in_flight)
+			connecting = self._connecting[key] = asyncio.ensure_future(chamber.connect())
+			try:
+				await connecting
+				self._chambers[key] = chamber
+			finally:
+				del self._connecting[key]
+			return chamber
+		await asyncio.shield(connecting)
+		return self._chambers[key]
+
+	async def _wait(self, chamber_control_name, portNumber, channel, tolerance, dwell, kwargs):
+		chamber = await self._chamber(chamber_control_name, portNumber)
+		return await chamber.wait_until_stable(channel, tolerance, dwell, **kwargs)
+
+	def wait(self, chamber_control_name, channel, tolerance, dwell, portNumber="8888",
+		callback=None, **kwargs):
+		"""
+		Starts waiting for channel of a chamber to settle and returns a Future.
+		Keyword arguments (target, timeout, min_interval, max_interval, on_sample) are
+		passed on to AsyncThermotronChamber.wait_until_stable; on_sample runs on the
+		monitor thread.
+		"""
+		future = asyncio.run_coroutine_threadsafe(self._wait(chamber_control_name,
+			portNumber, channel, tolerance, dwell, kwargs), self._loop)
+		if callback is not None:
+			future.add_done_callback(callback)
+		return future
+
+	def close(self):
+		"""
+		Cancels outstanding waits, closes every connection and stops the thread.
+		"""
+		if self._loop.is_closed():
+			return
+		asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+		self._loop.call_soon_threadsafe(self._loop.stop)
+		self._thread.join()
+		self._loop.close()
+
+	async def _shutdown(self):
+		tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+		for task in tasks:
+			task.cancel()
+		await asyncio.gather(*tasks, return_exceptions=True)
+		for chamber in self._chambers.values():
+			await chamber.close()
+		self._chambers = {}
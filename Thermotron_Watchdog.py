@@ -0,0 +1,222 @@
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from time import monotonic
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+from Thermotron_Control import STOP_CODES, ThermotronError, is_error_reply
+
+
+# Stop codes that mean the chamber tripped rather than being stopped on purpose.
+TRIP_CODES = (6, 7, 8, 10)
+
+# Queries sent every interval, as one batch.
+WATCH_COMMANDS = ["SCOD?"] + ["ALRM{}?".format(port) for port in range(1,9)]
+
+# Something the watchdog noticed. kind is "alarm" (detail is the tuple of ALRM replies
+# for ports 1-8) or "trip" (detail is the stop code). detected is the monotonic time
+# the reply arrived; window is the time since the previous clean poll was sent, an
+# upper bound on how long the condition went unnoticed.
+AlarmEvent = namedtuple("AlarmEvent", ["chamber", "kind", "detail", "reason", "detected", "window"])
+
+# One protective action or callback run for an event. latency is from detection to
+# the action finishing; error is None when it succeeded.
+Reaction = namedtuple("Reaction", ["event", "label", "latency", "result", "error"])
+
+
+class ThermotronWatchdog():
+	"""
+	Watches ALRM and SCOD on many chambers and reacts to deviation alarms and trips.
+
+	Each chamber is polled every interval seconds on its own dedicated connection from a
+	background event loop, so a slow or offline chamber doesn't hold up the others.
+	When a port goes into alarm or the stop code changes to one of trip_codes, an
+	AlarmEvent is raised once (not on every poll) and every matching action runs:
+
+		"hold" / "stop"  HOLD or STOP sent on the watch connection, no thread hop
+		callable         called with the event on a worker thread, e.g. switch.alloff
+
+	Reaction latencies are recorded in reactions and summarized by report(); worst
+	case time to react is about window + latency.
+
+	Usage:
+		watchdog = ThermotronWatchdog(["chamber1", "chamber2"], interval=0.2)
+		watchdog.add_action("hold")
+		watchdog.add_action(lambda event: dut_power.alloff(), label="DUT power off")
+		watchdog.add_callback(lambda event: print(event))
+		watchdog.start()
+		...
+		print(watchdog.report())
+		watchdog.stop()
+	"""
+	def __init__(self, chambers, interval=0.25, trip_codes=TRIP_CODES, portNumber="8888",
+		timeout=1, max_workers=8, on_error=None):
+		self.chambers = [chamber if isinstance(chamber, AsyncThermotronChamber)
+			else AsyncThermotronChamber(chamber, portNumber=portNumber, timeout=timeout)
+			for chamber in chambers]
+		self.interval = interval
+		self.trip_codes = tuple(trip_codes)
+		self.on_error = on_error
+		self.actions = []
+		self.callbacks = []
+		self.events = []
+		self.reactions = []
+		self.polls = 0
+		self.errors = 0
+		self.max_workers = max_workers
+		self._pool = ThreadPoolExecutor(max_workers=max_workers)
+		self._loop = None
+		self._thread = None
+		self._running = False
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self.stop()
+
+	def add_action(self, action, chambers=None, kinds=("alarm", "trip"), label=None):
+		"""
+		Run action on events of the given kinds, from every chamber or only the named ones.
+		action is "hold", "stop" or a callable taking the AlarmEvent.
+		"""
+		if label is None:
+			label = action if isinstance(action, str) else getattr(action, "__name__", repr(action))
+		if isinstance(action, str) and action not in ("hold", "stop"):
+			raise ValueError("Unknown action {}".format(action))
+		names = None if chambers is None else set(str(chamber) for chamber in chambers)
+		self.actions.append((action, names, tuple(kinds), label))
+
+	def add_callback(self, callback):
+		""" callback(event) is called on a worker thread for every event """
+		self.callbacks.append(callback)
+
+	def start(self):
+		""" Start watching from a background thread """
+		if self._thread is not None:
+			return
+		self._running = True
+		self._loop = asyncio.new_event_loop()
+		self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._watch_all(),))
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop(self):
+		""" Stop watching, close the connections and wait for running actions """
+		if self._thread is None:
+			return
+		self._running = False
+		self._thread.join()
+		self._thread = None
+		self._loop.close()
+		self._loop = None
+		self._pool.shutdown(wait=True)
+		self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+	async def _watch_all(self):
+		try:
+			await asyncio.gather(*[self._watch(chamber) for chamber in self.chambers])
+		finally:
+			for chamber in self.chambers:
+				await chamber.close()
+
+	async def _watch(self, chamber):
+		last_code = None
+		last_alarms = (0,) * 8
+		last_poll = None
+		next_poll = monotonic()
+		while self._running:
+			sent = monotonic()
+			try:
+				if not chamber.connected:
+					await chamber.connect()
+				replies = await chamber.batch(WATCH_COMMANDS)
+				code = int(replies[0])
+				alarms = tuple(int(reply) for reply in replies[1:])
+			except (OSError, ValueError, asyncio.TimeoutError) as e:
+				self.errors += 1
+				last_poll = None
+				if self.on_error:
+					self.on_error(chamber, e)
+				await chamber.close()
+			else:
+				detected = monotonic()
+				window = detected - (last_poll if last_poll is not None else sent)
+				last_poll = sent
+				self.polls += 1
+				events = []
+				if code in self.trip_codes and code != last_code:
+					events.append(AlarmEvent(str(chamber), "trip", code,
+						STOP_CODES.get(code, "Unknown stop code {}".format(code)), detected, window))
+				if any(alarms) and alarms != last_alarms:
+					ports = [port for port, alarm in enumerate(alarms, 1) if alarm]
+					events.append(AlarmEvent(str(chamber), "alarm", alarms,
+						"Deviation alarm on port {}".format(", ".join(str(port) for port in ports)),
+						detected, window))
+				last_code, last_alarms = code, alarms
+				for event in events:
+					await self._react(chamber, event)
+			next_poll += self.interval
+			now = monotonic()
+			if next_poll < now:
+				# Fell behind (slow chamber or reconnect); don't try to catch up.
+				next_poll = now
+			await asyncio.sleep(next_poll - now)
+
+	async def _react(self, chamber, event):
+		self.events.append(event)
+		loop = asyncio.get_event_loop()
+		commands = []
+		for action, names, kinds, label in self.actions:
+			if event.kind not in kinds or (names is not None and event.chamber not in names):
+				continue
+			if isinstance(action, str):
+				commands.append((action, label))
+			else:
+				# Threaded actions start first so they don't wait on the chamber.
+				loop.run_in_executor(self._pool, self._call, action, event, label)
+		for callback in self.callbacks:
+			loop.run_in_executor(self._pool, self._call, callback, event,
+				getattr(callback, "__name__", repr(callback)))
+		for action, label in commands:
+			# Sent right away on the connection that saw the event.
+			command = action.upper()
+			try:
+				result, error = await chamber.command(command), None
+			except (OSError, asyncio.TimeoutError) as e:
+				result, error = None, e
+			else:
+				if is_error_reply(command, result):
+					error = ThermotronError(command, result)
+			self._record(event, label, result, error)
+
+	def _call(self, function, event, label):
+		try:
+			result, error = function(event), None
+		except Exception as e:
+			result, error = None, e
+		self._record(event, label, result, error)
+
+	def _record(self, event, label, result, error):
+		self.reactions.append(Reaction(event, label, monotonic() - event.detected, result, error))
+
+	def report(self):
+		"""
+		Summary of the watch so far: polls, errors, events, and per-action reaction
+		latency (count, mean, max) and worst detection window, in seconds.
+		"""
+		actions = {}
+		for reaction in list(self.reactions):
+			latencies = actions.setdefault(reaction.label, [])
+			latencies.append(reaction.latency)
+		return {
+			"polls": self.polls,
+			"errors": self.errors,
+			"events": len(self.events),
+			"max_window_s": max([event.window for event in self.events] or [None]),
+			"reactions": dict((label, {"count": len(latencies), "mean_s": sum(latencies) / len(latencies),
+				"max_s": max(latencies)}) for label, latencies in actions.items()),
+			"failed_reactions": len([reaction for reaction in self.reactions if reaction.error is not None]),
+			}
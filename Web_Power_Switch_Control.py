@@ -1,23 +1,154 @@
 
+import base64
+import errno
+import re
+import threading
+try:
+    from time import monotonic, perf_counter
+except ImportError:
+    # python 2
+    from time import time as monotonic
+    from time import time as perf_counter
 try:
     # python 3
-    import urllib.request as urllib
+    import http.client as httplib
+    import queue
 except:
     # python 2
-    import urllib
+    import httplib
+    import Queue as queue
+
 
+OUTLETS = range(1,9)
+ALL_OUTLETS_MASK = 0xFF
+STATUS_PAGE = "/index.htm"
 
-class authenticatingURLOpener(urllib.FancyURLopener):
+# One row of the outlet table on the status page: number, name, state.
+_outlet_row = re.compile(
+    r"<td[^>]*>\s*(\d+)\s*</td>\s*<td[^>]*>.*?</td>\s*<td[^>]*>(.*?)</td>",
+    re.IGNORECASE | re.DOTALL)
+_tags = re.compile(r"<[^>]*>")
+
+
+def parse_outlet_status(html):
     """
-    An opener to supply the username and password when the website asks for it.
+    Parse the switch's status page and return {outlet: True/False} for every outlet found.
     """
-    def __init__(self, username, password):
-        urllib.FancyURLopener.__init__(self)
-        self.username = username
-        self.password = password
+    states = {}
+    for outlet, state in _outlet_row.findall(html):
+        state = _tags.sub("", state).strip().upper()
+        if int(outlet) in OUTLETS and state in ("ON", "OFF"):
+            states[int(outlet)] = state == "ON"
+    return states
 
-    def prompt_user_passwd(self, host, realm):
-        return self.username, self.password
+
+class webPowerSwitchError(IOError):
+    """
+    Raised when the switch can't be reached or rejects a request.
+    """
+
+
+def _stale_connection(error):
+    """
+    True if error is how a request on a kept-alive connection fails once the switch
+    has closed it: an empty or reset reply, or a broken pipe. Timeouts are not.
+    """
+    if isinstance(error, httplib.BadStatusLine):
+        # Includes RemoteDisconnected on python 3.
+        return True
+    return getattr(error, "errno", None) in (errno.ECONNRESET, errno.EPIPE)
+
+
+class keepAliveTransport():
+    """
+    Persistent HTTP/1.1 connections to a single switch.
+    The basic auth header is computed once and sent with every request, so no
+    request has to wait for a 401 challenge. Idle connections are kept in a small
+    pool and reused; a pooled connection the switch has dropped while it sat idle
+    is transparently replaced and the request retried once.
+    Every request is recorded in metrics (a Command_Metrics.CommandMetrics) if given.
+    """
+    def __init__(self, hostname, username, password, timeout=5, pool_size=8, metrics=None):
+        self.hostname = hostname
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.metrics = metrics
+        credentials = "{}:{}".format(username, password).encode("utf-8")
+        self.headers = {
+            "Authorization": "Basic {}".format(base64.b64encode(credentials).decode("ascii")),
+            "Connection": "keep-alive",
+            }
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def _new_connection(self):
+        return httplib.HTTPConnection(self.hostname, timeout=self.timeout)
+
+    def _checkout(self):
+        """ (connection, True if it came from the idle pool) """
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _checkin(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def request(self, path, command="request"):
+        """
+        GET the path and return (status, body).
+        Raises webPowerSwitchError if the switch can't be reached or refuses the request.
+        command names the request in the metrics.
+        """
+        if self.metrics is None:
+            return self._request(path)
+        start = perf_counter()
+        # Request line and the headers we send; http.client adds Host and Accept-Encoding.
+        bytes_sent = len("GET {} HTTP/1.1\r\n\r\n".format(path)) + sum(
+            len(name) + len(value) + 4 for name, value in self.headers.items())
+        try:
+            status, body = self._request(path)
+        except webPowerSwitchError as e:
+            self.metrics.record(self.hostname, command, perf_counter() - start, bytes_sent, 0, e)
+            raise
+        self.metrics.record(self.hostname, command, perf_counter() - start, bytes_sent, len(body))
+        return status, body
+
+    def _request(self, path):
+        conn, reused = self._checkout()
+        while True:
+            try:
+                conn.request("GET", path, headers=self.headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, IOError) as e:
+                conn.close()
+                if not (reused and _stale_connection(e)):
+                    error = webPowerSwitchError("{}: {}".format(self.hostname, e))
+                    # Kept so callers and metrics can tell a timeout from a refusal.
+                    error.__cause__ = e
+                    raise error
+                # The switch closed the idle connection; a fresh one gets no second retry.
+                conn, reused = self._new_connection(), False
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                self._checkin(conn)
+            if response.status >= 400:
+                raise webPowerSwitchError("{}: HTTP {} {} for {}".format(
+                    self.hostname, response.status, response.reason, path))
+            return response.status, body
+
+    def close(self):
+        """ Close all idle connections """
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
 
 
 class webPowerSwitch():
@@ -26,53 +157,145 @@ class webPowerSwitch():
     A much more exhaustive control is available from the dlipower package.
     Required input: hostname, username, password
     ***Note: hostname can be either the name or the ip address of the WPS
+    Raises webPowerSwitchError when the switch can't be reached or rejects a command.
     """
-    def __init__(self, hostname, username, password, simulate = False):
-        self.url = "http://{username}:{password}@{hostname}/outlet?".format(
-            username = username,
-            password = password,
-            hostname = hostname
-            )
-        self.local_opener = authenticatingURLOpener(username, password)
+    def __init__(self, hostname, username, password, simulate = False, timeout = 5, cache_ttl = 5,
+        metrics = None):
+        self.hostname = hostname
+        self.url = "/outlet?"
+        self.transport = keepAliveTransport(hostname, username, password, timeout = timeout,
+            metrics = metrics)
         self.simulate = simulate
-                
+        # Outlet states as last read from the status page, or as last written.
+        # Only trusted until cache_ttl seconds after the status page was read.
+        self.cache_ttl = cache_ttl
+        self._states = {}
+        self._states_time = None
+
     def on(self, outlet):
         """ Turn on the specified port of this web power switch """
-        if self.simulate:
-            return 0
-        self.__try("{url}{outlet}=ON".format(
-            url = self.url,
-            outlet = outlet))
+        return self.set_outlets({outlet: True})
 
     def off(self, outlet):
         """ Turn off the specified port of this web power switch """
+        return self.set_outlets({outlet: False})
+
+    def get_outlet_states(self, refresh = False):
+        """
+        Return {outlet: True/False} for all outlets.
+        Served from the cache while it is fresh, otherwise read from the status page
+        in a single request.
+        """
+        if self.simulate:
+            return dict((outlet, False) for outlet in OUTLETS)
+        if refresh or not self._cache_fresh():
+            status, body = self.transport.request(STATUS_PAGE, "status")
+            self._states = parse_outlet_status(body.decode("latin-1"))
+            self._states_time = monotonic()
+        return dict(self._states)
+
+    def is_on(self, outlet):
+        """ True if the outlet is on, according to the cached state """
+        return self.get_outlet_states().get(int(outlet))
+
+    def invalidate(self):
+        """ Forget the cached outlet states so the next read goes to the switch """
+        self._states = {}
+        self._states_time = None
+
+    def _cache_fresh(self):
+        return (self._states_time is not None
+            and monotonic() - self._states_time < self.cache_ttl)
+
+    def set_outlets(self, outlets):
+        """
+        Set several outlets at once.
+        outlets is either an integer bitmask covering all 8 outlets (bit 0 is outlet 1,
+        a set bit turns the outlet on and a clear bit turns it off) or a dict of
+        {outlet: True/False} naming only the outlets to change.
+        Turning every outlet the same way is a single request; anything else is sent
+        as concurrent per-outlet requests.
+        """
+        states = self._outlet_states(outlets)
         if self.simulate:
             return 0
-        self.__try("{url}{outlet}=OFF".format(
-            url = self.url,
-            outlet = outlet))
+        result = dict(states)
+        if self._cache_fresh():
+            result = dict(self._states)
+            result.update(states)
+            # Skip outlets that are already where we want them.
+            states = dict((outlet, state) for outlet, state in states.items()
+                if self._states.get(outlet) != state)
+            if not states:
+                return
+        if len(states) > 1 and len(result) == len(OUTLETS) and len(set(result.values())) == 1:
+            # The switch can turn every outlet on or off in one request.
+            state = "ON" if result[1] else "OFF"
+            self.__try("{url}a={state}".format(
+                url = self.url,
+                state = state), "all " + state)
+        else:
+            self.__try_all(["{url}{outlet}={state}".format(
+                url = self.url,
+                outlet = outlet,
+                state = "ON" if state else "OFF") for outlet, state in states.items()])
+        if self._states_time is not None:
+            self._states.update(states)
 
     def alloff(self):
         """ Turn off all ports of the web power switch """
-        if self.simulate:
-            return 0
-        for i in range(1,9):
-            self.off(i)
+        return self.set_outlets(0)
 
     def allon(self):
         """ Turn on all ports of the web power switch """
-        if self.simulate:
-            return 0
-        for i in range(1,9):
-            self.on(i)
+        return self.set_outlets(ALL_OUTLETS_MASK)
+
+    @staticmethod
+    def _outlet_states(outlets):
+        """ Normalize a bitmask or {outlet: state} dict to {outlet: bool} """
+        if isinstance(outlets, dict):
+            states = dict((int(outlet), bool(state)) for outlet, state in outlets.items())
+            for outlet in states:
+                if outlet not in OUTLETS:
+                    raise ValueError("Outlet {} out of range.".format(outlet))
+            return states
+        mask = int(outlets)
+        if mask & ~ALL_OUTLETS_MASK:
+            raise ValueError("Outlet mask {:#x} out of range.".format(mask))
+        return dict((outlet, bool(mask & (1 << (outlet - 1)))) for outlet in OUTLETS)
 
-    def __try(self, url):
-        """ encapsulate the url opener to catch exceptions """
+    def __try(self, url, command = None):
+        """ encapsulate the transport, raising webPowerSwitchError on failure """
+        if command is None:
+            command = "outlet " + url.rsplit("=", 1)[-1]
         try:
-            self.local_opener.open(url)
-        except OSError as e:
-            print("OSError talking to the switch: {}".format(e))
-            exit(1)
+            self.transport.request(url, command)
+        except webPowerSwitchError:
+            self.invalidate()
+            raise
+
+    def __try_all(self, urls):
+        """ request all of the urls concurrently, each on its own connection """
+        if len(urls) == 1:
+            return self.__try(urls[0])
+        errors = []
+        def worker(url):
+            try:
+                self.transport.request(url, "outlet " + url.rsplit("=", 1)[-1])
+            except webPowerSwitchError as e:
+                errors.append(e)
+        threads = [threading.Thread(target = worker, args = (url,)) for url in urls]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self.invalidate()
+            raise errors[0]
+
+    def close(self):
+        """ Close the connections to the switch """
+        self.transport.close()
 
     def name(self):
-    	return self.hostname
\ No newline at end of file
+        return self.hostname
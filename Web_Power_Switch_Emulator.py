@@ -0,0 +1,201 @@
+"""
+Stand-in for a Web Power Switch 7, served over HTTP.
+
+Imitates the /outlet?N=ON|OFF endpoint, the basic auth challenge and the status page,
+so webPowerSwitch can be exercised without hardware:
+
+    python Web_Power_Switch_Emulator.py --port 8080 --latency 0.005
+
+or from a script:
+
+    emulator = webPowerSwitchEmulator(port = 0)
+    port = emulator.start_in_thread()
+    switch = webPowerSwitch("127.0.0.1:{}".format(port), "admin", "1234")
+"""
+import argparse
+import base64
+import threading
+from time import sleep
+try:
+    # python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qsl
+
+OUTLETS = range(1,9)
+
+
+class _threadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _switchRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.emulator._count_connection()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body = b"", headers = ()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        emulator = self.server.emulator
+        emulator._count_request()
+        if emulator.latency:
+            sleep(emulator.latency)
+        if self.headers.get("Authorization") != emulator.auth_header:
+            emulator._count_challenge()
+            self._send(401, b"<html>Unauthorized</html>",
+                [("WWW-Authenticate", 'Basic realm="{}"'.format(emulator.realm))])
+            return
+        url = urlsplit(self.path)
+        if url.path == "/outlet":
+            try:
+                for outlet, action in parse_qsl(url.query):
+                    emulator.apply(outlet, action)
+            except ValueError:
+                self._send(400, b"<html>Bad request</html>")
+                return
+            # The switch answers outlet commands by redirecting to the status page.
+            self._send(302, headers = [("Location", "/index.htm")])
+        elif url.path in ("/", "/index.htm"):
+            self._send(200, emulator.status_page().encode("latin-1"))
+        else:
+            self._send(404, b"<html>Not found</html>")
+
+
+class webPowerSwitchEmulator():
+    """
+    Simulated Web Power Switch 7 with per-outlet state and configurable latency.
+    Counts requests, new connections and auth challenges so connection reuse can be measured.
+    """
+    def __init__(self, host = "127.0.0.1", port = 8080, username = "admin", password = "1234",
+        latency = 0.0, realm = "Web Power Switch"):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.realm = realm
+        credentials = "{}:{}".format(username, password).encode("utf-8")
+        self.auth_header = "Basic {}".format(base64.b64encode(credentials).decode("ascii"))
+        self.outlets = dict((outlet, False) for outlet in OUTLETS)
+        self.names = dict((outlet, "Outlet {}".format(outlet)) for outlet in OUTLETS)
+        self.requests = 0
+        self.connections = 0
+        self.challenges = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def _count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def _count_challenge(self):
+        with self._lock:
+            self.challenges += 1
+
+    def apply(self, outlet, action):
+        """ Carry out one outlet command, e.g. ("3", "ON") or ("a", "OFF") """
+        action = action.upper()
+        if outlet.lower() == "a":
+            outlets = list(OUTLETS)
+        elif outlet.isdigit() and int(outlet) in OUTLETS:
+            outlets = [int(outlet)]
+        else:
+            raise ValueError(outlet)
+        with self._lock:
+            for outlet in outlets:
+                if action == "ON":
+                    self.outlets[outlet] = True
+                elif action == "OFF":
+                    self.outlets[outlet] = False
+                elif action == "CCL":
+                    # Power cycle: ends up on.
+                    self.outlets[outlet] = True
+                else:
+                    raise ValueError(action)
+
+    def status_page(self):
+        """ The outlet table in the layout of the switch's index page """
+        rows = []
+        with self._lock:
+            for outlet in OUTLETS:
+                state = "ON" if self.outlets[outlet] else "OFF"
+                rows.append(
+                    '<tr bgcolor="#F4F4F4"><td align=center>{outlet}</td>\n'
+                    '<td>{name}</td><td>\n'
+                    '<b><font color={color}>{state}</font></b></td><td>\n'
+                    '<a href="outlet?{outlet}={action}">Switch {action}</a>\n'
+                    '</td></tr>'.format(
+                        outlet = outlet,
+                        name = self.names[outlet],
+                        color = "green" if state == "ON" else "red",
+                        state = state,
+                        action = "OFF" if state == "ON" else "ON"))
+        return ("<html><head><title>Outlet Control</title></head><body>\n"
+            "<table>\n{}\n</table>\n</body></html>".format("\n".join(rows)))
+
+    def start(self):
+        """ Bind the server. Returns the bound port. """
+        self._server = _threadingHTTPServer((self.host, self.port), _switchRequestHandler)
+        self._server.emulator = self
+        self.port = self._server.server_address[1]
+        return self.port
+
+    def serve_forever(self):
+        if self._server is None:
+            self.start()
+        self._server.serve_forever()
+
+    def start_in_thread(self):
+        """ Serve from a daemon thread. Returns the bound port. """
+        port = self.start()
+        thread = threading.Thread(target = self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return port
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Web Power Switch 7 emulator")
+    parser.add_argument("--host", default = "127.0.0.1")
+    parser.add_argument("--port", type = int, default = 8080)
+    parser.add_argument("--username", default = "admin")
+    parser.add_argument("--password", default = "1234")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "seconds added to every request")
+    args = parser.parse_args()
+    emulator = webPowerSwitchEmulator(args.host, args.port, args.username, args.password, args.latency)
+    print("Emulating a web power switch on {}:{}".format(args.host, args.port))
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
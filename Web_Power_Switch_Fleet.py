@@ -0,0 +1,142 @@
+from collections import namedtuple
+import threading
+from time import sleep
+try:
+    from time import monotonic
+except ImportError:
+    # python 2
+    from time import time as monotonic
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # python 2 without the futures backport
+    from multiprocessing.pool import ThreadPool
+    ThreadPoolExecutor = None
+
+from Web_Power_Switch_Control import webPowerSwitch
+
+
+# Outcome of one command on one switch. error is None when the command succeeded.
+fleetResult = namedtuple("fleetResult", ["hostname", "result", "error", "latency"])
+
+
+class fleetReport():
+    """
+    Results of running one command across the fleet.
+    """
+    def __init__(self, results, wall_time):
+        self.results = results
+        self.wall_time = wall_time
+
+    @property
+    def succeeded(self):
+        return [r for r in self.results if r.error is None]
+
+    @property
+    def failed(self):
+        return [r for r in self.results if r.error is not None]
+
+    @property
+    def latencies(self):
+        """ {hostname: seconds} for every switch """
+        return dict((r.hostname, r.latency) for r in self.results)
+
+    def __repr__(self):
+        return "<fleetReport {} ok, {} failed in {:.3f}s>".format(
+            len(self.succeeded), len(self.failed), self.wall_time)
+
+    def summary(self):
+        """ Human readable report with per-host latency and errors """
+        lines = [repr(self)]
+        for r in sorted(self.results, key = lambda r: r.hostname):
+            if r.error is None:
+                lines.append("  {}: ok in {:.3f}s".format(r.hostname, r.latency))
+            else:
+                lines.append("  {}: FAILED in {:.3f}s: {}".format(r.hostname, r.latency, r.error))
+        return "\n".join(lines)
+
+
+class webPowerSwitchFleet():
+    """
+    Runs commands on many web power switches at once.
+    Commands are fanned out over a bounded pool of worker threads. Each switch only
+    runs one command at a time, and no more often than once every min_interval
+    seconds. Failures are collected per host instead of stopping the run.
+    Switches are keyed by hostname, so each hostname may only appear once.
+
+    Usage:
+        fleet = webPowerSwitchFleet.from_hosts(["wps1", "wps2"], "admin", "1234")
+        report = fleet.run("alloff")
+        print(report.summary())
+    """
+    def __init__(self, switches, max_workers = 32, min_interval = 0.0):
+        self.switches = {}
+        for switch in switches:
+            if switch.name() in self.switches:
+                raise ValueError("Switch {} is in the fleet twice.".format(switch.name()))
+            self.switches[switch.name()] = switch
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self._host_locks = dict((hostname, threading.Lock()) for hostname in self.switches)
+        self._last_command = dict.fromkeys(self.switches, None)
+
+    @classmethod
+    def from_hosts(cls, hostnames, username, password, max_workers = 32, min_interval = 0.0, **kwargs):
+        """ Build a fleet of switches that share the same credentials """
+        return cls([webPowerSwitch(hostname, username, password, **kwargs) for hostname in hostnames],
+            max_workers = max_workers, min_interval = min_interval)
+
+    def __len__(self):
+        return len(self.switches)
+
+    def _run_one(self, hostname, action, args, kwargs):
+        switch = self.switches[hostname]
+        with self._host_locks[hostname]:
+            last = self._last_command[hostname]
+            if last is not None and self.min_interval:
+                wait = last + self.min_interval - monotonic()
+                if wait > 0:
+                    sleep(wait)
+            start = monotonic()
+            try:
+                if callable(action):
+                    result = action(switch, *args, **kwargs)
+                else:
+                    result = getattr(switch, action)(*args, **kwargs)
+                error = None
+            except Exception as e:
+                result, error = None, e
+            end = monotonic()
+            self._last_command[hostname] = end
+        return fleetResult(hostname, result, error, end - start)
+
+    def run(self, action, *args, **kwargs):
+        """
+        Run action on every switch and return a fleetReport.
+        action is either the name of a webPowerSwitch method ("alloff", "on", ...),
+        called with args and kwargs, or a callable taking the switch as its first argument.
+        """
+        return self.run_on(self.switches, action, *args, **kwargs)
+
+    def run_on(self, hostnames, action, *args, **kwargs):
+        """ Same as run, limited to the named switches """
+        start = monotonic()
+        if ThreadPoolExecutor is None:
+            pool = ThreadPool(self.max_workers)
+            try:
+                results = pool.map(lambda hostname: self._run_one(hostname, action, args, kwargs),
+                    hostnames)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            with ThreadPoolExecutor(max_workers = self.max_workers) as pool:
+                futures = [pool.submit(self._run_one, hostname, action, args, kwargs)
+                    for hostname in hostnames]
+                results = [future.result() for future in futures]
+        return fleetReport(results, monotonic() - start)
+
+    def close(self):
+        """ Close the connections to every switch """
+        for switch in self.switches.values():
+            switch.close()
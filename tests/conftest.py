@@ -0,0 +1,42 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Thermotron_Control import ThermotronChamber
+from Thermotron_Emulator import ThermotronEmulator
+from Web_Power_Switch_Control import webPowerSwitch
+from Web_Power_Switch_Emulator import webPowerSwitchEmulator
+
+
+@pytest.fixture
+def emulator():
+	emulator = ThermotronEmulator(port=0, stall_time=0.5)
+	emulator.start_in_thread()
+	yield emulator
+	emulator.stop()
+
+
+@pytest.fixture
+def switch_emulator():
+    emulator = webPowerSwitchEmulator(port = 0)
+    emulator.start_in_thread()
+    yield emulator
+    emulator.stop()
+
+
+@pytest.fixture
+def switch(switch_emulator):
+    switch = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "1234")
+    yield switch
+    switch.close()
+
+
+@pytest.fixture
+def chamber(emulator):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, command_timeout=0.2)
+	yield chamber
+	chamber.close()
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+
+
+def run_with(emulator, body, timeout=0.2):
+	async def run():
+		chamber = AsyncThermotronChamber("127.0.0.1", portNumber=emulator.port, timeout=timeout)
+		await chamber.connect()
+		try:
+			return await body(chamber)
+		finally:
+			await chamber.close()
+	return asyncio.run(run())
+
+
+def test_commands_are_pipelined(emulator):
+	async def body(chamber):
+		return await asyncio.gather(*[chamber.command(c) for c in ["IDEN?", "VRSN?", "CNAM1?"] * 10])
+	assert run_with(emulator, body) == [emulator.iden, emulator.version, "TEMP"] * 10
+	assert emulator.connections == 1
+
+
+def test_getters(emulator):
+	async def body(chamber):
+		await chamber.get_set_setpoint(1, 40)
+		return (await chamber.get_set_setpoint(1), await chamber.get_process_variables([1, 5]),
+			await chamber.get_channel_name(2))
+	assert run_with(emulator, body) == ("40.0", {1: "25.0", 5: "25.0"}, "HUMIDITY")
+
+
+@pytest.mark.parametrize("fault", ["drop", "stall"])
+def test_recovers_after_a_lost_reply(emulator, fault):
+	async def body(chamber):
+		emulator.inject(fault)
+		with pytest.raises(asyncio.TimeoutError):
+			await chamber.command("PVAR1?")
+		first = await asyncio.gather(chamber.command("IDEN?"), chamber.command("VRSN?"))
+		await asyncio.sleep(emulator.stall_time)
+		return first, await chamber.batch(["IDEN?", "VRSN?"])
+	first, second = run_with(emulator, body)
+	assert first == second == [emulator.iden, emulator.version]
+
+
+def test_lost_reply_fails_the_whole_batch(emulator):
+	async def body(chamber):
+		emulator.inject("drop")
+		with pytest.raises((asyncio.TimeoutError, ConnectionError)):
+			await chamber.batch(["PVAR1?", "IDEN?", "VRSN?"])
+		return await chamber.batch(["IDEN?", "VRSN?"])
+	assert run_with(emulator, body) == [emulator.iden, emulator.version]
+
+
+def test_closed_chamber_refuses_commands(emulator):
+	async def body(chamber):
+		await chamber.close()
+		assert not chamber.connected
+		with pytest.raises(ConnectionError):
+			await chamber.command("IDEN?")
+	run_with(emulator, body)
+
+
+def test_invalid_channels_return_zero(emulator):
+	async def body(chamber):
+		return (await chamber.get_set_deviation(9), await chamber.get_set_manual_ramp(9),
+			await chamber.get_set_setpoint(9))
+	assert run_with(emulator, body) == (0, 0, 0)
+
+
+def test_programs(emulator):
+	async def body(chamber):
+		assert await chamber.get_set_prog("SOAK", 1) == "0"
+		assert await chamber.get_set_programming_interval(0, 25, 20, "", "", channels=3) == "0"
+		assert await chamber.get_set_programming_interval(1, 85, dv1=2, hr_min_sec="01:00:00") == "0"
+		return await chamber.get_set_prog("SOAK"), await chamber.get_set_programming_interval(1)
+	prog, interval = run_with(emulator, body)
+	assert prog == "SOAK,1"
+	assert interval.startswith("1,85,") and "01:00:00" in interval
+
+
+def test_option_helpers_write_once(emulator):
+	emulator.options = 16
+	async def body(chamber):
+		await chamber.ptc_on()
+		options = int(await chamber.get_set_options())
+		served = emulator.commands_served
+		await chamber.ptc_on()
+		assert emulator.commands_served == served + 1
+		await chamber.humidity_on()
+		return options, int(await chamber.get_set_options())
+	assert run_with(emulator, body) == (1, 2)
+
+
+def test_print_version(emulator, capsys):
+	async def body(chamber):
+		await chamber.print_version()
+	run_with(emulator, body)
+	assert capsys.readouterr().out == emulator.version + "\n"
@@ -0,0 +1,34 @@
+from Command_Benchmark import chamber_benchmarks, measure, percentile, switch_benchmarks
+
+
+def test_percentile():
+	values = list(range(1, 101))
+	assert percentile(values, 0.5) == 50
+	assert percentile(values, 0.99) == 99 and percentile(values, 0.07) == 7
+	assert percentile(values, 0) == 1 and percentile(values, 1) == 100
+	assert percentile([], 0.5) is None
+
+
+def test_measure_counts_calls():
+	calls = []
+	result = measure(calls.append, 5, commands_per_call=2)
+	assert calls == [0, 1, 2, 3, 4]
+	assert result["iterations"] == 5 and result["commands"] == 10
+	assert result["p50_s"] <= result["p99_s"] <= result["max_s"]
+
+
+def test_chamber_benchmarks():
+	results = chamber_benchmarks(10, 0.0)
+	for name in ("PVAR", "PVAR batch (40 channels)", "SETP", "OPTN", "INTV"):
+		assert results[name]["commands"] > 0
+		assert results["connect + " + name]["commands"] == results[name]["commands"]
+		assert "setup_cost_s" in results["connect + " + name]
+
+
+def test_switch_benchmarks():
+	results = switch_benchmarks(10, 0.0)
+	for name in ("outlet on", "outlet off", "allon"):
+		assert results[name]["commands"] > 0
+		assert "setup_cost_s" in results["connect + " + name]
+	# The kept-alive connection serves every request of the main switch.
+	assert results["server"]["connections"] < results["server"]["requests"]
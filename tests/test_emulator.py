@@ -0,0 +1,54 @@
+import pytest
+
+from Thermotron_Emulator import ERROR_REPLY, ThermalChannel, ThermotronEmulator
+
+
+def test_channel_ramps_toward_the_set_point():
+	channel = ThermalChannel(25.0)
+	channel.setpoint = 85.0
+	channel.ramp = 20.0
+	channel.advance(1.0)
+	assert channel.pv == 45.0
+	channel.advance(10.0)
+	assert channel.pv == 85.0
+
+
+def test_respond_carries_out_commands():
+	emulator = ThermotronEmulator(port=0)
+	assert emulator.respond("SETP1,40") == "0"
+	assert emulator.respond("SETP1?") == "40.0"
+	assert emulator.respond("IDEN?") == emulator.iden
+	assert emulator.respond("CNAM1?") == "TEMP"
+	assert emulator.respond("SCOD?") == "0"
+	assert emulator.respond("RUNM") == "0"
+	assert emulator.respond("SCOD?") == "1"
+
+
+def test_respond_rejects_bad_commands():
+	emulator = ThermotronEmulator(port=0)
+	assert emulator.respond("XYZZ?") == ERROR_REPLY
+	assert emulator.respond("SETP9?") == ERROR_REPLY
+	assert emulator.respond("HOLD") == ERROR_REPLY
+
+
+def test_chamber_talks_to_the_emulator(emulator, chamber):
+	chamber.get_set_setpoint(1, 40)
+	assert emulator.channels[1].setpoint == 40.0
+	assert chamber.get_set_setpoint(1) == "40.0"
+	assert chamber.get_iden() == emulator.iden
+
+
+def test_split_reply_is_reassembled(emulator, chamber):
+	emulator.inject("split", 3)
+	assert [chamber.get_iden() for _ in range(3)] == [emulator.iden] * 3
+
+
+def test_garbled_reply(emulator, chamber):
+	emulator.inject("garble")
+	assert chamber.get_iden() != emulator.iden
+	assert chamber.get_iden() == emulator.iden
+
+
+def test_unknown_fault():
+	with pytest.raises(ValueError):
+		ThermotronEmulator(port=0).inject("meltdown")
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+import pytest
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+from Thermotron_Control import ThermotronChamber
+from Thermotron_Gateway import ThermotronGateway
+
+
+@pytest.fixture
+def gateway(emulator):
+	gateway = ThermotronGateway({0: ("127.0.0.1", emulator.port)})
+	gateway.start_in_thread()
+	yield gateway
+	gateway.stop()
+
+
+def gateway_port(gateway):
+	return list(gateway.ports.values())[0]
+
+
+def clients_query(port, commands, clients=8):
+	async def run():
+		chambers = [AsyncThermotronChamber("127.0.0.1", portNumber=port) for _ in range(clients)]
+		for chamber in chambers:
+			await chamber.connect()
+		try:
+			return await asyncio.gather(*[chamber.batch(commands) for chamber in chambers])
+		finally:
+			for chamber in chambers:
+				await chamber.close()
+	return asyncio.run(run())
+
+
+def test_clients_share_the_chamber(emulator, gateway):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=gateway_port(gateway))
+	chamber.get_set_setpoint(1, 40)
+	assert chamber.get_set_setpoint(1) == "40.0"
+	assert chamber.get_iden() == emulator.iden
+	chamber.close()
+	assert emulator.connections == 1
+
+
+def test_identical_queries_are_merged(emulator, gateway):
+	emulator.latency = 0.05
+	replies = clients_query(gateway_port(gateway), ["PVAR1?", "IDEN?"])
+	assert replies == [["25.0", emulator.iden]] * 8
+	stats = list(gateway.stats().values())[0]
+	assert stats["requests"] == 16
+	assert stats["merged"] > 0
+	assert stats["upstream_requests"] == 16 - stats["merged"]
+
+
+def test_writes_are_never_merged(emulator, gateway):
+	emulator.latency = 0.05
+	clients_query(gateway_port(gateway), ["SETP1,30"], clients=4)
+	stats = list(gateway.stats().values())[0]
+	assert stats["merged"] == 0 and stats["upstream_requests"] == 4
+
+
+def test_stats_command(gateway):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=gateway_port(gateway))
+	stats = json.loads(chamber.batch(["GATEWAY?"])[0])
+	assert stats["connected"] is False and stats["requests"] == 0
+	chamber.close()
+
+
+def test_unreachable_chamber_answers_err(emulator, gateway):
+	emulator.stop()
+	chamber = ThermotronChamber("127.0.0.1", portNumber=gateway_port(gateway))
+	assert chamber.get_iden() == "ERR"
+	chamber.close()
+
+
+def test_session_is_reset_after_a_lost_reply(emulator):
+	gateway = ThermotronGateway({0: ("127.0.0.1", emulator.port)}, timeout=0.2)
+	gateway.start_in_thread()
+	chamber = ThermotronChamber("127.0.0.1", portNumber=gateway_port(gateway))
+	emulator.inject("drop")
+	assert chamber.get_process_variable(1) == "ERR"
+	assert chamber.batch(["IDEN?", "VRSN?", "CNAM1?"]) == [emulator.iden, emulator.version, "TEMP"]
+	chamber.close()
+	gateway.stop()
+	assert emulator.connections == 2
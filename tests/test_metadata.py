@@ -0,0 +1,57 @@
+import json
+
+from Thermotron_Control import ThermotronChamber
+from Thermotron_Metadata import MetadataCache
+
+
+def cached_chamber(emulator, cache):
+	return ThermotronChamber("127.0.0.1", portNumber=emulator.port, lazy_connect=True,
+		metadata_cache=cache)
+
+
+def test_metadata_is_read_once(emulator, tmp_path):
+	cache = MetadataCache(str(tmp_path / "metadata.json"))
+	chamber = cached_chamber(emulator, cache)
+	metadata = chamber.get_metadata()
+	assert metadata["iden"] == emulator.iden and metadata["channel_names"][1] == "TEMP"
+	served = emulator.commands_served
+	assert chamber.get_metadata() == metadata
+	assert chamber.get_channel_name(2) == "HUMIDITY"
+	assert emulator.commands_served == served
+	chamber.close()
+
+
+def test_cache_file_is_shared(emulator, tmp_path):
+	path = str(tmp_path / "metadata.json")
+	chamber = cached_chamber(emulator, MetadataCache(path))
+	metadata = chamber.get_metadata()
+	chamber.close()
+	assert "127.0.0.1:{}".format(emulator.port) in json.load(open(path))["chambers"]
+	served = emulator.commands_served
+	other = cached_chamber(emulator, MetadataCache(path))
+	assert other.get_metadata() == metadata
+	assert emulator.commands_served == served
+	assert emulator.connections == 1
+
+
+def test_new_identity_drops_the_entry(emulator, tmp_path):
+	cache = MetadataCache(str(tmp_path / "metadata.json"), max_age=0)
+	chamber = cached_chamber(emulator, cache)
+	chamber.get_metadata()
+	emulator.version = "2.0"
+	emulator.channel_names[1] = "PRODUCT"
+	metadata = chamber.get_metadata()
+	assert metadata["version"] == "2.0"
+	assert metadata["channel_names"][1] == "PRODUCT"
+	chamber.close()
+
+
+def test_invalidate(emulator):
+	cache = MetadataCache()
+	chamber = cached_chamber(emulator, cache)
+	chamber.get_metadata()
+	emulator.channel_names[1] = "PRODUCT"
+	assert chamber.get_channel_name(1) == "TEMP"
+	cache.invalidate()
+	assert chamber.get_channel_name(1) == "PRODUCT"
+	chamber.close()
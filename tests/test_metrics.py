@@ -0,0 +1,97 @@
+from socket import timeout
+
+import pytest
+
+from Command_Metrics import CommandMetrics
+from Thermotron_Control import ThermotronChamber
+from Web_Power_Switch_Control import webPowerSwitch
+
+
+def test_record_and_snapshot():
+	metrics = CommandMetrics("test", buckets=(0.01, 0.1))
+	metrics.record("chamber1", "PVAR", 0.005, 6, 7)
+	metrics.record("chamber1", "PVAR", 0.05, 6, 7)
+	metrics.record("chamber1", "PVAR", 1.0, 6, 0, timeout("late"))
+	metrics.record("chamber1", "SETP", 0.001, 9, 3, IOError("refused"))
+	stats = metrics.snapshot()
+	pvar = stats[("chamber1", "PVAR")]
+	assert pvar["count"] == 3 and pvar["errors"] == 1 and pvar["timeouts"] == 1
+	assert pvar["bytes_sent"] == 18 and pvar["bytes_received"] == 14
+	assert pvar["buckets"] == [(0.01, 1), (0.1, 2), (float("inf"), 3)]
+	assert stats[("chamber1", "SETP")]["timeouts"] == 0
+	metrics.reset()
+	assert metrics.snapshot() == {}
+
+
+def test_hooks_see_every_command():
+	metrics = CommandMetrics()
+	seen = []
+	hook = lambda *args: seen.append(args)
+	metrics.add_hook(hook)
+	metrics.record("switch1", "outlet ON", 0.01)
+	metrics.remove_hook(hook)
+	metrics.record("switch1", "outlet ON", 0.01)
+	assert seen == [("switch1", "outlet ON", 0.01, 0, 0, None)]
+
+
+def test_prometheus_export():
+	metrics = CommandMetrics("thermotron", buckets=(0.1,))
+	metrics.record('chamber "1"', "PVAR", 0.05, 6, 7)
+	text = metrics.to_prometheus()
+	assert '# TYPE thermotron_commands_total counter' in text
+	assert 'thermotron_commands_total{device="chamber \\"1\\"",command="PVAR"} 1' in text
+	assert 'thermotron_command_latency_seconds_bucket{device="chamber \\"1\\"",command="PVAR",le="0.1"} 1' in text
+	assert 'thermotron_command_latency_seconds_count{device="chamber \\"1\\"",command="PVAR"} 1' in text
+
+
+def test_chamber_commands_are_recorded(emulator):
+	metrics = CommandMetrics()
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, metrics=metrics)
+	chamber.get_process_variable(1)
+	chamber.get_process_variables([1, 2, 3])
+	chamber.get_set_setpoint(1, 30)
+	stats = metrics.snapshot()
+	assert stats[("127.0.0.1", "PVAR")]["count"] == 4
+	assert stats[("127.0.0.1", "SETP")]["count"] == 1
+	assert stats[("127.0.0.1", "PVAR")]["bytes_sent"] == 4 * len("PVAR1?\r")
+
+
+def test_switch_commands_are_recorded(switch_emulator):
+	metrics = CommandMetrics()
+	switch = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "1234", metrics=metrics)
+	switch.on(1)
+	switch.close()
+	bad = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "wrong", metrics=metrics)
+	try:
+		bad.on(1)
+	except IOError:
+		pass
+	bad.close()
+	name = "127.0.0.1:{}".format(switch_emulator.port)
+	counts = dict((command, stats) for (device, command), stats in metrics.snapshot().items() if device == name)
+	assert sum(stats["count"] for stats in counts.values()) == 2
+	assert sum(stats["errors"] for stats in counts.values()) == 1
+
+
+def test_chamber_error_replies_are_errors(emulator):
+	metrics = CommandMetrics()
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, metrics=metrics)
+	# HOLD is refused when the chamber isn't running.
+	chamber.set_hold()
+	chamber.get_set_setpoint(1, 30)
+	stats = metrics.snapshot()
+	assert stats[("127.0.0.1", "HOLD")]["errors"] == 1
+	assert stats[("127.0.0.1", "SETP")]["errors"] == 0
+
+
+def test_switch_timeouts_are_timeouts(switch_emulator):
+	metrics = CommandMetrics()
+	switch_emulator.latency = 1.0
+	switch = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "1234",
+		timeout=0.2, metrics=metrics)
+	with pytest.raises(IOError) as error:
+		switch.on(1)
+	switch.close()
+	assert isinstance(error.value.__cause__, timeout)
+	stats = list(metrics.snapshot().values())
+	assert sum(s["errors"] for s in stats) == 1 and sum(s["timeouts"] for s in stats) == 1
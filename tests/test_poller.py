@@ -0,0 +1,40 @@
+import asyncio
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+from Thermotron_Emulator import ThermotronEmulator
+from Thermotron_Poller import ThermotronPoller
+
+
+def test_samples_are_aligned_by_tick(emulator):
+	other = ThermotronEmulator(port=0, ambient=20.0)
+	other.start_in_thread()
+	ticks = []
+	chambers = [AsyncThermotronChamber("127.0.0.1", portNumber=emulator.port),
+		AsyncThermotronChamber("127.0.0.1", portNumber=other.port, description="other")]
+	poller = ThermotronPoller(chambers, channels=[1, 2], interval=0.05, on_sample=ticks.append)
+	async def run():
+		await poller.run(ticks=3)
+		await poller.close()
+	asyncio.run(run())
+	other.stop()
+	assert len(ticks) == 3
+	for tick, samples in enumerate(ticks):
+		assert set(sample.tick for sample in samples) == set([tick])
+		assert sorted((sample.chamber, sample.channel, sample.value) for sample in samples) == [
+			("127.0.0.1", 1, "25.0"), ("127.0.0.1", 2, "25.0"),
+			("127.0.0.1:other", 1, "20.0"), ("127.0.0.1:other", 2, "20.0")]
+	assert poller.missed_reads == 0 and poller.errors == 0
+
+
+def test_recovers_after_a_missed_read(emulator):
+	chamber = AsyncThermotronChamber("127.0.0.1", portNumber=emulator.port, timeout=2)
+	counts = []
+	poller = ThermotronPoller([chamber], channels=[1, 2], interval=0.2,
+		on_sample=lambda samples: counts.append(len(samples)))
+	emulator.inject("stall")
+	async def run():
+		await poller.run(ticks=4)
+		await poller.close()
+	asyncio.run(run())
+	assert poller.missed_reads == 1
+	assert 0 in counts and counts[-1] == 2
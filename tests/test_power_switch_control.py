@@ -0,0 +1,106 @@
+import socket
+import time
+
+import pytest
+
+from Web_Power_Switch_Control import webPowerSwitch, webPowerSwitchError
+
+
+def test_connections_are_reused(switch_emulator, switch):
+    for _ in range(5):
+        switch.get_outlet_states(refresh = True)
+    switch.on(1)
+    assert switch_emulator.requests == 6
+    assert switch_emulator.connections == 1
+    assert switch_emulator.challenges == 0
+
+
+def test_bad_credentials_raise(switch_emulator):
+    switch = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "wrong")
+    with pytest.raises(webPowerSwitchError):
+        switch.on(1)
+    switch.close()
+
+
+def test_unreachable_switch_raises():
+    switch = webPowerSwitch("127.0.0.1:1", "admin", "1234", timeout = 0.5)
+    with pytest.raises(webPowerSwitchError):
+        switch.on(1)
+    switch.close()
+
+
+def test_dropped_idle_connection_is_replaced(switch_emulator, switch):
+    switch.on(1)
+    # Looks to the next request like a connection the switch closed while idle.
+    conn = switch.transport._idle.queue[0]
+    conn.sock.shutdown(socket.SHUT_RDWR)
+    switch.on(2)
+    assert switch_emulator.outlets[2]
+    assert switch_emulator.connections == 2
+
+
+def test_timeouts_are_not_retried(switch_emulator):
+    switch = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "1234", timeout = 0.2)
+    switch.on(1)
+    switch_emulator.latency = 1.0
+    start = time.time()
+    with pytest.raises(webPowerSwitchError):
+        switch.on(2)
+    assert time.time() - start < 0.35
+    assert switch_emulator.requests == 2
+    switch.close()
+
+
+def test_uniform_mask_is_one_request(switch_emulator, switch):
+    switch.allon()
+    assert switch_emulator.requests == 1
+    assert all(switch_emulator.outlets.values())
+    switch.set_outlets(0)
+    assert switch_emulator.requests == 2
+    assert not any(switch_emulator.outlets.values())
+
+
+def test_mixed_states(switch_emulator, switch):
+    switch.set_outlets(0b00000101)
+    assert [outlet for outlet, state in sorted(switch_emulator.outlets.items()) if state] == [1, 3]
+    assert switch_emulator.requests == 8
+    switch.set_outlets({2: True, "3": False})
+    assert [outlet for outlet, state in sorted(switch_emulator.outlets.items()) if state] == [1, 2]
+
+
+def test_outlets_out_of_range(switch):
+    with pytest.raises(ValueError):
+        switch.set_outlets(0x100)
+    with pytest.raises(ValueError):
+        switch.set_outlets({9: True})
+
+
+def test_outlet_states_are_cached(switch_emulator, switch):
+    switch_emulator.outlets[4] = True
+    assert switch.is_on(4) and not switch.is_on(1)
+    assert switch.get_outlet_states()[4]
+    assert switch_emulator.requests == 1
+    switch.get_outlet_states(refresh = True)
+    assert switch_emulator.requests == 2
+
+
+def test_redundant_writes_are_skipped(switch_emulator, switch):
+    switch.get_outlet_states()
+    switch.off(1)
+    switch.on(2)
+    switch.on(2)
+    assert switch_emulator.requests == 2
+    assert switch.is_on(2)
+
+
+def test_failed_write_invalidates_the_cache(switch_emulator):
+    switch = webPowerSwitch("127.0.0.1:{}".format(switch_emulator.port), "admin", "1234", timeout = 0.2)
+    switch.get_outlet_states()
+    switch_emulator.latency = 0.5
+    with pytest.raises(webPowerSwitchError):
+        switch.on(1)
+    switch_emulator.latency = 0.0
+    # The switch carried out the write after the client gave up on it.
+    time.sleep(0.5)
+    assert switch.is_on(1)
+    switch.close()
@@ -0,0 +1,64 @@
+import pytest
+
+from Web_Power_Switch_Control import webPowerSwitch
+from Web_Power_Switch_Emulator import webPowerSwitchEmulator
+from Web_Power_Switch_Fleet import webPowerSwitchFleet
+
+
+@pytest.fixture
+def switch_emulators():
+    emulators = [webPowerSwitchEmulator(port = 0) for _ in range(3)]
+    for emulator in emulators:
+        emulator.start_in_thread()
+    yield emulators
+    for emulator in emulators:
+        emulator.stop()
+
+
+def hostnames(emulators):
+    return ["127.0.0.1:{}".format(emulator.port) for emulator in emulators]
+
+
+def test_command_runs_on_every_switch(switch_emulators):
+    fleet = webPowerSwitchFleet.from_hosts(hostnames(switch_emulators), "admin", "1234")
+    report = fleet.run("allon")
+    fleet.close()
+    assert len(report.succeeded) == 3 and not report.failed
+    assert all(all(emulator.outlets.values()) for emulator in switch_emulators)
+    assert set(report.latencies) == set(hostnames(switch_emulators))
+
+
+def test_failures_are_reported_per_host(switch_emulators):
+    switches = [webPowerSwitch(hostname, "admin", "1234") for hostname in hostnames(switch_emulators)]
+    switches.append(webPowerSwitch("127.0.0.1:1", "admin", "1234", timeout = 0.5))
+    fleet = webPowerSwitchFleet(switches)
+    report = fleet.run("on", 2)
+    fleet.close()
+    assert [r.hostname for r in report.failed] == ["127.0.0.1:1"]
+    assert len(report.succeeded) == 3
+    assert "FAILED" in report.summary()
+
+
+def test_callable_actions_and_subsets(switch_emulators):
+    fleet = webPowerSwitchFleet.from_hosts(hostnames(switch_emulators), "admin", "1234")
+    report = fleet.run_on(hostnames(switch_emulators)[:1], lambda switch, outlet: switch.on(outlet), 5)
+    fleet.close()
+    assert len(report.results) == 1
+    assert [emulator.outlets[5] for emulator in switch_emulators] == [True, False, False]
+
+
+def test_min_interval_spaces_commands(switch_emulators):
+    fleet = webPowerSwitchFleet.from_hosts(hostnames(switch_emulators)[:1], "admin", "1234",
+        min_interval = 0.2)
+    first = fleet.run("on", 1)
+    second = fleet.run("off", 1)
+    fleet.close()
+    assert second.wall_time >= 0.15
+    assert not first.failed and not second.failed
+
+
+def test_duplicate_hostnames_are_rejected(switch_emulators):
+    hostname = hostnames(switch_emulators)[0]
+    with pytest.raises(ValueError):
+        webPowerSwitchFleet([webPowerSwitch(hostname, "admin", "1234"),
+            webPowerSwitch(hostname, "admin", "1234")])
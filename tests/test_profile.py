@@ -0,0 +1,73 @@
+import io
+
+import pytest
+
+from Thermotron_Profile import ProfileError, compile_profile, compile_profiles, load_csv, parse_aux, parse_time
+import Thermotron_Profile
+from Thermotron_Program import download_program, upload_program
+
+
+CSV = """fv1,fv2,time,auxg1
+25,50,00:10:00,
+85,50,01:00:00,00000001
+85,50,02:00:00,1
+"""
+
+
+def test_parse_time_and_aux():
+	assert parse_time("01:02:03") == 3723
+	assert parse_time("1:60:00") is None
+	assert parse_time("90") is None
+	assert parse_aux("") == 0
+	assert parse_aux("10000000") == 1
+	assert parse_aux("5") == 5
+	assert parse_aux("x") is None
+
+
+def test_compile_from_csv():
+	program = compile_profile(load_csv(io.StringIO(CSV)), name="BURNIN")
+	assert program.name == "BURNIN"
+	assert len(program) == 3
+	assert program.intervals[0] == "0,25,50,,,3"
+	assert program.intervals[2].startswith("2,85,50,,,")
+	assert ",01:00:00," in program.intervals[2]
+
+
+def test_every_problem_is_reported():
+	steps = [
+		{"fv1": "25", "time": "00:10:00"},
+		{"fv1": "500", "time": "00:10:00"},
+		{"fv1": "hot", "time": "10 minutes"},
+		{"fv1": "25", "time": "00:10:00", "auxg1": "999"},
+		]
+	with pytest.raises(ProfileError) as error:
+		compile_profile(steps)
+	messages = [message for profile, step, message in error.value.problems]
+	assert len(messages) == 4
+	assert [step for profile, step, message in error.value.problems] == [1, 2, 2, 3]
+
+
+def test_ramp_limit():
+	steps = [{"fv1": "25", "time": "00:01:00"}, {"fv1": "85", "time": "00:01:00"}]
+	with pytest.raises(ProfileError) as error:
+		compile_profile(steps, max_ramp={1: 10})
+	assert error.value.problems[0][:2] == (0, 1)
+	assert compile_profile(steps, max_ramp={1: 100})
+
+
+def test_python_and_numpy_validation_agree(monkeypatch):
+	profiles = [[{"fv1": "25", "time": "00:01:00"}, {"fv1": "200", "time": "00:01:00"}],
+		[{"fv1": "-100", "fv2": "120", "time": "00:01:00", "auxg2": "300"}]]
+	kwargs = dict(max_ramp={1: 10, 2: 10})
+	with pytest.raises(ProfileError) as vectorized:
+		compile_profiles(profiles, **kwargs)
+	monkeypatch.setattr(Thermotron_Profile, "np", None)
+	with pytest.raises(ProfileError) as plain:
+		compile_profiles(profiles, **kwargs)
+	assert [problem[:2] for problem in vectorized.value.problems] == [problem[:2] for problem in plain.value.problems]
+
+
+def test_compiled_program_uploads(chamber):
+	program = compile_profile(load_csv(io.StringIO(CSV)), name="BURNIN")
+	upload_program(chamber, program)
+	assert download_program(chamber, "BURNIN") == program
@@ -0,0 +1,49 @@
+import pytest
+
+from Thermotron_Control import ThermotronError, format_interval
+from Thermotron_Program import ThermotronProgram, changed_intervals, download_program, normalize_interval, upload_program
+
+
+def soak(setpoint=85):
+	return ThermotronProgram("SOAK", [
+		format_interval(0, 25, 0, 0, 0, channels=1),
+		format_interval(1, setpoint, 0, 0, 0, hr_min_sec="01:00:00"),
+		format_interval(2, 25, 0, 0, 0, hr_min_sec="00:30:00"),
+		])
+
+
+def test_numbers_compare_by_value():
+	assert normalize_interval("1,85,0") == normalize_interval("1,85.0,0.00")
+	assert soak() == ThermotronProgram("SOAK", [i.replace(",0,", ",0.0,") for i in soak().intervals])
+
+
+def test_changed_intervals():
+	assert changed_intervals(soak(), None) == [0, 1, 2]
+	assert changed_intervals(soak(), soak()) == []
+	assert changed_intervals(soak(125), soak()) == [1]
+	shorter = ThermotronProgram("SOAK", soak().intervals[:2])
+	assert changed_intervals(soak(), shorter) == [0, 1, 2]
+
+
+def test_upload_sends_only_changed_intervals(emulator, chamber):
+	assert upload_program(chamber, soak()) == [0, 1, 2]
+	assert download_program(chamber, "SOAK") == soak()
+	served = emulator.commands_served
+	assert upload_program(chamber, soak()) == []
+	# Only the download used for the comparison.
+	assert emulator.commands_served == served + 1 + len(soak().intervals)
+	assert upload_program(chamber, soak(setpoint=125)) == [1]
+	assert download_program(chamber, "SOAK") == soak(setpoint=125)
+
+
+def test_upload_without_diff_sends_everything(chamber):
+	upload_program(chamber, soak())
+	assert upload_program(chamber, soak(), diff=False) == [0, 1, 2]
+
+
+def test_upload_raises_on_a_rejected_interval(chamber):
+	program = soak()
+	program.intervals[2] = "x,y"
+	with pytest.raises(ThermotronError) as error:
+		upload_program(chamber, program)
+	assert error.value.command == "INTVx,y"
@@ -0,0 +1,50 @@
+from collections import namedtuple
+import math
+
+from Thermotron_Recorder import ThermotronRecorder, load_recording, segment_paths
+
+
+Sample = namedtuple("Sample", ["tick", "timestamp", "chamber", "channel", "value"])
+
+
+def test_samples_round_trip(tmp_path):
+	base = str(tmp_path / "run")
+	with ThermotronRecorder(base) as recorder:
+		recorder.record(1.0, "chamber1", 1, "25.5")
+		recorder.record_samples([Sample(0, 2.0, "chamber2", 3, 40.0), Sample(0, 3.0, "chamber1", 2, "ERR")])
+	data = load_recording(base)
+	assert list(data["timestamp"]) == [1.0, 2.0, 3.0]
+	assert data["value"][0] == 25.5 and data["value"][1] == 40.0 and math.isnan(data["value"][2])
+	assert [data["chambers"][i] for i in data["chamber"]] == ["chamber1", "chamber2", "chamber1"]
+	assert list(data["channel"]) == [1, 3, 2]
+
+
+def test_segments_rotate_when_full(tmp_path):
+	base = str(tmp_path / "run")
+	with ThermotronRecorder(base, segment_rows=4, flush_rows=3) as recorder:
+		for i in range(10):
+			recorder.record(float(i), "chamber1", 1, i)
+	assert len(segment_paths(base)) == 3
+	assert list(load_recording(base)["value"]) == [float(i) for i in range(10)]
+
+
+def test_reopening_appends(tmp_path):
+	base = str(tmp_path / "run")
+	with ThermotronRecorder(base) as recorder:
+		recorder.record(1.0, "chamber1", 1, 1)
+	with ThermotronRecorder(base) as recorder:
+		recorder.record(2.0, "chamber2", 1, 2)
+		recorder.record(3.0, "chamber1", 1, 3)
+	data = load_recording(base)
+	assert list(data["value"]) == [1.0, 2.0, 3.0]
+	assert data["chambers"] == ["chamber1", "chamber2"]
+
+
+def test_unflushed_rows_are_not_visible(tmp_path):
+	base = str(tmp_path / "run")
+	recorder = ThermotronRecorder(base, flush_rows=100)
+	recorder.record(1.0, "chamber1", 1, 1)
+	assert len(load_recording(base)["value"]) == 0
+	recorder.flush()
+	assert len(load_recording(base)["value"]) == 1
+	recorder.close()
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from Chamber_Sequencer import Sequencer, Timeline
+
+
+def test_actions_run_at_their_offsets():
+	calls = []
+	timeline = Timeline("t").add(0.1, calls.append, "b").add(0.0, calls.append, "a", label="first")
+	with Sequencer() as sequencer:
+		results = sequencer.start(timeline).wait(5)
+	assert calls == ["a", "b"]
+	assert [result.label for result in results] == ["first", "append"]
+	assert all(0 <= result.lateness < 0.05 for result in results)
+	assert results[1].started - results[0].started >= 0.09
+
+
+def test_errors_are_collected():
+	def fail():
+		raise RuntimeError("boom")
+	timeline = Timeline("t").add(0, fail).add(0.05, lambda: "ok")
+	with Sequencer() as sequencer:
+		run = sequencer.start(timeline)
+		results = run.wait(5)
+	assert len(results) == 2
+	assert [str(result.error) for result in run.errors] == ["boom"]
+	assert results[1].result == "ok"
+
+
+def test_stop_on_error_skips_the_rest():
+	calls = []
+	def fail():
+		raise RuntimeError("boom")
+	timeline = Timeline("t").add(0, fail).add(0.05, calls.append, 1)
+	with Sequencer() as sequencer:
+		run = sequencer.start(timeline, stop_on_error=True)
+		assert len(run.wait(5)) == 1
+	assert run.done and calls == []
+
+
+def test_runs_overlap():
+	gate = threading.Event()
+	with Sequencer() as sequencer:
+		slow = sequencer.start(Timeline("slow").add(0, gate.wait, 5))
+		fast = sequencer.start(Timeline("fast").add(0.05, gate.set))
+		assert fast.wait(2) and slow.wait(2)
+
+
+def test_close_drops_pending_actions():
+	calls = []
+	sequencer = Sequencer()
+	run = sequencer.start(Timeline("t").add(60, calls.append, 1))
+	assert sequencer.pending == 1
+	sequencer.close()
+	assert run.done and run.cancelled and calls == []
+
+
+def test_chamber_and_outlet_actions(emulator, chamber, switch_emulator, switch):
+	timeline = Timeline("cycle")
+	timeline.chamber(0, chamber, "get_set_setpoint", 1, -40)
+	timeline.outlet(0.05, switch, "on", 3)
+	with Sequencer() as sequencer:
+		run = sequencer.start(timeline)
+		run.wait(5)
+	assert not run.errors
+	assert emulator.channels[1].setpoint == -40.0
+	assert switch_emulator.outlets[3] is True
+
+
+def test_same_offset_keeps_timeline_order():
+	calls = []
+	timeline = Timeline("t")
+	for i in range(30):
+		timeline.add(0.02, calls.append, i)
+	with Sequencer(max_workers=4) as sequencer:
+		sequencer.start(timeline).wait(5)
+	assert calls == list(range(30))
+
+
+def test_slow_run_holds_one_worker():
+	slow = Timeline("slow")
+	for i in range(5):
+		slow.add(0, time.sleep, 0.2)
+	with Sequencer(max_workers=2) as sequencer:
+		sequencer.start(slow)
+		fast = sequencer.start(Timeline("fast").add(0.05, lambda: None))
+		fast.wait(5)
+		assert fast.lateness()[1] < 0.1
+
+
+def test_cancel_finishes_the_run():
+	timeline = Timeline("t").add(0, lambda: None).add(60, lambda: None)
+	with Sequencer() as sequencer:
+		run = sequencer.start(timeline)
+		while not run.results:
+			time.sleep(0.01)
+		run.cancel()
+		assert run.wait(1) and run.done
+		assert sequencer.pending == 0
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from Thermotron_Async_Control import AsyncThermotronChamber
+from Thermotron_Control import StabilityTracker
+from Thermotron_Settling import SettlingMonitor
+
+
+def test_tracker_needs_the_whole_dwell_in_band():
+	tracker = StabilityTracker(85.0, 0.5, 10.0, ramp=60.0, max_interval=600.0)
+	stable, delay = tracker.update(25.0, now=0.0)
+	# 59.5 degrees away at 60/min: check again after half the predicted 59.5 seconds.
+	assert not stable and delay == pytest.approx(59.5 / 2)
+	assert tracker.update(84.8, now=100.0)[0] is False
+	assert tracker.update(86.0, now=105.0)[0] is False
+	assert tracker.update(85.2, now=106.0)[0] is False
+	assert tracker.update(85.1, now=116.0)[0] is True
+
+
+def start_ramp(emulator, setpoint=27.0):
+	emulator.respond("MRMP1,600")
+	emulator.respond("SETP1,{}".format(setpoint))
+	emulator.respond("RUNM")
+
+
+def test_sync_wait_until_stable(emulator, chamber):
+	start_ramp(emulator)
+	samples = []
+	value = chamber.wait_until_stable(1, 0.5, 0.2, min_interval=0.05, max_interval=0.1,
+		on_sample=lambda channel, value: samples.append(value))
+	assert abs(float(value) - 27.0) <= 0.5
+	assert len(samples) >= 2
+
+
+def test_async_wait_until_stable(emulator):
+	start_ramp(emulator)
+	async def wait():
+		async with AsyncThermotronChamber("127.0.0.1", portNumber=emulator.port) as chamber:
+			return await chamber.wait_until_stable(1, 0.5, 0.2, min_interval=0.05, max_interval=0.1)
+	assert abs(float(asyncio.run(wait())) - 27.0) <= 0.5
+
+
+def test_async_wait_times_out(emulator):
+	emulator.respond("SETP1,80")
+	async def wait():
+		async with AsyncThermotronChamber("127.0.0.1", portNumber=emulator.port) as chamber:
+			await chamber.wait_until_stable(1, 0.5, 0.2, timeout=0.3, min_interval=0.05, max_interval=0.1)
+	with pytest.raises(asyncio.TimeoutError):
+		asyncio.run(wait())
+
+
+def test_monitor_shares_one_connection(emulator):
+	start_ramp(emulator)
+	with SettlingMonitor() as monitor:
+		done = []
+		futures = [monitor.wait("127.0.0.1", 1, 0.5, 0.2, portNumber=emulator.port,
+			callback=done.append, min_interval=0.05, max_interval=0.1) for _ in range(5)]
+		values = [float(future.result(timeout=10)) for future in futures]
+	assert all(abs(value - 27.0) <= 0.5 for value in values)
+	assert len(done) == 5
+	assert emulator.connections == 1
@@ -0,0 +1,50 @@
+import base64
+from http.client import HTTPConnection
+
+import pytest
+
+from Web_Power_Switch_Control import parse_outlet_status
+from Web_Power_Switch_Emulator import webPowerSwitchEmulator
+
+
+def test_apply_changes_outlets():
+    emulator = webPowerSwitchEmulator(port = 0)
+    emulator.apply("3", "ON")
+    assert emulator.outlets[3] is True
+    emulator.apply("a", "ON")
+    emulator.apply("2", "OFF")
+    assert [outlet for outlet, on in emulator.outlets.items() if not on] == [2]
+    emulator.apply("2", "CCL")
+    assert emulator.outlets[2] is True
+    with pytest.raises(ValueError):
+        emulator.apply("9", "ON")
+
+
+def test_status_page_parses():
+    emulator = webPowerSwitchEmulator(port = 0)
+    emulator.apply("1", "ON")
+    emulator.apply("8", "ON")
+    assert parse_outlet_status(emulator.status_page()) == emulator.outlets
+
+
+def _get(port, path, password = "1234"):
+    conn = HTTPConnection("127.0.0.1", port, timeout = 5)
+    credentials = base64.b64encode("admin:{}".format(password).encode("utf-8")).decode("ascii")
+    conn.request("GET", path, headers = {"Authorization": "Basic " + credentials})
+    response = conn.getresponse()
+    body = response.read()
+    conn.close()
+    return response.status, body
+
+
+def test_requests_need_credentials(switch_emulator):
+    assert _get(switch_emulator.port, "/outlet?4=ON", password = "wrong")[0] == 401
+    assert switch_emulator.challenges == 1
+    assert switch_emulator.outlets[4] is False
+    assert _get(switch_emulator.port, "/outlet?4=ON")[0] == 302
+    assert switch_emulator.outlets[4] is True
+
+
+def test_bad_outlet_is_rejected(switch_emulator):
+    assert _get(switch_emulator.port, "/outlet?12=ON")[0] == 400
+    assert _get(switch_emulator.port, "/index.htm")[0] == 200
@@ -0,0 +1,257 @@
+from datetime import timedelta
+import numpy as np
+from socket import timeout
+import socket
+import time
+
+import pytest
+
+from Thermotron_Control import ChamberStatus, Interval, ThermotronChamber, ThermotronError, ThermotronOptions, ThermotronSocket, connect_all, is_error_reply, parse_reply, replies_to_array
+import Thermotron_Control
+
+
+def test_options_bits():
+	options = ThermotronOptions(0)
+	options.ptc = True
+	options.purge = True
+	assert options.value == 1 + 16
+	options.ptc = False
+	assert options == 16 and not options.humidity
+
+
+def test_options_register_is_cached(emulator, chamber):
+	assert chamber.get_options_register() == 0
+	served = emulator.commands_served
+	chamber.ptc_on()
+	chamber.humidity_off()
+	# One write for the PTC change; the register was read above and humidity was already off.
+	assert emulator.commands_served == served + 1
+	assert chamber.get_options_register().ptc
+	assert chamber.get_options_register(refresh=True) == emulator.options
+
+
+def test_options_block_writes_once(emulator, chamber):
+	chamber.get_options_register()
+	served = emulator.commands_served
+	with chamber.options() as options:
+		options.ptc = True
+		options.purge = True
+	assert emulator.commands_served == served + 1
+	assert chamber.get_options_register(refresh=True) == emulator.options
+
+
+def test_options_block_that_raises_writes_nothing(emulator, chamber):
+	chamber.get_options_register()
+	served = emulator.commands_served
+	try:
+		with chamber.options() as options:
+			options.ptc = True
+			raise RuntimeError
+	except RuntimeError:
+		pass
+	assert emulator.commands_served == served
+	assert emulator.options == 0
+
+
+def test_failed_options_write_invalidates_the_cache(emulator, chamber):
+	chamber.get_options_register()
+	emulator.inject("garble")
+	chamber.get_set_options(3)
+	assert chamber._options_cache is None
+
+
+def test_socket_transport_sets_nodelay(chamber):
+	assert isinstance(chamber.tn, ThermotronSocket)
+	assert chamber.tn.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+
+
+def test_socket_reads_replies_in_pieces(emulator):
+	transport = ThermotronSocket("127.0.0.1", emulator.port, buffer_size=8)
+	transport.write(b"IDEN?\rVRSN?\r")
+	assert transport.read_until(b"\r\n", 1) == (emulator.iden + "\r\n").encode("ascii")
+	assert transport.read_until(b"\r\n", 1) == (emulator.version + "\r\n").encode("ascii")
+	transport.close()
+
+
+def test_socket_times_out_on_a_missing_reply(emulator):
+	transport = ThermotronSocket("127.0.0.1", emulator.port)
+	emulator.inject("drop")
+	transport.write(b"IDEN?\r")
+	assert not transport.read_until(b"\r\n", 0.1).endswith(b"\r\n")
+	transport.close()
+
+
+def test_telnetlib_transport_still_works(emulator):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, use_telnetlib=True)
+	assert not isinstance(chamber.tn, ThermotronSocket)
+	assert chamber.get_iden() == emulator.iden
+	chamber.tn.close()
+
+
+def test_lazy_connect_waits_for_the_first_command(emulator):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, lazy_connect=True)
+	assert emulator.connections == 0
+	assert chamber.get_iden() == emulator.iden
+	assert emulator.connections == 1
+	chamber.close()
+
+
+def test_offline_chamber_backs_off(emulator):
+	port = emulator.port
+	emulator.stop()
+	chamber = ThermotronChamber("127.0.0.1", portNumber=port, lazy_connect=True,
+		reconnect_backoff=60)
+	with pytest.raises(ConnectionError):
+		chamber.get_iden()
+	assert chamber.health == "offline"
+	# Within the backoff the chamber isn't tried again.
+	with pytest.raises(ConnectionError):
+		chamber.get_iden()
+	assert chamber._failures == 1
+
+
+def test_dropped_connection_is_reopened(emulator, chamber):
+	emulator.inject("disconnect")
+	assert chamber.get_iden() == emulator.iden
+	assert emulator.connections == 2
+
+
+def test_connect_all(emulator):
+	chambers = [ThermotronChamber("127.0.0.1", portNumber=emulator.port, lazy_connect=True)
+		for _ in range(4)]
+	health = connect_all(chambers)
+	assert all(chamber.tn is not None for chamber in chambers)
+	assert [chamber.get_iden() for chamber in chambers] == [emulator.iden] * 4
+	assert emulator.connections == 4
+	assert len(health) == 1
+	for chamber in chambers:
+		chamber.close()
+
+
+def test_snapshot_decodes_the_status(emulator, chamber):
+	emulator.respond("RUNM")
+	emulator.alarms[3] = 1
+	emulator.respond("OPTN017")
+	status = chamber.snapshot()
+	assert status.running and status.stop_reason == "Running"
+	assert status.configured_channels == (1, 2, 3)
+	assert status.on_channels == (1, 2, 3)
+	assert status.alarm_ports == (3,) and status.alarm
+	assert status.options.ptc and status.options.purge
+	assert status.parameter_group == 1
+	assert status.latency >= 0
+	# The options register read refreshed the cache.
+	served = emulator.commands_served
+	assert chamber.get_options_register() == 17
+	assert emulator.commands_served == served
+
+
+def test_status_from_replies():
+	status = ChamberStatus("chamber1", ["0", "2"] + ["0"] * 8 + ["0", "1"])
+	assert not status.running and not status.alarm
+	assert status.stop_reason == "Stop key pressed"
+
+
+def test_parse_reply():
+	assert parse_reply("PVAR1?", "25.5") == 25.5
+	assert parse_reply("SCOD?\r", "3") == 3
+	assert parse_reply("TLFT?", "01:02:03") == timedelta(hours=1, minutes=2, seconds=3)
+	assert parse_reply("IDEN?", "8800") == "8800"
+	interval = parse_reply("INTV1?", "1,85,,0,0,2,,,,01:00:00,1,0,0,3,0,0,0")
+	assert isinstance(interval, Interval)
+	assert interval.fv1 == 85.0 and interval.fv2 is None
+	with pytest.raises(ThermotronError):
+		parse_reply("PVAR1?", "ERR")
+	with pytest.raises(ThermotronError):
+		parse_reply("PVAR1?", "#@!")
+
+
+def test_replies_to_array():
+	assert list(replies_to_array(["1.5", "2", "-3"])) == [1.5, 2.0, -3.0]
+	with pytest.raises(ThermotronError):
+		replies_to_array(["1.5", "ERR"])
+	values = replies_to_array(["1.5", "ERR"], errors="nan")
+	assert values[0] == 1.5 and np.isnan(values[1])
+
+
+def test_typed_getters(emulator):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, typed=True)
+	chamber.get_set_setpoint(1, 40)
+	assert chamber.get_set_setpoint(1) == 40.0
+	assert chamber.get_process_variables([1, 2]) == {1: 25.0, 2: 25.0}
+	assert chamber.get_stop_status() == 0
+	assert chamber.get_iden() == emulator.iden
+	with pytest.raises(ThermotronError):
+		chamber.get_set_programming_interval(5)
+	chamber.close()
+
+
+def test_query_array(emulator, chamber):
+	values = chamber.query_array(["PVAR{}?".format(channel) for channel in range(1,9)])
+	assert values.dtype == float and list(values) == [25.0] * 8
+
+
+@pytest.mark.parametrize("fault", ["drop", "stall"])
+def test_recovers_after_a_lost_reply(emulator, chamber, fault):
+	chamber.get_set_setpoint(1, 40)
+	emulator.inject(fault)
+	with pytest.raises(timeout):
+		chamber.get_process_variable(1)
+	# The late or missing reply must not be taken as the answer to later commands.
+	assert chamber.batch(["SETP1?", "IDEN?", "VRSN?"]) == ["40.0", emulator.iden, emulator.version]
+	time.sleep(emulator.stall_time)
+	assert chamber.batch(["SETP1?", "IDEN?", "VRSN?"]) == ["40.0", emulator.iden, emulator.version]
+
+
+def test_error_replies():
+	assert is_error_reply("PVAR1?", "ERR") and is_error_reply("HOLD", "ERR")
+	assert is_error_reply("SETP1,40\r", "7")
+	assert not is_error_reply("SETP1,40\r", "0")
+	assert not is_error_reply("PVAR1?", "7")
+
+
+def test_typed_operations(emulator):
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, typed=True)
+	assert chamber.set_manual_run() is None
+	with pytest.raises(ThermotronError):
+		parse_reply("RUNM", "3")
+	assert chamber.get_set_options() == 0
+	assert chamber.get_set_options(1) is None
+	# Any reply but 0 to an operation command is an error code.
+	emulator.inject("garble")
+	with pytest.raises(ThermotronError):
+		chamber.get_set_options(3)
+	assert chamber._options_cache is None
+	chamber.close()
+
+
+def test_typed_aux_groups(emulator):
+	assert not is_error_reply("AUXE1", "5") and is_error_reply("AUXE1,5", "5")
+	chamber = ThermotronChamber("127.0.0.1", portNumber=emulator.port, typed=True)
+	assert chamber.get_set_aux(1) == 0
+	assert chamber.get_set_aux(1, 5) is None
+	assert chamber.get_set_aux(1) == 5
+	chamber.close()
+
+
+def test_status_names_the_failed_command():
+	with pytest.raises(ThermotronError) as error:
+		ChamberStatus("chamber1", ["0", "ERR"] + ["0"] * 8 + ["0", "1"])
+	assert error.value.command == "SCOD?"
+
+
+def test_use_telnetlib_without_telnetlib(monkeypatch):
+	monkeypatch.setattr(Thermotron_Control, "telnetlib", None)
+	with pytest.raises(ValueError):
+		ThermotronChamber("127.0.0.1", use_telnetlib=True, lazy_connect=True)
+
+
+def test_multi_channel_reads(emulator, chamber):
+	chamber.batch(["SETP1,40", "SETP2,60", "DEVN3,2"])
+	emulator.channels[1].pv = 30.5
+	served = emulator.commands_served
+	assert chamber.get_process_variables([2, 1, 49]) == {2: "25.0", 1: "30.5", 49: None}
+	assert emulator.commands_served == served + 2
+	assert chamber.get_setpoints([1, 2]) == {1: "40.0", 2: "60.0"}
+	assert chamber.get_deviations()[3] == "2.0"
+	assert sorted(chamber.get_throttles()) == list(range(1, 9))
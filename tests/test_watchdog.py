@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from Thermotron_Watchdog import ThermotronWatchdog
+
+
+def wait_for(condition, timeout=5):
+	end = time.time() + timeout
+	while not condition():
+		assert time.time() < end, "timed out"
+		time.sleep(0.01)
+
+
+def test_alarm_holds_the_chamber(emulator):
+	emulator.respond("RUNM")
+	called = threading.Event()
+	watchdog = ThermotronWatchdog(["127.0.0.1"], interval=0.05, portNumber=emulator.port)
+	watchdog.add_action("hold")
+	watchdog.add_action(lambda event: called.set(), label="power off")
+	with watchdog:
+		wait_for(lambda: watchdog.polls > 0)
+		emulator.alarms[2] = 1
+		wait_for(lambda: len(watchdog.reactions) == 2)
+	assert emulator.hold
+	assert called.is_set()
+	event = watchdog.events[0]
+	assert event.kind == "alarm" and event.reason == "Deviation alarm on port 2"
+	report = watchdog.report()
+	assert report["events"] == 1 and report["failed_reactions"] == 0
+	assert set(report["reactions"]) == set(["hold", "power off"])
+
+
+def test_trip_is_raised_once(emulator):
+	emulator.stop_code = 10
+	events = []
+	watchdog = ThermotronWatchdog(["127.0.0.1"], interval=0.02, portNumber=emulator.port)
+	watchdog.add_callback(events.append)
+	with watchdog:
+		wait_for(lambda: watchdog.polls >= 5)
+	assert [(event.kind, event.detail) for event in events] == [("trip", 10)]
+
+
+def test_rejected_action_is_a_failed_reaction(emulator):
+	# HOLD is refused with ERR when the chamber isn't running.
+	emulator.stop_code = 10
+	watchdog = ThermotronWatchdog(["127.0.0.1"], interval=0.05, portNumber=emulator.port)
+	watchdog.add_action("hold", kinds=("trip",))
+	with watchdog:
+		wait_for(lambda: watchdog.reactions)
+	reaction = watchdog.reactions[0]
+	assert reaction.result == "ERR" and reaction.error.command == "HOLD"
+	assert watchdog.report()["failed_reactions"] == 1
+
+
+def test_actions_can_be_limited(emulator):
+	watchdog = ThermotronWatchdog(["127.0.0.1"], portNumber=emulator.port)
+	with pytest.raises(ValueError):
+		watchdog.add_action("reboot")
+	watchdog.add_action("stop", chambers=["other"], kinds=("trip",))
+	emulator.stop_code = 7
+	with watchdog:
+		wait_for(lambda: watchdog.events)
+		time.sleep(0.1)
+	assert watchdog.reactions == []
+
+
+def test_offline_chamber_is_reported(emulator):
+	port = emulator.port
+	emulator.stop()
+	errors = []
+	watchdog = ThermotronWatchdog(["127.0.0.1"], interval=0.05, portNumber=port, timeout=0.2,
+		on_error=lambda chamber, error: errors.append(error))
+	with watchdog:
+		wait_for(lambda: errors)
+	assert watchdog.errors >= 1 and watchdog.polls == 0